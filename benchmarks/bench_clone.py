@@ -0,0 +1,85 @@
+"""Benchmark of the copies made by MultiplyByDefinition: deepcopy vs Entry.clone"""
+
+import copy
+
+import entries as en
+import expanders as ex
+import operations as op
+import common_bench as cb
+
+
+class DeepCopyMultiplyByDefinition(ex.MultiplyByDefinition):
+    """Former implementation of MultiplyByDefinition, based on deepcopy"""
+
+    def create_entries(
+        self, design: en.Entry, parent: en.Entry, context: ex.ExpansionContext
+    ) -> list[en.Entry]:
+        ret: list[en.Entry] = []
+        definition = op.find_entry_by_type_and_id(
+            design, en.Definition, self.definition_id
+        )
+
+        for child_definition in definition.children:
+            ret.append(copy.deepcopy(parent))
+            last = ret[-1]
+            last.id += "-" + (child_definition.get_id() or "NONE")
+            if last.get_text():
+                last.text += f" ({child_definition.get_id()})"
+            last.children = copy.deepcopy(self.get_children())
+
+        return ret
+
+
+def generate_definition(id1: str, nb_children: int) -> en.Definition:
+    """Generate a definition with children"""
+    return en.Definition(
+        id1,
+        "A definition",
+        [en.Definition(f"{id1}-{i}", "", []) for i in range(nb_children)],
+    )
+
+
+def generate_design(
+    multiply_class: type[ex.MultiplyByDefinition], nb_items: int, nb_nested: int
+) -> en.Design:
+    """Generate a design with a specification multiplied by two nested definitions"""
+    inner = multiply_class("", "", "definition-inner")
+    outer = multiply_class("", "", "definition-outer")
+    outer.children = [
+        en.Specification(f"spec-detail-{i}", f"Detail {i} of <spec-display>", [])
+        for i in range(10)
+    ] + [inner]
+    return en.Design(
+        "design-benchmark",
+        "A synthetic design",
+        [
+            generate_definition("definition-outer", nb_items),
+            generate_definition("definition-inner", nb_nested),
+            en.Specification("spec-display", "Display the item", [outer]),
+        ],
+    )
+
+
+def expand(multiply_class: type[ex.MultiplyByDefinition]) -> None:
+    """Expand a generated design"""
+    design = generate_design(multiply_class, 100, 10)
+    design.expand(design, None)
+
+
+def main() -> None:
+    """Main function of the benchmark"""
+    statement = cb.generate_design(5, 100)
+    cb.print_comparison(
+        "copy of a design",
+        cb.measure(lambda: copy.deepcopy(statement)),
+        cb.measure(statement.clone),
+    )
+    cb.print_comparison(
+        "nested multiplications (100 x 10)",
+        cb.measure(lambda: expand(DeepCopyMultiplyByDefinition)),
+        cb.measure(lambda: expand(ex.MultiplyByDefinition)),
+    )
+
+
+if __name__ == "__main__":
+    main()
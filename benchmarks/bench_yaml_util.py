@@ -0,0 +1,44 @@
+"""Benchmark of YAML loading and dumping: pure Python vs libyaml"""
+
+import sys
+from pathlib import Path
+
+import yaml
+import misc_util as mu
+import yaml_util as yu
+import common_bench as cb
+
+SPECS_PATH = Path(__file__).parent.parent / "specs"
+
+
+def compare(title: str, yaml_str: str) -> None:
+    """Compare the loading and dumping of a YAML document with both backends"""
+    design = yu.load_yaml(yaml_str)
+    print(f"{title} ({len(yaml_str) // 1024} KB)")
+    cb.print_comparison(
+        "  load",
+        cb.measure(lambda: yu.load_yaml(yaml_str, yu.PureLoader)),
+        cb.measure(lambda: yu.load_yaml(yaml_str, yu.EntryLoader)),
+    )
+    cb.print_comparison(
+        "  dump",
+        cb.measure(lambda: yu.dump_yaml(design, dumper=yu.PureDumper)),
+        cb.measure(lambda: yu.dump_yaml(design, dumper=yu.EntryDumper)),
+    )
+
+
+def main() -> None:
+    """Main function of the benchmark"""
+    if not yaml.__with_libyaml__:
+        print("libyaml is not available: nothing to compare")
+        sys.exit(1)
+
+    mu.import_source(SPECS_PATH / "setup.py")
+    with open(SPECS_PATH / "requisite.yaml", encoding="utf-8") as fin:
+        compare("specs/requisite.yaml", fin.read())
+
+    compare("synthetic design", yu.dump_yaml(cb.generate_design(20, 100)))
+
+
+if __name__ == "__main__":
+    main()
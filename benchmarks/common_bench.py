@@ -0,0 +1,51 @@
+"""Code common to the benchmarks"""
+
+import time
+from typing import Any, Callable
+
+import entries as en
+
+
+def generate_design(nb_sections: int, nb_statements: int) -> en.Design:
+    """Generate a large synthetic design: sections of requirements and specifications"""
+    sections: list[en.Entry] = []
+    for i in range(nb_sections):
+        requirements: list[en.Entry] = []
+        for j in range(nb_statements):
+            specifications: list[en.Entry] = [
+                en.Specification(
+                    f"spec-{i}-{j}-{k}",
+                    f"Specification {k} of <req-{i}-{j}>, see <definition-{i}>",
+                    [],
+                )
+                for k in range(3)
+            ]
+            requirements.append(
+                en.Requirement(f"req-{i}-{j}", f"Requirement {j}", specifications)
+            )
+        sections.append(
+            en.Section(
+                f"section-{i}",
+                f"Section {i}",
+                [en.Definition(f"definition-{i}", "A definition", [])] + requirements,
+            )
+        )
+    return en.Design("design-benchmark", "A synthetic design", sections)
+
+
+def measure(function: Callable[[], Any], repeat: int = 3) -> float:
+    """Return the best execution time of a function, in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def print_comparison(title: str, reference: float, optimized: float) -> None:
+    """Print the timings of two implementations"""
+    print(
+        f"{title}: {reference * 1000:.1f} ms -> {optimized * 1000:.1f} ms"
+        f" (x{reference / optimized:.1f})"
+    )
@@ -3,6 +3,7 @@
 """ Run a test suite """
 
 import os
+import shutil
 import sys
 import argparse
 from datetime import datetime
@@ -10,18 +11,35 @@ from pathlib import Path
 from typing import Sequence
 
 import yaml_util as yu
+import cache as ca
 import entries as en
+import expanders as ex
 import misc_util as mu
+import operations as op
 import testing as te
 import rules as ru
 import report as rp
 import verification as ve
 
+# directory of the release for the files of the long test outputs
+OUTPUT_DIRECTORY = "outputs"
+
 if sys.version_info[0] < 3:
     print("Error: This script requires Python 3")
     sys.exit(1)
 
 
+def parse_shard(value: str) -> tuple[int, int]:
+    """Parse a shard given as I/N"""
+    try:
+        shard_index, shard_count = (int(part) for part in value.split("/"))
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(f"Invalid shard {value}") from error
+    if not 1 <= shard_index <= shard_count:
+        raise argparse.ArgumentTypeError(f"Invalid shard {value}: I must be in 1..N")
+    return shard_index, shard_count
+
+
 def arguments_parser() -> argparse.Namespace:
     """Define the parser and parse arguments"""
 
@@ -65,6 +83,69 @@ def arguments_parser() -> argparse.Namespace:
         type=Path,
         help="Write the design as a report and exit.",
     )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="The number of tests run concurrently, unless set by the test list.",
+    )
+
+    parser.add_argument(
+        "-J",
+        "--total-jobs",
+        type=int,
+        default=0,
+        help="Run the test lists at the same time, with at most this number of "
+        "tests run concurrently by all of them. 0 to run them one after the other.",
+    )
+
+    parser.add_argument(
+        "--rerun-failed",
+        type=Path,
+        help="An existing release directory: run again its failed tests and update "
+        "its results and report.",
+    )
+
+    parser.add_argument(
+        "--previous-release",
+        type=Path,
+        help="A previous release directory: the tests whose inputs did not change "
+        "since then are not run again, their results are reused.",
+    )
+
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        help="Run only the shard I/N (I from 1 to N) of the tests of each test list. "
+        "The shards are balanced by the durations of --previous-release if given: "
+        "all shards must use the same previous release.",
+    )
+
+    parser.add_argument(
+        "--merge-shards",
+        type=Path,
+        nargs="+",
+        metavar="SHARD_RELEASE",
+        help="Create the release from the test executions of the releases of the "
+        "shards instead of running the tests.",
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=Path(".requisite-cache"),
+        help="The directory where the expanded design and the results of the "
+        "expanders (e.g. doxygen) are cached.",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always read and expand the design and run the expanders, do not use "
+        "the cache.",
+    )
     return parser.parse_args()
 
 
@@ -83,9 +164,13 @@ def generate_release_dir_path(path: Path) -> Path:
 
 
 def create_release(
-    release_directory: Path, design: en.Design, verifier: ve.Verifier
+    release_directory: Path,
+    design: en.Design,
+    verifier: ve.Verifier,
+    args: argparse.Namespace,
 ) -> None:
-    """Create a release in a directory"""
+    """Create a release in a directory: run the tests (except the unchanged tests
+    of the previous release), or merge the test executions of shards"""
 
     print(f"Create a release in {release_directory.as_posix()}")
 
@@ -99,26 +184,124 @@ def create_release(
     # TODO: Add generation/expansion date to design
     # TODO: Add host information to test list
 
-    executions = te.run_all_test_lists(design)
-    for execution in executions:
-        yu.write_entry(
-            release_directory / (execution.test_list_id + ".yaml"), execution
+    report_path = release_directory / "report.html"
+    if args.merge_shards:
+        print(f"Merge the test executions of {len(args.merge_shards)} shards")
+        executions = te.merge_test_list_executions(
+            design,
+            [
+                te.read_test_list_executions(shard_directory)
+                for shard_directory in args.merge_shards
+            ],
+        )
+        for execution in executions:
+            yu.write_entry(
+                release_directory / (execution.test_list_id + ".yaml"), execution
+            )
+        # the references to the files of the outputs stay valid
+        for shard_directory in args.merge_shards:
+            if (shard_directory / OUTPUT_DIRECTORY).is_dir():
+                shutil.copytree(
+                    shard_directory / OUTPUT_DIRECTORY,
+                    release_directory / OUTPUT_DIRECTORY,
+                    dirs_exist_ok=True,
+                )
+        slowest_executions = te.get_slowest_executions(executions)
+    else:
+        previous_executions = (
+            te.read_release_executions(args.previous_release)
+            if args.previous_release is not None
+            else None
         )
 
+        def write_progress(writer: te.ReleaseWriter) -> None:
+            rp.write_html_report(
+                report_path,
+                design,
+                verifier,
+                writer.get_slowest_executions(),
+                writer.get_progress(),
+            )
+
+        # each test execution is appended to its file as soon as it is done
+        writer = te.ReleaseWriter(release_directory, write_progress)
+        te.run_all_test_lists(
+            design,
+            args.jobs,
+            previous_executions,
+            args.total_jobs,
+            writer,
+            args.shard,
+            release_directory / OUTPUT_DIRECTORY,
+        )
+        slowest_executions = writer.get_slowest_executions()
+
+    te.print_slowest_executions(slowest_executions)
+
     print("Write report")
-    rp.write_html_report(release_directory / "report.html", design, verifier)
+    rp.write_html_report(report_path, design, verifier, slowest_executions)
+
+
+def rerun_failed_tests(
+    release_directory: Path,
+    design: en.Design,
+    index: op.DesignIndex,
+    verifier: ve.Verifier,
+    max_workers: int = 1,
+) -> None:
+    """Run again the failed tests of a release and update it in place"""
+
+    print(f"Run again the failed tests of {release_directory.as_posix()}")
+    executions = te.read_test_list_executions(release_directory)
+    for execution in executions:
+        if te.rerun_failed_tests(
+            execution, index, max_workers, release_directory / OUTPUT_DIRECTORY
+        ):
+            yu.write_entry_atomically(
+                release_directory / (execution.test_list_id + ".yaml"), execution
+            )
+
+    slowest_executions = te.get_slowest_executions(executions)
+    te.print_slowest_executions(slowest_executions)
+
+    print("Write report")
+    rp.write_html_report(
+        release_directory / "report.html", design, verifier, slowest_executions
+    )
+
+
+def load_design(args: argparse.Namespace) -> en.Design:
+    """Read and expand the design, or load it from the cache if no input changed"""
+
+    design_cache = (
+        None
+        if args.no_cache
+        else ca.DesignCache(args.cache_dir, args.input, args.setup)
+    )
+    if design_cache is not None:
+        cached_design = design_cache.load()
+        if cached_design is not None:
+            print(f"Use the cached design from {args.cache_dir.as_posix()}")
+            return cached_design
+
+    design = yu.read_object(en.Design, args.input)
+    exit_if_errors(ru.check_all_rules(design))
+    context = ex.ExpansionContext(cache_dir=None if args.no_cache else args.cache_dir)
+    design.expand(design, None, context)
+    if design_cache is not None:
+        design_cache.store(design, context.inputs)
+    return design
 
 
 def main() -> None:
     """Main routine of requisite"""
     args = arguments_parser()
     mu.import_source(args.setup)
-    design = yu.read_object(en.Design, args.input)
-    exit_if_errors(ru.check_all_rules(design))
-    design.expand(design, None)
-    exit_if_errors(ru.check_all_rules(design))
+    design = load_design(args)
+    index = op.DesignIndex(design)
+    exit_if_errors(ru.check_all_rules(design, index))
 
-    verifier = ve.Verifier(design)
+    verifier = ve.Verifier(design, index)
     unverified = verifier.list_unverified(design)
 
     if unverified:
@@ -139,12 +322,18 @@ def main() -> None:
         rp.write_html_report(args.report, design, verifier)
         sys.exit(0)
 
+    if args.rerun_failed:
+        rerun_failed_tests(args.rerun_failed, design, index, verifier, args.jobs)
+        sys.exit(0)
+
     if args.release_path:
-        create_release(args.release_path, design, verifier)
+        create_release(args.release_path, design, verifier, args)
         sys.exit(0)
 
     if args.releases_path:
-        create_release(generate_release_dir_path(args.releases_path), design, verifier)
+        create_release(
+            generate_release_dir_path(args.releases_path), design, verifier, args
+        )
         sys.exit(0)
 
     print("No action was selected. Exiting.")
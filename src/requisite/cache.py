@@ -0,0 +1,252 @@
+"""On-disk cache of the expanded design, keyed by the hashes of all its inputs"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any, Optional, Sequence
+
+import entries as en
+
+CACHE_VERSION = 1
+SOURCE_EXTENSIONS = ["py"]
+
+
+def hash_file(path: Path) -> str:
+    """Return the hash of the content of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fin:
+        for block in iter(lambda: fin.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def list_files(path: Path, extensions: Sequence[str]) -> list[Path]:
+    """Return the files of a directory with one of the extensions (all files if no
+    extension is given), sorted"""
+    return sorted(
+        file_path
+        for file_path in path.rglob("*")
+        if file_path.is_file()
+        and "__pycache__" not in file_path.parts
+        and (not extensions or file_path.suffix[1:] in extensions)
+    )
+
+
+def hash_path(path: Path, extensions: Sequence[str]) -> str:
+    """Return the hash of a file, or of all the files of a directory (names and
+    contents) with one of the extensions (all files if no extension is given)"""
+    if path.is_file():
+        return hash_file(path)
+    if not path.is_dir():
+        return "missing"
+
+    digest = hashlib.sha256()
+    for file_path in list_files(path, extensions):
+        digest.update(file_path.relative_to(path).as_posix().encode("utf-8"))
+        digest.update(hash_file(file_path).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def hash_path_stats(path: Path, extensions: Sequence[str]) -> str:
+    """Same as hash_path with the sizes and modification dates of the files instead
+    of their contents: much faster, but also changes when a file is only touched"""
+    if not path.exists():
+        return "missing"
+
+    digest = hashlib.sha256()
+    for file_path in [path] if path.is_file() else list_files(path, extensions):
+        stat = file_path.stat()
+        digest.update(
+            f"{file_path.relative_to(path).as_posix()}"
+            f" {stat.st_size} {stat.st_mtime_ns}\n".encode("utf-8")
+        )
+    return digest.hexdigest()
+
+
+def write_atomically(path: Path, data: bytes) -> None:
+    """Write a file through a temporary file, so readers never see a partial file"""
+    file_descriptor, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name)
+    try:
+        with os.fdopen(file_descriptor, "wb") as fout:
+            fout.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def is_manifest_valid(manifest: dict[str, Any]) -> bool:
+    """Check that all inputs listed in the manifest are unchanged"""
+    if manifest.get("version") != CACHE_VERSION:
+        return False
+    return all(
+        hash_path(Path(input_info["path"]), input_info["extensions"])
+        == input_info["hash"]
+        for input_info in manifest.get("inputs", [])
+    )
+
+
+class DesignCache:
+    """Store and retrieve the expanded design. The cache is valid as long as the
+    design file, the setup file, the inputs of the expanders (including the included
+    files) and the sources of requisite are unchanged"""
+
+    def __init__(self, cache_dir: Path, design_path: Path, setup_path: Path):
+        self.cache_dir = cache_dir
+        self.design_path = design_path
+        self.setup_path = setup_path
+        key = hashlib.sha256(
+            (
+                design_path.resolve().as_posix()
+                + "\n"
+                + setup_path.resolve().as_posix()
+            ).encode("utf-8")
+        ).hexdigest()[:16]
+        self.manifest_path = cache_dir / f"design-{key}.json"
+        self.design_cache_path = cache_dir / f"design-{key}.pickle"
+
+    def get_base_inputs(self) -> list[tuple[Path, list[str]]]:
+        """Return the inputs used by every design"""
+        return [
+            (self.design_path, []),
+            (self.setup_path, []),
+            (Path(__file__).parent, SOURCE_EXTENSIONS),
+        ]
+
+    def load(self) -> Optional[en.Design]:
+        """Return the cached design if all inputs are unchanged, else None"""
+        try:
+            with open(self.manifest_path, encoding="utf-8") as fin:
+                manifest = json.load(fin)
+        except (OSError, ValueError):
+            return None
+
+        if not is_manifest_valid(manifest):
+            return None
+
+        try:
+            with open(self.design_cache_path, "rb") as fin:
+                data = fin.read()
+        except OSError:
+            return None
+        # the manifest may belong to another version of the design
+        if hashlib.sha256(data).hexdigest() != manifest.get("design_hash"):
+            return None
+        try:
+            design = pickle.loads(data)
+        except (pickle.UnpicklingError, AttributeError, ImportError, EOFError):
+            return None
+        return design if isinstance(design, en.Design) else None
+
+    def store(
+        self, design: en.Design, expander_inputs: Sequence[tuple[Path, list[str]]]
+    ) -> bool:
+        """Store the design with the hashes of its inputs. Return False if the design
+        cannot be stored"""
+        try:
+            data = pickle.dumps(design, protocol=pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            # very deep designs cannot be pickled: they are simply not cached
+            return False
+
+        inputs: list[dict[str, Any]] = []
+        known: set[tuple[str, tuple[str, ...]]] = set()
+        for path, extensions in list(self.get_base_inputs()) + list(expander_inputs):
+            key = (path.resolve().as_posix(), tuple(extensions))
+            if key not in known:
+                known.add(key)
+                inputs.append(
+                    {
+                        "path": key[0],
+                        "extensions": list(extensions),
+                        "hash": hash_path(path, extensions),
+                    }
+                )
+
+        manifest = {
+            "version": CACHE_VERSION,
+            "inputs": inputs,
+            "design_hash": hashlib.sha256(data).hexdigest(),
+        }
+        os.makedirs(self.cache_dir, exist_ok=True)
+        write_atomically(self.design_cache_path, data)
+        write_atomically(
+            self.manifest_path, json.dumps(manifest, indent=1).encode("utf-8")
+        )
+        return True
+
+
+class TreeCache:
+    """Store and retrieve a value computed from the files of a directory and from
+    parameters, e.g. the functions extracted by doxygen from the sources. The value is
+    valid while the sizes and dates of the files are unchanged, or else their contents
+    """
+
+    def __init__(self, cache_dir: Path, name: str, path: Path, parameters: str):
+        self.cache_dir = cache_dir
+        self.path = path
+        key = hashlib.sha256(
+            (name + "\n" + path.resolve().as_posix()).encode("utf-8")
+        ).hexdigest()[:16]
+        self.manifest_path = cache_dir / f"{name}-{key}.json"
+        self.value_path = cache_dir / f"{name}-{key}.pickle"
+        self.parameters_hash = hashlib.sha256(parameters.encode("utf-8")).hexdigest()
+
+    def load(self) -> Optional[Any]:  # pylint: disable=R0911
+        """Return the cached value if the files and parameters are unchanged, else
+        None"""
+        try:
+            with open(self.manifest_path, encoding="utf-8") as fin:
+                manifest = json.load(fin)
+        except (OSError, ValueError):
+            return None
+        if (
+            manifest.get("version") != CACHE_VERSION
+            or manifest.get("parameters_hash") != self.parameters_hash
+        ):
+            return None
+
+        stats_hash = hash_path_stats(self.path, [])
+        if stats_hash != manifest.get("stats_hash"):
+            # the files may only have been touched, e.g. by a checkout
+            if hash_path(self.path, []) != manifest.get("content_hash"):
+                return None
+
+        try:
+            with open(self.value_path, "rb") as fin:
+                data = fin.read()
+        except OSError:
+            return None
+        if hashlib.sha256(data).hexdigest() != manifest.get("value_hash"):
+            return None
+        try:
+            value = pickle.loads(data)
+        except (pickle.UnpicklingError, AttributeError, ImportError, EOFError):
+            return None
+
+        if stats_hash != manifest["stats_hash"]:
+            # the contents are checked only once after the files are touched
+            manifest["stats_hash"] = stats_hash
+            write_atomically(
+                self.manifest_path, json.dumps(manifest, indent=1).encode("utf-8")
+            )
+        return value
+
+    def store(self, value: Any) -> None:
+        """Store the value with the hashes of the files and parameters"""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        manifest = {
+            "version": CACHE_VERSION,
+            "parameters_hash": self.parameters_hash,
+            "stats_hash": hash_path_stats(self.path, []),
+            "content_hash": hash_path(self.path, []),
+            "value_hash": hashlib.sha256(data).hexdigest(),
+        }
+        os.makedirs(self.cache_dir, exist_ok=True)
+        write_atomically(self.value_path, data)
+        write_atomically(
+            self.manifest_path, json.dumps(manifest, indent=1).encode("utf-8")
+        )
@@ -1,20 +1,47 @@
 """Test engine to run Python unittest tests"""
 
+import contextlib
+import json
 import os
-import subprocess
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, Sequence, Tuple
+from typing import cast, Callable, Dict, Iterator, Optional, Sequence, Tuple
 
 import misc_util as mu
+import cache as ca
 import entries as en
 import testing as te
 
+RUNNER_PATH = Path(__file__).parent / "runner_python_unittest.py"
+
+RUNNER_RESULTS = {
+    "success": te.TestResult.SUCCESS,
+    # as in process mode, where unittest ends with code 0 for a skipped test
+    "skipped": te.TestResult.SUCCESS,
+    "failed": te.TestResult.FAILED,
+    "timeout": te.TestResult.TIMEOUT,
+}
+
+# seconds given to an interpreter to start, on top of the timeouts of its tests
+BATCH_TIMEOUT_MARGIN = 30.0
+
 
 class TestEnginePythonUnitTest(te.TestEngine):
     """Class to run tests in the python unittest framework"""
 
     short_type = "ten_pu"
     yaml_tag = "!TestEnginePythonUnitTest"
+    # "process": one interpreter per test, "batch": the tests are shared between
+    # interpreters, "fork": the interpreters import the tests then fork per test.
+    # In batch mode, the peak memory of a test is the one of its interpreter so far,
+    # previous tests included: an upper bound only
+    mode = "process"
+    # number of interpreters in batch and fork modes, 0 for the number of workers
+    workers = 0
+    # number of tests after which an interpreter is replaced, 0 to never replace it
+    recycle_after = 0
 
     # TODO: tested ?
     def __init__(self, id1: str, text: str, path: Path, modules: Sequence[str]) -> None:
@@ -26,48 +53,286 @@ class TestEnginePythonUnitTest(te.TestEngine):
         """Return the path attribute. Since it is relative we need the design_path as well"""
         return design_path.parent / self.path
 
+    def get_env(self) -> Optional[Dict[str, str]]:
+        """Return the environment of the tests, None to keep the current one"""
+        if not hasattr(self, "modules") or not self.modules:
+            return None
+        env = os.environ.copy()
+        python_path = env["PYTHONPATH"] if "PYTHONPATH" in env else ""
+        env["PYTHONPATH"] = ":".join(self.modules)
+        if python_path:
+            env["PYTHONPATH"] += ":" + python_path
+        return env
+
+    def find_module_file(self, test_id: str, design_path: Path) -> Optional[Path]:
+        """Return the source file of the module of a test (the longest prefix of its
+        id that is a module), None if not found"""
+        parts = test_id.split(".")
+        path = self.get_path(design_path)
+        for i in range(len(parts) - 1, 0, -1):
+            for module_path in (
+                path.joinpath(*parts[: i - 1], parts[i - 1] + ".py"),
+                path.joinpath(*parts[:i], "__init__.py"),
+            ):
+                if module_path.is_file():
+                    return module_path
+        return None
+
+    def get_common_inputs(self, design_path: Path) -> list[str]:
+        # the tests depend on the code of the modules they import
+        return super().get_common_inputs(design_path) + [
+            ca.hash_path(self.get_path(design_path) / module, ["py"])
+            for module in getattr(self, "modules", None) or []
+        ]
+
+    def get_test_inputs(self, test: en.Test, design_path: Path) -> list[str]:
+        module_path = self.find_module_file(test.get_id(), design_path)
+        return super().get_test_inputs(test, design_path) + [
+            ca.hash_file(module_path) if module_path is not None else "missing"
+        ]
+
+    def iter_tests(
+        self,
+        tests: Sequence[en.Test],
+        design_path: Path,
+        max_workers: int = 1,
+        context: Optional[te.RunContext] = None,
+    ) -> Iterator[te.TestExecution]:
+        if self.mode == "process":
+            return super().iter_tests(tests, design_path, max_workers, context)
+        if self.mode not in ("batch", "fork"):
+            raise Exception(f"Unknown mode of {type(self).__name__}: {self.mode}")
+        if not tests:
+            return iter([])
+
+        nb_workers = max(1, min(self.workers or max_workers, len(tests)))
+        batch_size = -(-len(tests) // nb_workers)
+        if self.recycle_after:
+            batch_size = min(batch_size, self.recycle_after)
+        batches = [
+            list(tests[i : i + batch_size]) for i in range(0, len(tests), batch_size)
+        ]
+
+        return self.iter_batches(batches, design_path, nb_workers, context)
+
+    def iter_batches(
+        self,
+        batches: Sequence[list[en.Test]],
+        design_path: Path,
+        nb_workers: int,
+        context: Optional[te.RunContext] = None,
+    ) -> Iterator[te.TestExecution]:
+        """Run batches of tests, each one in a new interpreter, and yield each
+        execution as soon as it and the previous ones are done"""
+        budget = context.budget if context is not None else None
+
+        def run_one_batch(batch: list[en.Test], executions: queue.Queue) -> None:
+            try:
+                # an interpreter takes one slot of the budget
+                with budget or contextlib.nullcontext():
+                    self.run_batch(batch, design_path, context, executions.put)
+            finally:
+                executions.put(None)
+
+        with ThreadPoolExecutor(nb_workers) as executor:
+            all_executions: list[queue.Queue] = [queue.Queue() for _ in batches]
+            futures = [
+                executor.submit(run_one_batch, batch, executions)
+                for batch, executions in zip(batches, all_executions)
+            ]
+            for future, executions in zip(futures, all_executions):
+                yield from iter(executions.get, None)
+                # errors of the batch, if any
+                future.result()
+
+    def run_batch(  # pylint: disable=R0914
+        self,
+        tests: Sequence[en.Test],
+        design_path: Path,
+        context: Optional[te.RunContext] = None,
+        on_execution: Optional[Callable[[te.TestExecution], None]] = None,
+    ) -> list[te.TestExecution]:
+        """Run tests in one interpreter (or its forks). The results are read as the
+        interpreter writes them: the chunks of the outputs of each test go to its
+        captures while it runs, and on_execution is called with the executions in the order of
+        the tests, as soon as they and the previous ones are done"""
+        timestamp = mu.datetime_to_string(datetime.now())
+        test_ids = [test.get_id() for test in tests]
+        if not all(test_ids):
+            raise Exception("Test id must be defined")
+        timeouts = [self.get_timeout(test) for test in tests]
+        command = [mu.get_python_executable().as_posix(), RUNNER_PATH.as_posix()]
+        if self.mode == "fork":
+            command.append("--fork")
+
+        expected_ids = set(test_ids)
+        executions: dict[str, te.TestExecution] = {}
+        captures: dict[str, list[mu.OutputCapture]] = {}
+        other_errors: list[str] = []
+        nb_reported = 0
+
+        def report_executions() -> None:
+            # a test without result blocks the next ones until the interpreter is
+            # done: its error may be written last
+            nonlocal nb_reported
+            while nb_reported < len(test_ids) and test_ids[nb_reported] in executions:
+                if on_execution is not None:
+                    on_execution(executions[test_ids[nb_reported]])
+                nb_reported += 1
+
+        def read_result(line: bytes) -> None:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # the interpreter was stopped while writing
+                return
+            if result["id"] is None:
+                other_errors.append(result["stderr"])
+            elif result["id"] in expected_ids:
+                if result["id"] not in captures:
+                    captures[result["id"]] = self.create_captures(result["id"], context)
+                if "output" in result:
+                    index = ["stdout", "stderr"].index(result["output"])
+                    captures[result["id"]][index].write(result["data"].encode("utf-8"))
+                    return
+                executions[result["id"]] = self.create_execution(
+                    result, context, captures.pop(result["id"])
+                )
+                report_executions()
+
+        results = mu.LineCapture(read_result)
+        process = mu.run_measured(
+            command,
+            self.get_path(design_path),
+            self.get_env(),
+            # the interpreter is killed if a test ignores its timeout
+            (
+                sum(cast(float, timeout) for timeout in timeouts) + BATCH_TIMEOUT_MARGIN
+                if all(timeouts)
+                else None
+            ),
+            json.dumps(
+                [
+                    {"id": test_id, "timeout": timeout}
+                    for test_id, timeout in zip(test_ids, timeouts)
+                ]
+            ).encode("utf-8"),
+            [results, mu.OutputCapture()],
+        )
+        if results.error is not None:
+            raise results.error
+
+        for test_id in test_ids:
+            if test_id not in executions:
+                # the test did not run: class fixture error, crash, timeout, etc.
+                print(f"Test execution of {test_id} did not report any result")
+                execution = te.TestExecution(
+                    test_id,
+                    timestamp,
+                    (
+                        te.TestResult.TIMEOUT
+                        if process.timed_out
+                        else te.TestResult.FAILED
+                    ),
+                    "",
+                    "",
+                )
+                # with the chunks of its outputs written before it stopped, if any
+                test_captures = captures.pop(test_id, None) or self.create_captures(
+                    test_id, context
+                )
+                test_captures[1].write(
+                    ("".join(other_errors) + process.stderr.decode("utf-8")).encode(
+                        "utf-8"
+                    )
+                )
+                for capture in test_captures:
+                    capture.close()
+                execution.set_outputs(test_captures)
+                executions[test_id] = execution
+        report_executions()
+        return [executions[test_id] for test_id in test_ids]
+
+    def create_execution(
+        self,
+        result: dict,
+        context: Optional[te.RunContext] = None,
+        captures: Optional[Sequence[mu.OutputCapture]] = None,
+    ) -> te.TestExecution:
+        """Create the execution of a test from its result written by the runner. The
+        rest of its outputs goes to the captures that hold the previous chunks"""
+        test_id = result["id"]
+        if result["result"] != "success" and result["result"] != "skipped":
+            print(f"Test execution of {test_id} ended with {result['result']}")
+        execution = te.TestExecution(
+            test_id,
+            mu.datetime_to_string(datetime.fromtimestamp(result["date"])),
+            RUNNER_RESULTS[result["result"]],
+            "",
+            "",
+            result["duration"],
+            result["cpu_time"],
+            result["max_rss"],
+        )
+        captures = captures or self.create_captures(test_id, context)
+        for capture, output in zip(captures, [result["stdout"], result["stderr"]]):
+            capture.write(output.encode("utf-8"))
+            capture.close()
+        execution.set_outputs(captures)
+        return execution
+
+    def execute_test(
+        self, test: en.Test, design_path: Path, context: Optional[te.RunContext] = None
+    ) -> te.TestExecution:
+        timestamp = mu.datetime_to_string(datetime.now())
+        # the outputs are streamed to the captures while the test runs
+        captures = self.create_captures(test.get_id(), context)
+        result, process = self.run_process(test, design_path, captures)
+        execution = te.TestExecution(
+            test.get_id(),
+            timestamp,
+            result,
+            "",
+            "",
+            process.wall_time,
+            process.cpu_time,
+            process.max_rss,
+        )
+        execution.set_outputs(captures)
+        return execution
+
     def run_test(
         self, test: en.Test, design_path: Path
     ) -> Tuple[te.TestResult, str, str]:
         """Run a test"""
+        result, process = self.run_process(test, design_path)
+        return result, process.stdout.decode("utf-8"), process.stderr.decode("utf-8")
 
-        def new_env() -> Dict[str, str]:
-            env = os.environ.copy()
-            python_path = env["PYTHONPATH"] if "PYTHONPATH" in env else ""
-            env["PYTHONPATH"] = ":".join(self.modules)
-            if python_path:
-                env["PYTHONPATH"] += ":" + python_path
-            return env
+    def run_process(
+        self,
+        test: en.Test,
+        design_path: Path,
+        captures: Optional[Sequence[mu.OutputCapture]] = None,
+    ) -> Tuple[te.TestResult, mu.MeasuredProcess]:
+        """Run a test in its own interpreter, killed after the timeout. The outputs
+        are streamed to the captures if given"""
 
         exe = mu.get_python_executable()
         test_id = test.get_id()
         if not test_id:
             raise Exception("Test id must be defined")
-        command = f"{exe} -m unittest {test.id}"
-
-        if hasattr(self, "modules") and self.modules:
-            completed_process = subprocess.run(
-                command,
-                capture_output=True,
-                check=False,
-                cwd=self.get_path(design_path),
-                env=new_env(),
-            )
-        else:
-            completed_process = subprocess.run(
-                command,
-                capture_output=True,
-                check=False,
-                cwd=self.get_path(design_path),
-            )
-        if completed_process.returncode != 0:
-            print(
-                f"Test execution of {test_id} ended with code {completed_process.returncode}"
-            )
+        command = [exe.as_posix(), "-m", "unittest", test_id]
+
+        timeout = self.get_timeout(test)
+        process = mu.run_measured(
+            command, self.get_path(design_path), self.get_env(), timeout, None, captures
+        )
+        if process.timed_out:
+            print(f"Test execution of {test_id} was stopped after {timeout} s")
+            return te.TestResult.TIMEOUT, process
+        if process.returncode != 0:
+            print(f"Test execution of {test_id} ended with code {process.returncode}")
         return (
-            te.TestResult.SUCCESS
-            if completed_process.returncode == 0
-            else te.TestResult.FAILED,
-            completed_process.stdout.decode("utf-8"),
-            completed_process.stderr.decode("utf-8"),
+            te.TestResult.SUCCESS if process.returncode == 0 else te.TestResult.FAILED,
+            process,
         )
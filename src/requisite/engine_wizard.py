@@ -11,6 +11,8 @@ class TestEngineWizard(te.TestEngine):
 
     short_type = "ten_w"
     yaml_tag = "!TestEngineWizard"
+    # the tests are run by a human, one after the other
+    supports_parallel = False
 
     def run_test(
         self, test: en.Test, design_path: Path
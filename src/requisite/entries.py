@@ -4,22 +4,30 @@
 # https://stackoverflow.com/questions/36286894/name-not-defined-in-type-annotation
 from __future__ import annotations
 from pathlib import Path
-from typing import Any, Optional, TextIO
+from typing import Any, Iterator, Optional, TextIO, TYPE_CHECKING
 from enum import Enum
 
 import re
 import sys
 import yaml
 
+if TYPE_CHECKING:
+    from expanders import ExpansionContext
+
 
 LINK_EXPRESSION = re.compile("<([a-zA-Z_][a-zA-Z0-9_-]*)>")
 
+# the entries can be read by the pure Python loader and by the (faster) libyaml loader
+YAML_LOADERS: list[Any] = [yaml.SafeLoader]
+if yaml.__with_libyaml__:
+    YAML_LOADERS.append(yaml.CSafeLoader)
+
 
 class Entry(yaml.YAMLObject):
     """Any entry: this is the parent class for all other. Virtual."""
 
     short_type = "en"
-    yaml_loader = yaml.SafeLoader
+    yaml_loader = YAML_LOADERS
     yaml_tag = "!Entry"
 
     def __init__(self, id1: str, text: str, children: list[Entry]):
@@ -49,32 +57,71 @@ class Entry(yaml.YAMLObject):
         assert self.file_path
         return Path(self.file_path)
 
-    def expand(self, design: Entry, _parent: Optional[Entry]) -> list[Entry]:
-        """Processing: Nothing to do by default but call on children"""
-        try:
-            if self.get_children():
-                old_children = self.children
-                self.children = []
-
-                for child in old_children:
-                    self.children += child.expand(design, self)
-            return [self]
-
-        except Exception as exc:
-            print(f"Exception while expanding {self.get_id()}:", exc)
-            raise
+    def expand(
+        self,
+        design: Entry,
+        parent: Optional[Entry],
+        context: Optional[ExpansionContext] = None,
+    ) -> list[Entry]:
+        """Processing: replace this entry and expand all its children"""
+        if context is None:
+            # imported here since the expanders depend on this module
+            from expanders import ExpansionContext  # pylint: disable=C0415
+
+            context = ExpansionContext()
+        if parent is None and self is design:
+            context.preload_includes(design)
+        results = self.expand_entry(design, parent, context)
+        for result in results:
+            expand_children(result, design, context)
+        return results
+
+    def expand_entry(  # pylint: disable=W0613
+        self, design: Entry, parent: Optional[Entry], context: ExpansionContext
+    ) -> list[Entry]:
+        """Return the entries that replace this one in its parent: itself by default"""
+        return [self]
+
+    def clone(self, with_children: bool = True) -> Entry:
+        """Fast copy of the entry and of its children. Only the tree is copied: the
+        other attribute values are shared since they are replaced, never modified"""
+
+        def copy_entry(entry: Entry) -> Entry:
+            new_entry = object.__new__(type(entry))
+            new_entry.__dict__.update(entry.__dict__)
+            return new_entry
+
+        root = copy_entry(self)
+        if not with_children:
+            if hasattr(root, "children"):
+                root.children = []
+            return root
+
+        stack = [root]
+        while stack:
+            entry = stack.pop()
+            # always a new list: the children lists are modified in place
+            if isinstance(getattr(entry, "children", None), list):
+                entry.children = [copy_entry(child) for child in entry.children]
+                stack += entry.children
+        return root
 
     def print(self, output_stream: TextIO = sys.stdout, indent: int = 0) -> None:
         """Print to stdout (for debug)"""
-        text_str = f", text: {self.get_text()}"
-        children_str = f", (nb_children: {len(self.get_children())})"
-        print(
-            f"{indent * 2 * ' '}id: {self.get_id()}" + text_str + children_str,
-            file=output_stream,
-        )
-
-        for child in self.get_children():
-            child.print(output_stream, indent + 1)
+        stack = [(self, indent)]
+        while stack:
+            entry, entry_indent = stack.pop()
+            text_str = f", text: {entry.get_text()}"
+            children_str = f", (nb_children: {len(entry.get_children())})"
+            print(
+                f"{entry_indent * 2 * ' '}id: {entry.get_id()}"
+                + text_str
+                + children_str,
+                file=output_stream,
+            )
+            stack += [
+                (child, entry_indent + 1) for child in reversed(entry.get_children())
+            ]
 
     def extract_links(self) -> list[str]:
         """Extract all the links mentioned in the associated text"""
@@ -82,16 +129,66 @@ class Entry(yaml.YAMLObject):
 
     def simplify(self) -> None:
         """Remove fields that are empty, to simplify writing to YAML"""
-        keys_to_delete: list[str] = []
-        for attribute_name in self.__dict__:
-            if hasattr(self, attribute_name) and not getattr(self, attribute_name):
-                keys_to_delete.append(attribute_name)
+        stack = [self]
+        while stack:
+            entry = stack.pop()
+            # children must be read before the attribute is possibly removed
+            stack += entry.get_children()
+
+            keys_to_delete = [
+                attribute_name
+                for attribute_name, value in entry.__dict__.items()
+                if not value
+            ]
+            for attribute_name in keys_to_delete:
+                delattr(entry, attribute_name)
+
+
+def expand_children(root: Entry, design: Entry, context: ExpansionContext) -> None:
+    """Expand the children of an entry and all their descendants, without recursion.
+    As with a depth-first recursion, the entries created by an expander are added to
+    their parent only once their own children are expanded"""
+
+    # each frame: entry, iterator on its former children, parent and entries to
+    # add to the parent once the frame is done
+    stack: list[tuple[Entry, Iterator[Entry], Optional[Entry], list[Entry]]] = []
+
+    def push(entry: Entry, parent: Optional[Entry], to_add: list[Entry]) -> None:
+        old_children = entry.get_children()
+        if old_children:
+            entry.children = []
+        stack.append((entry, iter(old_children), parent, to_add))
+
+    push(root, None, [])
+    # the children of the root were removed
+    context.clear_index()
+    while stack:
+        entry, old_children, parent, to_add = stack[-1]
+        child = next(old_children, None)
+        if child is None:
+            stack.pop()
+            if parent is not None:
+                parent.children += to_add
+                if parent is root:
+                    context.add_entries(to_add, parent)
+            continue
 
-        for attribute_name in keys_to_delete:
-            delattr(self, attribute_name)
+        try:
+            results = child.expand_entry(design, entry, context)
+        except Exception as exc:
+            for frame in reversed(stack):
+                print(f"Exception while expanding {frame[0].get_id()}:", exc)
+            raise
 
-        for child in self.get_children():
-            child.simplify()
+        if not any(result.get_children() for result in results):
+            entry.children += results
+            if entry is root:
+                context.add_entries(results, entry)
+            continue
+        # results[0] is expanded first, the frame of the last one adds them all
+        push(results[-1], entry, results)
+        for result in reversed(results[:-1]):
+            push(result, None, [])
 
 
 class Section(Entry):
@@ -142,6 +239,8 @@ class Test(Entry):
 
     short_type = "test"
     yaml_tag = "!Test"
+    # timeout in seconds, 0 to use the timeout of the engine
+    timeout: float = 0
 
     def __init__(
         self,
@@ -160,6 +259,10 @@ class TestList(Entry):
 
     short_type = "tl"
     yaml_tag = "!TestList"
+    # number of tests run concurrently, 0 to use the value of the command line
+    max_workers = 0
+    # test lists of the same (non empty) group never run at the same time
+    exclusive_group = ""
 
     def __init__(
         self,
@@ -1,31 +1,233 @@
 """Expanders are entries that can modify their parent entry (then are removed)"""
 
-import copy
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional, Sequence, TypeVar
 
 import yaml_util as yu
 import operations as op
 from entries import Entry, Definition
 
+T = TypeVar("T")
+
+# below this number of files, a process pool costs more than it saves
+MIN_FILES_FOR_PROCESS_POOL = 4
+
+
+def read_include_file(path: str) -> list[Entry]:
+    """Read the entries of an included file (also called in worker processes)"""
+    return yu.read_objects(Entry, Path(path))
+
+
+def get_file_key(path: str) -> tuple[str, int, int]:
+    """Return the key of a parsed file: it changes when the file is modified"""
+    stat = Path(path).stat()
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+def check_include_cycles(graph: dict[str, list[str]], root: str) -> None:
+    """Raise an exception if a file includes itself, directly or not"""
+    # depth-first search without recursion: the stack holds paths and their
+    # iterators on the included files
+    visiting = [root]
+    stack = [iter(graph.get(root, []))]
+    done: set[str] = set()
+    while stack:
+        included = next(stack[-1], None)
+        if included is None:
+            done.add(visiting.pop())
+            stack.pop()
+        elif included in visiting:
+            cycle = visiting[visiting.index(included) :] + [included]
+            raise Exception("Cycle in included files: " + " -> ".join(cycle))
+        elif included not in done:
+            visiting.append(included)
+            stack.append(iter(graph.get(included, [])))
+
+
+def count_include_uses(graph: dict[str, list[str]], root: str) -> dict[str, int]:
+    """Return how many times each file is included during the expansion of the root,
+    the graph being acyclic (each file is parsed once but included many times)"""
+    nb_includers: dict[str, int] = {}
+    for included_paths in graph.values():
+        for included in included_paths:
+            nb_includers[included] = nb_includers.get(included, 0) + 1
+    uses = {root: 1}
+    ready = [root]
+    while ready:
+        path = ready.pop()
+        for included in graph.get(path, []):
+            uses[included] = uses.get(included, 0) + uses[path]
+            nb_includers[included] -= 1
+            if nb_includers[included] == 0:
+                ready.append(included)
+    del uses[root]
+    return uses
+
+
+class ExpansionContext:
+    """State shared by all expanders during the expansion of one design"""
+
+    def __init__(
+        self, max_workers: Optional[int] = None, cache_dir: Optional[Path] = None
+    ) -> None:
+        # files and directories read by the expanders, with the extensions of
+        # the files that matter in directories (empty for all files)
+        self.inputs: list[tuple[Path, list[str]]] = []
+        self.max_workers = max_workers
+        # directory where the expanders may keep results between runs, if any
+        self.cache_dir = cache_dir
+        # included files already parsed, by resolved path and modification
+        self.parsed_includes: dict[tuple[str, int, int], list[Entry]] = {}
+        # expected number of remaining uses of each included file
+        self.include_uses: dict[str, int] = {}
+        # index of the entries already added to the design, built on demand
+        self.index: Optional[op.DesignIndex] = None
+        # ids by type, with the number of entries of the type when computed
+        self.ids_by_type: dict[type, tuple[int, list[str]]] = {}
+
+    def add_inputs(self, inputs: Sequence[tuple[Path, list[str]]]) -> None:
+        """Record inputs read by an expander"""
+        self.inputs += inputs
+
+    def preload_includes(self, design: Entry) -> None:
+        """Parse all the files included by the design, transitively, before the
+        expansion. The files of each level of inclusion are parsed in parallel"""
+        if not getattr(design, "file_path", ""):
+            return
+        design_path = design.get_file_path()
+
+        def included_paths(entries: Iterable[Entry]) -> list[str]:
+            return [
+                include.get_path(design_path).resolve().as_posix()
+                for entry in entries
+                for include in op.iter_entries(entry, Include)
+            ]
+
+        root = design_path.resolve().as_posix()
+        graph = {root: included_paths([design])}
+        pending = list(dict.fromkeys(graph[root]))
+        executor: Optional[ProcessPoolExecutor] = None
+        try:
+            while pending:
+                if executor is None and len(pending) >= MIN_FILES_FOR_PROCESS_POOL:
+                    executor = create_process_pool(self.max_workers)
+                keys = [get_file_key(path) for path in pending]
+                all_entries = (
+                    executor.map(read_include_file, pending)
+                    if executor is not None
+                    else map(read_include_file, pending)
+                )
+                next_pending: dict[str, None] = {}
+                for path, key, entries in zip(pending, keys, all_entries):
+                    self.parsed_includes[key] = entries
+                    graph[path] = included_paths(entries)
+                    for included in graph[path]:
+                        if included not in graph:
+                            next_pending[included] = None
+                pending = list(next_pending)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        check_include_cycles(graph, root)
+        self.include_uses = count_include_uses(graph, root)
+
+    def read_include(self, path: Path) -> list[Entry]:
+        """Return the entries of an included file, parsed only once. Each use gets its
+        own copy, except the last expected one that gets the parsed entries"""
+        key = get_file_key(path.resolve().as_posix())
+        entries = self.parsed_includes.get(key)
+        if entries is None:
+            entries = read_include_file(key[0])
+            self.parsed_includes[key] = entries
+
+        remaining_uses = self.include_uses.get(key[0], 0)
+        if remaining_uses == 1:
+            self.include_uses[key[0]] = 0
+            return self.parsed_includes.pop(key)
+        if remaining_uses > 1:
+            self.include_uses[key[0]] = remaining_uses - 1
+        # the parsed entries are kept for the next uses
+        return [entry.clone() for entry in entries]
+
+    def get_index(self, design: Entry) -> op.DesignIndex:
+        """Return the index of the design in its current state"""
+        if self.index is None or self.index.design is not design:
+            self.index = op.DesignIndex(design)
+            self.ids_by_type = {}
+        return self.index
+
+    def get_all_ids(self, design: Entry, parent_class: type[Entry]) -> list[str]:
+        """Return all ids of the entries of this type in the design, computed again
+        only if entries of this type were added"""
+        index = self.get_index(design)
+        nb_entries = len(index.entries_by_type.get(parent_class, []))
+        cached = self.ids_by_type.get(parent_class)
+        if cached is None or cached[0] != nb_entries:
+            cached = nb_entries, index.get_all_ids(parent_class)
+            self.ids_by_type[parent_class] = cached
+        return cached[1]
+
+    def find_entry_by_type_and_id(
+        self, design: Entry, parent_class: type[T], id1: str
+    ) -> T:
+        """Find an entry of the design by type and id"""
+        return self.get_index(design).find_entry_by_type_and_id(parent_class, id1)
+
+    def add_entries(self, new_entries: Sequence[Entry], parent: Entry) -> None:
+        """Called by the expansion when entries are added to the root of the expansion.
+        Other entries are not reachable from the design until their parent is added"""
+        if self.index is None:
+            return
+        if parent is self.index.design:
+            self.index.add_entries(new_entries, parent)
+        else:
+            self.clear_index()
+
+    def clear_index(self) -> None:
+        """Forget the index, e.g. when the design is modified"""
+        self.index = None
+        self.ids_by_type = {}
+
+
+def create_process_pool(max_workers: Optional[int]) -> Optional[ProcessPoolExecutor]:
+    """Create a pool of processes that know the entry classes, if possible"""
+    # forked processes inherit the classes imported by the setup file, others not
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    return ProcessPoolExecutor(
+        max_workers, mp_context=multiprocessing.get_context("fork")
+    )
+
 
 class Expander(Entry):
     """Parent class for all entries that add entries to their parent"""
 
     yaml_tag = "!Expander"
 
-    def create_entries(self, design: Entry, parent: Entry) -> list[Entry]:
+    def create_entries(
+        self, design: Entry, parent: Entry, context: ExpansionContext
+    ) -> list[Entry]:
         """Create the entries to be added in the parent's child"""
         raise NotImplementedError()
 
-    def expand(self, design: Entry, parent: Optional[Entry]) -> list[Entry]:
-        """Processing: extract child tests"""
+    def get_inputs(  # pylint: disable=W0613
+        self, design_path: Path
+    ) -> list[tuple[Path, list[str]]]:
+        """Return the files and directories read by create_entries, if any"""
+        return []
+
+    def expand_entry(
+        self, design: Entry, parent: Optional[Entry], context: ExpansionContext
+    ) -> list[Entry]:
+        """Processing: the expander is replaced by the entries it creates"""
         if parent is None:
             raise Exception("Cannot use expanders at top level")
 
-        results = self.create_entries(design, parent)
-        for result in results:
-            result.expand(design, parent)
+        if getattr(design, "file_path", ""):
+            context.add_inputs(self.get_inputs(design.get_file_path()))
+        results = self.create_entries(design, parent, context)
         if len(results) == 0:
             raise Exception(
                 f"Expander with id '{self.get_id()}' of type {type(self).__name__}"
@@ -47,8 +249,13 @@ class Include(Expander):
         """Return the path attribute. Since it is relative we need the design_path as well"""
         return design_path.parent / self.path
 
-    def create_entries(self, design: Entry, parent: Entry) -> list[Entry]:
-        return yu.read_objects(Entry, self.get_path(design.get_file_path()))
+    def get_inputs(self, design_path: Path) -> list[tuple[Path, list[str]]]:
+        return [(self.get_path(design_path), [])]
+
+    def create_entries(
+        self, design: Entry, parent: Entry, context: ExpansionContext
+    ) -> list[Entry]:
+        return context.read_include(self.get_path(design.get_file_path()))
 
 
 class MultiplyByDefinition(Expander):
@@ -62,18 +269,21 @@ class MultiplyByDefinition(Expander):
         super().__init__(id1, text, [])
         self.definition_id = definition_id
 
-    def create_entries(self, design: Entry, parent: Entry) -> list[Entry]:
+    def create_entries(
+        self, design: Entry, parent: Entry, context: ExpansionContext
+    ) -> list[Entry]:
         ret: list[Entry] = []
-        definition = op.find_entry_by_type_and_id(
+        definition = context.find_entry_by_type_and_id(
             design, Definition, self.definition_id
         )
 
         for child_definition in definition.children:
-            ret.append(copy.deepcopy(parent))
+            # the children of the parent are replaced: no need to copy them
+            ret.append(parent.clone(with_children=False))
             last = ret[-1]
             last.id += "-" + (child_definition.get_id() or "NONE")
             if last.get_text():
                 last.text += f" ({child_definition.get_id()})"
-            last.children = copy.deepcopy(self.get_children())
+            last.children = [child.clone() for child in self.get_children()]
 
         return ret
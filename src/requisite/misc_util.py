@@ -1,10 +1,32 @@
 """General utilities for Python"""
 
+import gzip
+import lzma
+import os
 import sys
+import signal
 import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional, Sequence
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    TypeVar,
+)
+
+T = TypeVar("T")
+U = TypeVar("U")
 
 
 def get_python_executable() -> Path:
@@ -103,3 +125,281 @@ def run_on_all_git_files(
     )
     ret = subprocess.run(full_command, check=check, shell=True)
     return ret.returncode
+
+
+OUTPUT_OPENERS: Dict[str, Callable[..., Any]] = {
+    ".gz": gzip.open,
+    ".xz": lzma.open,
+}
+
+
+class OutputCapture:
+    """Capture an output as it is produced. Without path or excerpt size, all the
+    output is kept in memory. Else, once the output is longer than twice the excerpt
+    size, all of it is written to a compressed file (gzip or lzma according to the
+    extension of the path) and only its head and tail are kept in memory"""
+
+    def __init__(self, path: Optional[Path] = None, excerpt_size: int = 0):
+        self.path = path if excerpt_size > 0 else None
+        self.excerpt_size = excerpt_size
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.file: Optional[BinaryIO] = None
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        """Capture the next part of the output"""
+        self.size += len(data)
+        if self.file is not None:
+            self.file.write(data)
+            self.tail += data
+            del self.tail[: -self.excerpt_size]
+            return
+
+        self.head += data
+        if self.path is None or len(self.head) <= 2 * self.excerpt_size:
+            return
+        os.makedirs(self.path.parent, exist_ok=True)
+        self.file = OUTPUT_OPENERS[self.path.suffix](self.path, "wb")
+        self.file.write(self.head)
+        self.tail = self.head[-self.excerpt_size :]
+        del self.head[self.excerpt_size :]
+
+    def close(self) -> None:
+        """Close the file of the output, if any"""
+        if self.file is not None:
+            self.file.close()
+
+    def is_spilled(self) -> bool:
+        """Check if the output was written to its file"""
+        return self.file is not None
+
+    def get_excerpt(self) -> bytes:
+        """Return the output, or its head and tail if it was written to its file"""
+        if self.file is None or self.path is None:
+            return bytes(self.head)
+        omitted = self.size - len(self.head) - len(self.tail)
+        return (
+            bytes(self.head)
+            + f"\n[... {omitted} bytes omitted, see {self.path.name} ...]\n".encode(
+                "utf-8"
+            )
+            + bytes(self.tail)
+        )
+
+    def get_text(self) -> str:
+        """Return the excerpt as text, the cut characters are replaced"""
+        return self.get_excerpt().decode("utf-8", errors="replace")
+
+
+class LineCapture(OutputCapture):
+    """Capture an output line by line: each line is given to a function as soon as it
+    is complete, and not kept. The first error of the function is kept in error and
+    the next lines are ignored, so the output is still read to its end"""
+
+    def __init__(self, on_line: Callable[[bytes], None]):
+        super().__init__()
+        self.on_line = on_line
+        self.pending = bytearray()
+        self.error: Optional[Exception] = None
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        self.pending += data
+        end = self.pending.rfind(b"\n")
+        if end < 0:
+            return
+        lines = self.pending[:end].split(b"\n")
+        del self.pending[: end + 1]
+        for line in lines:
+            self.handle_line(bytes(line))
+
+    def close(self) -> None:
+        # the last line may not be complete, e.g. if the process was killed
+        if self.pending:
+            self.handle_line(bytes(self.pending))
+            self.pending.clear()
+
+    def handle_line(self, line: bytes) -> None:
+        """Give a line to the function, unless it already failed"""
+        if self.error is not None:
+            return
+        try:
+            self.on_line(line)
+        except Exception as error:  # pylint: disable=W0718
+            self.error = error
+
+
+# the processes started by a command are in its process group, except on Windows
+HAS_PROCESS_GROUPS = hasattr(os, "killpg")
+# seconds to wait for the outputs of a killed process
+KILL_GRACE_PERIOD = 5.0
+
+
+def kill_process_group(process: subprocess.Popen) -> None:
+    """Kill a process and the processes it started, if they still exist"""
+    try:
+        if HAS_PROCESS_GROUPS:
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+
+def wait_process(
+    process: subprocess.Popen, on_exit: Callable[[], None]
+) -> tuple[float, int]:
+    """Wait for a process, call on_exit before it is reaped if possible, and return
+    its CPU time and peak memory (0 if they cannot be measured)"""
+    if not hasattr(os, "wait4"):
+        process.wait()
+        on_exit()
+        return 0.0, 0
+
+    if hasattr(os, "waitid"):
+        # wait without reaping: the pid cannot be given to another process yet
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        on_exit()
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    on_exit()
+    # in bytes on macOS, in KiB elsewhere
+    return rusage.ru_utime + rusage.ru_stime, (
+        rusage.ru_maxrss // 1024 if sys.platform == "darwin" else rusage.ru_maxrss
+    )
+
+
+@dataclass
+class MeasuredProcess:
+    """The output of a completed process, with the resources it used"""
+
+    returncode: int
+    stdout: bytes
+    stderr: bytes
+    wall_time: float  # seconds
+    cpu_time: float  # seconds, user and system
+    max_rss: int  # peak resident memory in KiB
+    timed_out: bool
+
+
+def run_measured(  # pylint: disable=R0913,R0914
+    command: Sequence[str],
+    cwd: Path,
+    env: Optional[Dict[str, str]] = None,
+    timeout: Optional[float] = None,
+    input_data: Optional[bytes] = None,
+    captures: Optional[Sequence[OutputCapture]] = None,
+) -> MeasuredProcess:
+    """Run a command and measure it. The process is killed after the timeout.
+    The resources are only measured on platforms with os.wait4. The outputs are
+    streamed to the captures of stdout and stderr if given, else kept in memory"""
+
+    start = time.perf_counter()
+    process = subprocess.Popen(  # pylint: disable=R1732
+        command,
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.PIPE if input_data is not None else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        # the sub-processes started by the command are killed with it
+        start_new_session=HAS_PROCESS_GROUPS,
+    )
+    stdout_capture, stderr_capture = captures or (OutputCapture(), OutputCapture())
+
+    def read(capture: OutputCapture, stream) -> None:
+        with stream:
+            for data in iter(lambda: stream.read1(1 << 16), b""):
+                capture.write(data)
+        capture.close()
+
+    def write() -> None:
+        assert process.stdin is not None and input_data is not None
+        try:
+            process.stdin.write(input_data)
+        except BrokenPipeError:
+            pass
+        process.stdin.close()
+
+    # daemon threads: a sub-process that left the group may keep the pipes open
+    threads = [
+        threading.Thread(
+            target=read, args=(stdout_capture, process.stdout), daemon=True
+        ),
+        threading.Thread(
+            target=read, args=(stderr_capture, process.stderr), daemon=True
+        ),
+    ]
+    if input_data is not None:
+        threads.append(threading.Thread(target=write, daemon=True))
+    for thread in threads:
+        thread.start()
+
+    # the process is killed only while it is not reaped, so its pid (and group id)
+    # cannot belong to another process
+    lock = threading.Lock()
+    state = {"done": False, "timed_out": False}
+
+    def kill() -> None:
+        with lock:
+            if not state["done"]:
+                state["timed_out"] = True
+                kill_process_group(process)
+
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer is not None:
+        timer.start()
+
+    def set_done() -> None:
+        with lock:
+            state["done"] = True
+
+    cpu_time, max_rss = wait_process(process, set_done)
+    wall_time = time.perf_counter() - start
+    if timer is not None:
+        timer.cancel()
+
+    # the sub-processes of the command may keep the pipes open: they are killed
+    # with the group once the timeout has expired
+    deadline = start + timeout if timeout else None
+    for thread in threads:
+        thread.join(
+            None if deadline is None else max(0.0, deadline - time.perf_counter())
+        )
+    if any(thread.is_alive() for thread in threads):
+        state["timed_out"] = True
+        kill_process_group(process)
+        for thread in threads:
+            thread.join(KILL_GRACE_PERIOD)
+
+    return MeasuredProcess(
+        process.returncode,
+        stdout_capture.get_excerpt(),
+        stderr_capture.get_excerpt(),
+        wall_time,
+        cpu_time,
+        max_rss,
+        bool(state["timed_out"]),
+    )
+
+
+def imap_ordered(
+    function: Callable[[T], U], items: Iterable[T], max_workers: int
+) -> Iterator[U]:
+    """Apply a function to items in threads and yield the results in the order of
+    the items, as soon as they are available. At most twice max_workers items are
+    pending: the memory does not depend on the number of items"""
+    if max_workers <= 1:
+        for item in items:
+            yield function(item)
+        return
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        pending: deque[Future[U]] = deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -1,40 +1,189 @@
 """Operations on design and entries"""
 
-from typing import cast, TypeVar
+from enum import Enum
+from typing import cast, Iterator, Optional, Sequence, TypeVar
 import entries as en
 
 T = TypeVar("T")
 
 
-def extract_entries_of_type(entry: en.Entry, parent_class: type[T]) -> list[T]:
-    """Extract all instances that inherit from the type"""
+class TraversalOrder(Enum):
+    """Order in which the entries of a tree are visited"""
+
+    PRE = "pre"  # parents before their children
+    POST = "post"  # children before their parents
+
+
+def iter_entries(
+    entry: en.Entry,
+    parent_class: type[T],
+    order: TraversalOrder = TraversalOrder.PRE,
+) -> Iterator[T]:
+    """Iterate lazily on all instances that inherit from the type. The traversal uses a
+    stack instead of recursion: any depth is supported and the caller can stop early"""
+
+    if order == TraversalOrder.PRE:
+        stack = [entry]
+        while stack:
+            current = stack.pop()
+            if isinstance(current, parent_class):
+                yield current
+            stack += reversed(current.get_children())
+    else:
+        post_stack: list[tuple[en.Entry, bool]] = [(entry, False)]
+        while post_stack:
+            current, children_visited = post_stack.pop()
+            if children_visited:
+                if isinstance(current, parent_class):
+                    yield current
+            else:
+                post_stack.append((current, True))
+                post_stack += [
+                    (child, False) for child in reversed(current.get_children())
+                ]
+
+
+class DesignIndex:
+    """Index of a design, built in one traversal: lookup by id, entries by type
+    (including the sub-classes) and links to parents"""
+
+    def __init__(self, design: en.Entry):
+        self.design = design
+        self.entries_by_type: dict[type, list[en.Entry]] = {}
+        self.entries_by_id: dict[str, en.Entry] = {}
+        self.parents: dict[int, Optional[en.Entry]] = {}
+        self.depths: dict[int, int] = {}
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        """Index the full design again, e.g. after expansion"""
+        self.entries_by_type = {}
+        self.entries_by_id = {}
+        self.parents = {}
+        self.depths = {}
+        self.add_entries([self.design], None)
+
+    def add_entries(
+        self, new_entries: Sequence[en.Entry], parent: Optional[en.Entry]
+    ) -> None:
+        """Patch the index with entries (and their children) appended to the parent.
+        The entries are appended to the lists by type: the new entries must be the
+        last ones of the design in pre-order, i.e. the last children of the parent
+        and the parent the last child of each of its ancestors (e.g. the design)"""
+        if parent is not None:
+            children = parent.get_children()
+            assert len(new_entries) <= len(children) and all(
+                new_entry is child
+                for new_entry, child in zip(reversed(new_entries), reversed(children))
+            ), "The new entries must be the last children of their parent"
+            assert self.is_last_subtree(
+                parent
+            ), f"Entries can only be added to the last subtree, not {parent.get_id()}"
+        depth = self.get_depth(parent) + 1 if parent is not None else 0
+        stack = [(entry, parent, depth) for entry in reversed(new_entries)]
+        while stack:
+            entry, entry_parent, entry_depth = stack.pop()
+            self.parents[id(entry)] = entry_parent
+            self.depths[id(entry)] = entry_depth
+            for entry_class in type(entry).__mro__:
+                if issubclass(entry_class, en.Entry):
+                    self.entries_by_type.setdefault(entry_class, []).append(entry)
+            if entry.get_id():
+                self.entries_by_id.setdefault(entry.id, entry)
+            for child in reversed(entry.get_children()):
+                stack.append((child, entry, entry_depth + 1))
+
+    def is_last_subtree(self, entry: en.Entry) -> bool:
+        """Check if an indexed entry is the last child of each of its ancestors"""
+        parent = self.parents[id(entry)]
+        while parent is not None:
+            if parent.get_children()[-1] is not entry:
+                return False
+            entry, parent = parent, self.parents[id(parent)]
+        return True
 
-    res: list[T] = []
+    def get_entries_of_type(self, parent_class: type[T]) -> list[T]:
+        """Return all instances that inherit from the type, in the order of the design"""
+        return cast(list[T], list(self.entries_by_type.get(parent_class, [])))
 
-    if isinstance(entry, parent_class):
-        res.append(entry)
+    def get_entry(self, id1: str) -> Optional[en.Entry]:
+        """Return the (first) entry with this id, if any"""
+        return self.entries_by_id.get(id1)
 
-    for child in entry.get_children():
-        res += extract_entries_of_type(child, parent_class)
+    def find_entry_by_type_and_id(self, parent_class: type[T], id1: str) -> T:
+        """Find an entry by type and id"""
+        entry = self.entries_by_id.get(id1)
+        if isinstance(entry, parent_class):
+            return entry
+        if entry is not None:
+            # the first entry with this id is of another type: search further
+            for entry_of_type in self.entries_by_type.get(parent_class, []):
+                if entry_of_type.get_id() == id1:
+                    return cast(T, entry_of_type)
+        raise Exception(
+            f"Cannot find entry of type {parent_class.__name__} and id {id1}"
+        )
+
+    def get_all_ids(self, parent_class: type[en.Entry]) -> list[str]:
+        """Return all ids of the entries of this type"""
+        return [
+            entry.id
+            for entry in self.entries_by_type.get(parent_class, [])
+            if entry.get_id()
+        ]
+
+    def contains_id(self, id1: str) -> bool:
+        """Check if any entry has this id"""
+        return id1 in self.entries_by_id
 
-    return res
+    def get_parent(self, entry: en.Entry) -> Optional[en.Entry]:
+        """Return the parent of an indexed entry (None for the design)"""
+        return self.parents[id(entry)]
+
+    def get_depth(self, entry: en.Entry) -> int:
+        """Return the depth of an indexed entry (0 for the design)"""
+        return self.depths[id(entry)]
+
+
+def extract_entries_of_type(
+    entry: en.Entry, parent_class: type[T], index: Optional[DesignIndex] = None
+) -> list[T]:
+    """Extract all instances that inherit from the type"""
+
+    if index is not None and index.design is entry:
+        return index.get_entries_of_type(parent_class)
+
+    return list(iter_entries(entry, parent_class))
 
 
 def find_entry_by_type_and_id(
-    main_entry: en.Entry, parent_class: type[T], id1: str
+    main_entry: en.Entry,
+    parent_class: type[T],
+    id1: str,
+    index: Optional[DesignIndex] = None,
 ) -> T:
     """Find an entry by type and id"""
 
-    for entry in extract_entries_of_type(main_entry, parent_class):
+    if index is not None and index.design is main_entry:
+        return index.find_entry_by_type_and_id(parent_class, id1)
+
+    for entry in iter_entries(main_entry, parent_class):
         if cast(en.Entry, entry).get_id() == id1:
             return entry
     raise Exception(f"Cannot find entry of type {parent_class.__name__} and id {id1}")
 
 
-def gather_all_ids(entry_to_check: en.Entry, parent_class: type[en.Entry]) -> list[str]:
+def gather_all_ids(
+    entry_to_check: en.Entry,
+    parent_class: type[en.Entry],
+    index: Optional[DesignIndex] = None,
+) -> list[str]:
     """Return all ids from the own and children entries"""
-    all_ids: list[str] = []
-    for entry in extract_entries_of_type(entry_to_check, parent_class):
-        if entry.get_id():
-            all_ids.append(entry.id)
-    return all_ids
+    if index is not None and index.design is entry_to_check:
+        return index.get_all_ids(parent_class)
+
+    return [
+        entry.id
+        for entry in iter_entries(entry_to_check, parent_class)
+        if entry.get_id()
+    ]
@@ -1,15 +1,21 @@
 """Utilities for doxygen test parsing"""
 
+import heapq
+import mmap
+import os
+import re
 import subprocess
 import tempfile
 import shutil
 import xml.etree.ElementTree as ET
 
-from typing import Optional, Sequence
+from typing import Callable, Iterator, Optional, Sequence
 from pathlib import Path
 from dataclasses import dataclass
+import cache as ca
 import entries as en
 import expanders as ex
+import misc_util as mu
 
 
 @dataclass
@@ -27,133 +33,406 @@ def function_to_id(path: Path, name: str) -> str:
     return path.as_posix().replace("/", "-").replace(".", "-") + "-" + name
 
 
-def extract_tests_from_functions(path: Path) -> list[en.Entry]:
-    """Parse the source code to extract the test information"""
-
-    def get_all_xml_files(xml_dir: Path) -> list[Path]:
-        res = []
-        for path in xml_dir.iterdir():
-            if path.as_posix().endswith(".xml") and not path.as_posix().endswith(
-                "index.xml"
-            ):
-                res.append(path)
-        res.sort()
-        return res
-
-    def get_child(
-        node: ET.Element, attribute_name: str, check_unique: bool
-    ) -> Optional[ET.Element]:
-        children = []
-        for child in node.iter(attribute_name):
-            children.append(child)
-        if check_unique:
-            assert len(children) == 1
-        return children[0] if children else None
-
-    def get_requirement_node(node: ET.Element) -> Optional[ET.Element]:
-        descr = get_child(node, "detaileddescription", True)
-        assert descr is not None
-        xrefsect = get_child(descr, "xrefsect", False)
-        if xrefsect is None:
-            return None
-        xrefdescr = get_child(xrefsect, "xrefdescription", True)
-        assert xrefdescr is not None
-        return get_child(xrefdescr, "para", False)
-
-    def extract_function(node: ET.Element) -> Function:
-        """Extract function from xml node"""
-
-        name = get_child(node, "name", True)
-        assert name is not None
-        location = get_child(node, "location", True)
-        assert location is not None
-        statement = get_requirement_node(node)
-
-        return Function(
-            name.text or "",
-            statement.text.strip() if statement is not None and statement.text else "",
-            Path(location.attrib["file"]),
-            int(location.attrib["line"]),
+# extensions of the files read by the native backend
+NATIVE_EXTENSIONS = ["c", "cc", "cxx", "cpp", "c++", "h", "hh", "hxx", "hpp", "h++"]
+
+# comments, literals and code of C/C++ sources, in one pass. The documentation blocks
+# are "/**", "/*!", "///" and "//!", without the "<" of the members documented after
+SOURCE_TOKENS = re.compile(
+    r"""(?P<doc>/\*[*!](?![/<]).*?\*/|//[/!](?![/<])[^\n]*)
+    |(?P<comment>/\*.*?\*/|//[^\n]*)
+    |(?P<literal>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+    |(?P<preprocessor>\#(?:\\\n|[^\n])*)
+    |(?P<code>[^/"'\#]+|.)""",
+    re.DOTALL | re.VERBOSE,
+)
+VERIFY_TAG = re.compile(r"[@\\]verify[ \t]+([^\n]*?)\s*(?:\*/)?\s*$", re.MULTILINE)
+# the last identifier before the parameters, e.g. "name" in "void ns::name"
+DECLARATION_NAME = re.compile(r"(~?[A-Za-z_]\w*)(\s*)$")
+
+# start of the statements of the verify alias in the XML generated by doxygen
+VERIFY_MARKER = b'<xrefsect id="verify_'
+
+# elements freed once parsed: the members and the sections or listings around them
+CLEARED_TAGS = {"memberdef", "sectiondef", "programlisting"}
+
+
+def get_all_xml_files(xml_dir: Path) -> list[Path]:
+    """Return the XML files generated by doxygen for the compounds, sorted"""
+    res = []
+    for path in xml_dir.iterdir():
+        if path.as_posix().endswith(".xml") and not path.as_posix().endswith(
+            "index.xml"
+        ):
+            res.append(path)
+    res.sort()
+    return res
+
+
+def get_child(node: ET.Element, path: str, required: bool) -> Optional[ET.Element]:
+    """Return the first child of a node matching the path, looked up directly"""
+    child = node.find(path)
+    if required and child is None:
+        raise Exception(f"Element '{path}' not found in doxygen XML '{node.tag}'")
+    return child
+
+
+def get_requirement_node(node: ET.Element) -> Optional[ET.Element]:
+    """Return the paragraph of the verify statement of a member, if any"""
+    descr = get_child(node, "detaileddescription", True)
+    assert descr is not None
+    xrefsect = get_child(descr, "para/xrefsect", False)
+    if xrefsect is None:
+        return None
+    xrefdescr = get_child(xrefsect, "xrefdescription", True)
+    assert xrefdescr is not None
+    return get_child(xrefdescr, "para", False)
+
+
+def extract_function(node: ET.Element) -> Function:
+    """Extract function from xml node"""
+
+    name = get_child(node, "name", True)
+    assert name is not None
+    location = get_child(node, "location", True)
+    assert location is not None
+    statement = get_requirement_node(node)
+
+    return Function(
+        name.text or "",
+        statement.text.strip() if statement is not None and statement.text else "",
+        Path(location.attrib["file"]),
+        int(location.attrib["line"]),
+    )
+
+
+def has_verify_statement(xml_file: Path) -> bool:
+    """Check whether a doxygen XML file contains a verify statement, without reading
+    it in memory"""
+    with open(xml_file, "rb") as fin:
+        if os.fstat(fin.fileno()).st_size == 0:
+            return False
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return data.find(VERIFY_MARKER) >= 0
+
+
+def extract_all_functions(xml_file: Path) -> list[Function]:
+    """Return the functions associated with a statement in a doxygen XML file (also
+    called in worker processes). The members are parsed one at a time and freed"""
+    # most files have no statement: they are not parsed at all
+    if not has_verify_statement(xml_file):
+        return []
+    res: list[Function] = []
+    for _, node in ET.iterparse(xml_file):
+        if node.tag == "memberdef" and node.attrib["kind"] == "function":
+            funct = extract_function(node)
+
+            # only the functions associated with a statement
+            if funct.verify_id:
+                res.append(funct)
+        if node.tag in CLEARED_TAGS:
+            node.clear()
+    return res
+
+
+def map_files(
+    function: Callable[[Path], list[Function]],
+    all_files: Sequence[Path],
+    max_workers: Optional[int] = None,
+) -> list[list[Function]]:
+    """Return the functions found by a function in each file, in the order of the
+    files. The files are handled in parallel, except with one worker: then no
+    process is forked"""
+    executor = (
+        ex.create_process_pool(max_workers)
+        if len(all_files) >= ex.MIN_FILES_FOR_PROCESS_POOL and max_workers != 1
+        else None
+    )
+    all_functions: Iterator[list[Function]]
+    if executor is None:
+        all_functions = map(function, all_files)
+    else:
+        # a few chunks per worker: thousands of small files are sent in batches
+        nb_workers = max_workers or os.cpu_count() or 1
+        all_functions = executor.map(
+            function,
+            all_files,
+            chunksize=max(1, len(all_files) // (4 * nb_workers)),
         )
+    try:
+        return list(all_functions)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
 
-    def execute(command: Sequence[str], tmp_dir: Path) -> None:
-        ret = subprocess.run(
-            command,
-            cwd=tmp_dir.as_posix(),
-            check=True,
-            capture_output=True,
-            encoding="utf-8",
+def extract_functions(
+    xml_dir: Path, max_workers: Optional[int] = None
+) -> list[Function]:
+    """Return the functions associated with a statement in all the XML files generated
+    by doxygen, in the order of the files. The files are parsed in parallel"""
+    return [
+        funct
+        for functions in map_files(
+            extract_all_functions, get_all_xml_files(xml_dir), max_workers
         )
-        # print(ret.stdout)
-        if ret.stderr:
-            print("Warnings from doxygen documentation generation:")
-            print(ret.stderr)
-        if ret.returncode != 0:
-            raise Exception(f"Command '{command}' failed with code {ret.returncode}")
-
-    def extract_all_functions(xml_file: Path) -> list[Function]:
-
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        res: list[Function] = []
-        # print(xml_file.as_posix())
-        for memberdef in root.iter("memberdef"):
-            if memberdef.attrib["kind"] == "function":
-                funct = extract_function(memberdef)
-
-                # only the functions associated with a statement
-                if funct.verify_id:
-                    res.append(funct)
-        return res
+        for funct in functions
+    ]
 
-    if not path.is_dir():
-        raise Exception(f"Directory not found: {path.as_posix()}")
-    tmp_dir = Path(tempfile.mkdtemp("reqdoxy"))
-    try:
-        doxyfile = tmp_dir / "Doxyfile"
-        with open(doxyfile, "w", encoding="utf-8") as fout:
-            fout.write(
-                f"""GENERATE_LATEX = NO
+
+def scan_source_file(path: Path) -> list[Function]:
+    """Return the functions associated with a statement in a C/C++ source file, without
+    doxygen (also called in worker processes). A statement belongs to the declaration
+    that follows its documentation block, up to its first semicolon or brace"""
+    with open(path, encoding="utf-8", errors="replace") as fin:
+        text = fin.read()
+    if "verify" not in text:
+        return []
+
+    res: list[Function] = []
+    verify_id = ""
+    declaration = ""
+    parenthesis = -1
+    for token in SOURCE_TOKENS.finditer(text):
+        kind = token.lastgroup
+        if kind == "doc":
+            statement = VERIFY_TAG.search(token.group())
+            if statement is not None:
+                verify_id = statement.group(1).strip()
+                declaration = ""
+                parenthesis = -1
+        elif kind == "code" and verify_id:
+            code = token.group()
+            end = min(
+                (index for index in (code.find(";"), code.find("{")) if index >= 0),
+                default=len(code),
+            )
+            if parenthesis < 0 and "(" in code[:end]:
+                parenthesis = token.start() + code.index("(")
+            declaration += code[:end]
+            if end == len(code):
+                continue
+
+            # the name is the last identifier before the parameters
+            match = DECLARATION_NAME.search(declaration.split("(", 1)[0])
+            if parenthesis >= 0 and match is not None:
+                line = text.count("\n", 0, parenthesis) + 1
+                res.append(
+                    Function(
+                        match.group(1),
+                        verify_id,
+                        path,
+                        line - match.group(2).count("\n"),
+                    )
+                )
+            verify_id = ""
+    return res
+
+
+def scan_sources(path: Path, max_workers: Optional[int] = None) -> list[Function]:
+    """Return the functions associated with a statement in all the C/C++ sources of a
+    directory, without doxygen. The files are sorted by name, as doxygen does, and
+    scanned in parallel"""
+    all_files = sorted(
+        ca.list_files(path.resolve(), NATIVE_EXTENSIONS),
+        key=lambda file_path: (file_path.name, file_path),
+    )
+    return [
+        funct
+        for functions in map_files(scan_source_file, all_files, max_workers)
+        for funct in functions
+    ]
+
+
+def functions_to_tests(functions: Sequence[Function], root: Path) -> list[en.Entry]:
+    """Create the tests of the functions, with ids relative to the root directory"""
+    return [
+        en.Test(
+            function_to_id(func.file.relative_to(root), func.name),
+            "",
+            en.TestType.AUTOMATIC,
+            func.verify_id,
+        )
+        for func in functions
+    ]
+
+
+def execute(command: Sequence[str], tmp_dir: Path) -> None:
+    """Run doxygen"""
+    ret = subprocess.run(
+        command,
+        cwd=tmp_dir.as_posix(),
+        check=True,
+        capture_output=True,
+        encoding="utf-8",
+    )
+    # print(ret.stdout)
+    if ret.stderr:
+        print("Warnings from doxygen documentation generation:")
+        print(ret.stderr)
+    if ret.returncode != 0:
+        raise Exception(f"Command '{command}' failed with code {ret.returncode}")
+
+
+def get_doxyfile(inputs: Sequence[Path]) -> str:
+    """Return the configuration of doxygen to generate the XML of source files and
+    directories"""
+    input_paths = " ".join(f'"{path.resolve().as_posix()}"' for path in inputs)
+    return f"""GENERATE_LATEX = NO
 GENERATE_HTML = NO
 GENERATE_XML = YES
 GENERATE_TESTLIST = YES
-# OUTPUT_DIRECTORY = {tmp_dir.as_posix()}
 RECURSIVE = YES
-INPUT = {path.resolve().as_posix()}
+INPUT = {input_paths}
 HAVE_DOT = NO
 ALIASES = \"verify=@xrefitem verify \\\"Verify\\\" \\\"Verify\\\" \"
 """
-            )
 
-        execute(["doxygen", doxyfile.as_posix()], tmp_dir)
 
-        xml_dir = Path(tmp_dir / "xml")
-        all_files = get_all_xml_files(xml_dir)
+def run_doxygen(
+    inputs: Sequence[Path], max_workers: Optional[int] = None
+) -> list[tuple[str, list[Function]]]:
+    """Run doxygen on source files and directories, return the functions associated
+    with a statement by generated XML file"""
+    tmp_dir = Path(tempfile.mkdtemp("reqdoxy"))
+    try:
+        doxyfile = tmp_dir / "Doxyfile"
+        with open(doxyfile, "w", encoding="utf-8") as fout:
+            fout.write(get_doxyfile(inputs))
 
-        all_functions = []
-        for file in all_files:
-            all_functions += extract_all_functions(file)
+        execute(["doxygen", doxyfile.as_posix()], tmp_dir)
 
-        return [
-            en.Test(
-                function_to_id(func.file.relative_to(path.resolve()), func.name),
-                "",
-                en.TestType.AUTOMATIC,
-                func.verify_id,
+        all_files = get_all_xml_files(tmp_dir / "xml")
+        return list(
+            zip(
+                [file.name for file in all_files],
+                map_files(extract_all_functions, all_files, max_workers),
             )
-            for func in all_functions
-        ]
+        )
 
     finally:
         print("Delete " + tmp_dir.as_posix())
         shutil.rmtree(tmp_dir)
 
 
+def get_tree_sizes(path: Path) -> dict[Path, int]:
+    """Return the sizes of the files of a directory and of the directories that contain
+    files, the directory included"""
+    sizes: dict[Path, int] = {}
+    for file_path in ca.list_files(path, []):
+        size = file_path.stat().st_size
+        for parent in [file_path] + list(file_path.parents):
+            sizes[parent] = sizes.get(parent, 0) + size
+            if parent == path:
+                break
+    return sizes
+
+
+def split_sources(path: Path, nb_shards: int) -> list[list[Path]]:
+    """Split a source directory into shards of files and directories of similar sizes.
+    The directories larger than a shard are split into their subdirectories and the
+    group of their own files: the files of a directory (e.g. a header and its source)
+    are always in the same shard, as doxygen merges their documentation"""
+    path = path.resolve()
+    sizes = get_tree_sizes(path)
+    if not sizes:
+        return []
+
+    shard_size = sizes[path] / nb_shards
+    groups = [[path]]
+    while True:
+        large = [
+            group
+            for group in groups
+            if group[0].is_dir() and sizes[group[0]] > shard_size
+        ]
+        if not large:
+            break
+        for group in large:
+            groups.remove(group)
+            children = sorted(child for child in group[0].iterdir() if child in sizes)
+            files = [child for child in children if not child.is_dir()]
+            if files:
+                groups.append(files)
+            groups += [[child] for child in children if child.is_dir()]
+
+    # the largest groups first, each one in the smallest shard so far
+    group_sizes = [sum(sizes[entry] for entry in group) for group in groups]
+    shards: list[list[Path]] = [[] for _ in range(min(nb_shards, len(groups)))]
+    heap = [(0, index) for index in range(len(shards))]
+    for group_size, group in sorted(
+        zip(group_sizes, groups), key=lambda item: (-item[0], item[1])
+    ):
+        size, index = heapq.heappop(heap)
+        shards[index] += group
+        heapq.heappush(heap, (size + group_size, index))
+    return [sorted(shard) for shard in shards]
+
+
+def run_sharded_doxygen(
+    path: Path, nb_shards: int = 1, max_workers: Optional[int] = None
+) -> list[Function]:
+    """Run doxygen on a source directory, in parallel on shards of the sources, and
+    return the functions associated with a statement, in the order of a single run.
+    The documentation of a function is merged only within a shard: the files of a
+    directory are never split, but a header and its source in other directories
+    may be"""
+    shards = split_sources(path, nb_shards) if nb_shards > 1 else []
+    if len(shards) <= 1:
+        results = run_doxygen([path], max_workers)
+    else:
+        # the XML files of a shard are parsed in its thread: the pool of processes
+        # must not be forked from several threads
+        results = sorted(
+            (
+                result
+                for shard_results in mu.imap_ordered(
+                    lambda inputs: run_doxygen(inputs, 1), shards, len(shards)
+                )
+                for result in shard_results
+            ),
+            key=lambda result: result[0],
+        )
+    return [funct for _, functions in results for funct in functions]
+
+
+def extract_tests_from_functions(
+    path: Path,
+    max_workers: Optional[int] = None,
+    cache_dir: Optional[Path] = None,
+    nb_shards: int = 1,
+) -> list[en.Entry]:
+    """Parse the source code to extract the test information. With a cache directory,
+    doxygen runs again only if the sources changed since the cached run"""
+
+    if not path.is_dir():
+        raise Exception(f"Directory not found: {path.as_posix()}")
+    tree_cache = (
+        ca.TreeCache(cache_dir, "doxygen", path, get_doxyfile([path]))
+        if cache_dir is not None
+        else None
+    )
+    all_functions = tree_cache.load() if tree_cache is not None else None
+    if all_functions is None:
+        all_functions = run_sharded_doxygen(path, nb_shards, max_workers)
+        if tree_cache is not None:
+            tree_cache.store(all_functions)
+    else:
+        print(f"Use the cached doxygen results of {path.as_posix()}")
+
+    return functions_to_tests(all_functions, path.resolve())
+
+
 class ExtractTestsFromDoxygen(ex.Expander):
     """Extract tests from doxygen documentation, C++ or other.
     Will generate XML with doxygen then parse the XML to retrieve the test functions"""
 
     yaml_tag = "!ExtractTestsFromDoxygen"
+    # "doxygen": run doxygen then parse its XML, "native": scan the C/C++ sources
+    # for the statements directly, without doxygen
+    backend = "doxygen"
+    # number of doxygen processes run in parallel on parts of the sources
+    shards = 1
 
     def __init__(  # pylint: disable=R0913
         self, id1: str, text: str, children: list[en.Entry], path: Path
@@ -165,5 +444,24 @@ class ExtractTestsFromDoxygen(ex.Expander):
         """Return the path attribute. Since it is relative we need the design_path as well"""
         return design_path.parent / self.path
 
-    def create_entries(self, design: en.Entry, parent: en.Entry) -> list[en.Entry]:
-        return extract_tests_from_functions(self.get_path(design.get_file_path()))
+    def get_inputs(self, design_path: Path) -> list[tuple[Path, list[str]]]:
+        return [(self.get_path(design_path), [])]
+
+    def create_entries(
+        self, design: en.Entry, parent: en.Entry, context: ex.ExpansionContext
+    ) -> list[en.Entry]:
+        path = self.get_path(design.get_file_path())
+        if self.backend == "native":
+            if not path.is_dir():
+                raise Exception(f"Directory not found: {path.as_posix()}")
+            return functions_to_tests(
+                scan_sources(path, context.max_workers), path.resolve()
+            )
+        if self.backend != "doxygen":
+            raise Exception(f"Unknown backend of {type(self).__name__}: {self.backend}")
+        return extract_tests_from_functions(
+            path,
+            context.max_workers,
+            context.cache_dir,
+            self.shards,
+        )
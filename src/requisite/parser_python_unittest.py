@@ -6,7 +6,6 @@ from typing import Union, Optional, Sequence
 from pathlib import Path
 import entries as en
 import expanders as ex
-import operations as op
 
 TEST_PREFIX = "test_"
 
@@ -87,8 +86,13 @@ class ExtractTestsFromPythonUnitTest(ex.Expander):
         """Return the path attribute. Since it is relative we need the design_path as well"""
         return design_path.parent / self.path
 
-    def create_entries(self, design: en.Entry, parent: en.Entry) -> list[en.Entry]:
-        all_ids = op.gather_all_ids(design, en.Statement)
+    def get_inputs(self, design_path: Path) -> list[tuple[Path, list[str]]]:
+        return [(self.get_path(design_path), ["py"])]
+
+    def create_entries(
+        self, design: en.Entry, parent: en.Entry, context: ex.ExpansionContext
+    ) -> list[en.Entry]:
+        all_ids = context.get_all_ids(design, en.Statement)
         return extract_python_unittest_tests(
             self.get_path(design.get_file_path()), self.pattern, all_ids
         )
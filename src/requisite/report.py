@@ -1,10 +1,13 @@
 """Generation of specification report in HTML format"""
 
+import os
 import re
 from xml.etree import ElementTree as ET
 from pathlib import Path
+from typing import Sequence
 import entries as en
 import operations as op
+import testing as te
 import verification as ve
 
 LINK_EXPRESSION = re.compile("<([a-zA-Z_][a-zA-Z0-9_-]*)>")
@@ -112,21 +115,72 @@ def entry_to_table_tag(parent_entry: en.Entry, verifier: ve.Verifier) -> ET.Elem
     table_tag = ET.SubElement(p_tag, "table")
     table_tag.append(generate_table_header())
 
-    for statement in op.extract_entries_of_type(parent_entry, en.Statement):
+    for statement in op.extract_entries_of_type(
+        parent_entry, en.Statement, verifier.index
+    ):
         table_tag.append(statement_to_td(statement, verifier))
 
     return p_tag
 
 
-def write_html_report(
-    output_path: Path, design: en.Design, verifier: ve.Verifier
+def slowest_tests_to_table_tag(executions: Sequence[te.TestExecution]) -> ET.Element:
+    """Convert the slowest test executions to a table tag"""
+    table_tag = ET.Element("table")
+    tr_tag = ET.SubElement(table_tag, "tr")
+    for title in ["test", "result", "wall time (s)", "CPU time (s)", "max RSS (KiB)"]:
+        th_tag = ET.SubElement(tr_tag, "th")
+        th_tag.text = title
+
+    for execution in executions:
+        tr_tag = ET.SubElement(table_tag, "tr")
+        for value in [
+            execution.test_id,
+            execution.result,
+            f"{execution.get_wall_time():.3f}",
+            f"{getattr(execution, 'cpu_time', 0.0):.3f}",
+            str(getattr(execution, "max_rss", 0)),
+        ]:
+            td_tag = ET.SubElement(tr_tag, "td")
+            td_tag.text = value
+    return table_tag
+
+
+def progress_to_table_tag(progress: Sequence[te.TestListProgress]) -> ET.Element:
+    """Convert the progress of the test lists to a table tag"""
+    table_tag = ET.Element("table")
+    tr_tag = ET.SubElement(table_tag, "tr")
+    results = [result.value for result in te.TestResult]
+    for title in ["test list", "state"] + results:
+        th_tag = ET.SubElement(tr_tag, "th")
+        th_tag.text = title
+
+    for test_list_progress in progress:
+        tr_tag = ET.SubElement(table_tag, "tr")
+        for value in [
+            test_list_progress.test_list_id,
+            "done" if test_list_progress.done else "running",
+        ] + [str(test_list_progress.counts.get(result, 0)) for result in results]:
+            td_tag = ET.SubElement(tr_tag, "td")
+            td_tag.text = value
+    return table_tag
+
+
+def write_html_report(  # pylint: disable=R0914
+    output_path: Path,
+    design: en.Design,
+    verifier: ve.Verifier,
+    slowest_executions: Sequence[te.TestExecution] = (),
+    progress: Sequence[te.TestListProgress] = (),
 ) -> None:
-    """Write a HTML report to file"""
+    """Write a HTML report to file. While the tests run, the report shows their
+    progress"""
 
     # if output_path.is_file():
     # print(f"File {output_path.as_posix()} already exists")
     # sys.exit(1)
-    with open(output_path, "w", encoding="utf-8") as fout:
+    # the report is replaced at once: it can be refreshed while it is read
+    tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as fout:
 
         html_tag = ET.Element("html")
         head_tag = ET.SubElement(html_tag, "head")
@@ -150,9 +204,20 @@ def write_html_report(
         h2_tag2.text = "Statement table"
         body_tag.append(entry_to_table_tag(design, verifier))
 
+        if progress:
+            h2_tag3 = ET.SubElement(body_tag, "h2")
+            h2_tag3.text = "Test progress"
+            body_tag.append(progress_to_table_tag(progress))
+
+        if slowest_executions:
+            h2_tag4 = ET.SubElement(body_tag, "h2")
+            h2_tag4.text = "Slowest tests"
+            body_tag.append(slowest_tests_to_table_tag(slowest_executions))
+
         tree = ET.ElementTree(html_tag)
         ET.indent(tree, "  ")
         tree.write(fout, encoding="unicode", method="html")
+    os.replace(tmp_path, output_path)
 
 
 def generate_style_tag() -> ET.Element:
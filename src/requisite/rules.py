@@ -2,12 +2,14 @@
 
 import re
 from dataclasses import dataclass
-from typing import Optional
+from typing import Iterator, Optional, Sequence
 
 import entries as en
 import operations as op
 import expanders as ex
 
+ID_EXPRESSION = re.compile("[a-zA-Z_][a-zA-Z0-9_.-]*")
+
 
 @dataclass
 class EntryErrorMessage:
@@ -29,209 +31,348 @@ class EntryErrorMessage:
     text: str
 
 
-def check_all_rules(entry: en.Entry) -> list[EntryErrorMessage]:
-    """Apply all existing rules to the entry and its children"""
-    messages = check_entry_attributes_non_null(entry)
-    messages += check_definition_id_mandatory(entry)
-    messages += check_statement_id_mandatory(entry)
-    messages += check_id_unique(entry)
-    messages += check_id_valid(entry)
-    messages += check_id_spec(entry)
-    messages += check_id_req(entry)
-    messages += check_links(entry)
-    messages += check_child_statements(entry)
-    messages += check_child_definition(entry)
-    messages += check_child_test_list(entry)
-    messages += check_test_verify_id_mandatory(entry)
-    return messages
+class Rule:
+    """A rule, applied by the rule engine to each entry of the given type"""
 
+    entry_class: type[en.Entry] = en.Entry
 
-def check_entry_attributes_non_null(
-    entry_to_check: en.Entry,
-) -> list[EntryErrorMessage]:
-    """Check rule spec-entry-attributes-non-null"""
+    def check(self, entry: en.Entry) -> list[EntryErrorMessage]:
+        """Check one entry, entries are visited in the order of the design"""
+        raise NotImplementedError()
 
-    messages: list[EntryErrorMessage] = []
-    for entry in op.extract_entries_of_type(entry_to_check, en.Entry):
-        for attribute_name in entry.__dict__.keys():
-            if (
-                hasattr(entry, attribute_name)
-                and getattr(entry, attribute_name) is None
-            ):
-                messages.append(
-                    EntryErrorMessage(
-                        entry,
-                        f"Entry attribute {attribute_name} has a null value",
-                    )
-                )
-    return messages
+    def finish(  # pylint: disable=W0613
+        self, all_ids: set[str]
+    ) -> list[EntryErrorMessage]:
+        """Checks that can only be done once all entries were visited"""
+        return []
 
 
-def check_definition_id_mandatory(entry_to_check: en.Entry) -> list[EntryErrorMessage]:
-    """Check rule spec-definition-id-mandatory"""
+class RuleEngine:
+    """Apply a list of rules while walking the design only once"""
+
+    def __init__(self, rules: Sequence[Rule]):
+        self.rules = rules
+        self.rules_by_class: dict[type, list[int]] = {}
+
+    def get_rule_indices(self, entry_class: type) -> list[int]:
+        """Return the indices of the rules that apply to a class (cached)"""
+        indices = self.rules_by_class.get(entry_class)
+        if indices is None:
+            indices = [
+                i
+                for i, rule in enumerate(self.rules)
+                if issubclass(entry_class, rule.entry_class)
+            ]
+            self.rules_by_class[entry_class] = indices
+        return indices
+
+    def check(
+        self, entry_to_check: en.Entry, index: Optional[op.DesignIndex] = None
+    ) -> list[EntryErrorMessage]:
+        """Check all entries. Messages are sorted by rule, then by entry"""
+
+        messages: list[list[EntryErrorMessage]] = [[] for _ in self.rules]
+        all_ids: set[str] = set()
+
+        for entry in iter_all_entries(entry_to_check, index):
+            if entry.get_id():
+                all_ids.add(entry.id)
+            for i in self.get_rule_indices(type(entry)):
+                messages[i] += self.rules[i].check(entry)
 
-    messages: list[EntryErrorMessage] = []
-    for entry in op.extract_entries_of_type(entry_to_check, en.Definition):
+        for i, rule in enumerate(self.rules):
+            messages[i] += rule.finish(all_ids)
+
+        return [message for rule_messages in messages for message in rule_messages]
+
+
+def iter_all_entries(
+    entry_to_check: en.Entry, index: Optional[op.DesignIndex]
+) -> Iterator[en.Entry]:
+    """Iterate on the entry and all its children, in the order of the design"""
+    if index is not None and index.design is entry_to_check:
+        yield from index.get_entries_of_type(en.Entry)
+        return
+    yield from op.iter_entries(entry_to_check, en.Entry)
+
+
+class EntryAttributesNonNullRule(Rule):
+    """Rule spec-entry-attributes-non-null"""
+
+    def check(self, entry: en.Entry) -> list[EntryErrorMessage]:
+        return [
+            EntryErrorMessage(
+                entry,
+                f"Entry attribute {attribute_name} has a null value",
+            )
+            for attribute_name, value in entry.__dict__.items()
+            if value is None
+        ]
+
+
+class DefinitionIdMandatoryRule(Rule):
+    """Rule spec-definition-id-mandatory"""
+
+    entry_class = en.Definition
+
+    def check(self, entry: en.Entry) -> list[EntryErrorMessage]:
         if not entry.get_id():
-            messages.append(EntryErrorMessage(entry, "Definition id is missing"))
-    return messages
+            return [EntryErrorMessage(entry, "Definition id is missing")]
+        return []
 
 
-def check_statement_id_mandatory(entry_to_check: en.Entry) -> list[EntryErrorMessage]:
-    """Check rule spec-statement-id-mandatory"""
+class StatementIdMandatoryRule(Rule):
+    """Rule spec-statement-id-mandatory"""
+
+    entry_class = en.Statement
 
-    messages: list[EntryErrorMessage] = []
-    for entry in op.extract_entries_of_type(entry_to_check, en.Statement):
+    def check(self, entry: en.Entry) -> list[EntryErrorMessage]:
         if not entry.get_id():
-            messages.append(EntryErrorMessage(entry, "Statement id is missing"))
-    return messages
+            return [EntryErrorMessage(entry, "Statement id is missing")]
+        return []
 
 
-def check_id_unique(entry_to_check: en.Entry) -> list[EntryErrorMessage]:
-    """Check rule spec-statement-id-unique"""
+class IdUniqueRule(Rule):
+    """Rule spec-statement-id-unique"""
 
-    known_ids: list[str] = []
-    messages: list[EntryErrorMessage] = []
+    def __init__(self) -> None:
+        self.known_ids: set[str] = set()
 
-    for entry in op.extract_entries_of_type(entry_to_check, en.Entry):
+    def check(self, entry: en.Entry) -> list[EntryErrorMessage]:
         if entry.get_id():
-            if entry.id in known_ids:
-                messages.append(EntryErrorMessage(entry, "ID is duplicated"))
-            else:
-                known_ids.append(entry.id)
-    return messages
+            if entry.id in self.known_ids:
+                return [EntryErrorMessage(entry, "ID is duplicated")]
+            self.known_ids.add(entry.id)
+        return []
 
 
-def check_id_valid(entry_to_check: en.Entry) -> list[EntryErrorMessage]:
-    """Check rule spec-statement-id-valid"""
+class IdValidRule(Rule):
+    """Rule spec-statement-id-valid"""
 
-    messages: list[EntryErrorMessage] = []
+    def check(self, entry: en.Entry) -> list[EntryErrorMessage]:
+        if entry.get_id() and not ID_EXPRESSION.fullmatch(entry.id):
+            return [EntryErrorMessage(entry, "ID contains invalid characters")]
+        return []
 
-    for entry in op.extract_entries_of_type(entry_to_check, en.Entry):
-        if entry.get_id():
-            if not re.fullmatch("[a-zA-Z_][a-zA-Z0-9_.-]*", entry.id):
-                messages.append(
-                    EntryErrorMessage(entry, "ID contains invalid characters")
-                )
-    return messages
 
+class IdSpecRule(Rule):
+    """Rule spec-statement-id-spec"""
 
-def check_id_spec(entry_to_check: en.Entry) -> list[EntryErrorMessage]:
-    """Check rule spec-statement-id-spec"""
+    entry_class = en.Specification
 
-    messages: list[EntryErrorMessage] = []
+    def check(self, entry: en.Entry) -> list[EntryErrorMessage]:
+        if entry.get_id() and not entry.id.startswith("spec-"):
+            return [
+                EntryErrorMessage(entry, "ID of specification must start with 'spec-'")
+            ]
+        return []
 
-    for entry in op.extract_entries_of_type(entry_to_check, en.Specification):
-        if entry.get_id():
-            if not entry.id.startswith("spec-"):
-                messages.append(
-                    EntryErrorMessage(
-                        entry, "ID of specification must start with 'spec-'"
-                    )
-                )
-    return messages
 
+class IdReqRule(Rule):
+    """Rule spec-statement-id-req"""
 
-def check_id_req(entry_to_check: en.Entry) -> list[EntryErrorMessage]:
-    """Check rule spec-statement-id-req"""
+    entry_class = en.Requirement
 
-    messages: list[EntryErrorMessage] = []
-    for entry in op.extract_entries_of_type(entry_to_check, en.Requirement):
-        if entry.get_id():
-            if not entry.id.startswith("req-"):
-                messages.append(
-                    EntryErrorMessage(entry, "ID of requirement must start with 'req-'")
-                )
-    return messages
+    def check(self, entry: en.Entry) -> list[EntryErrorMessage]:
+        if entry.get_id() and not entry.id.startswith("req-"):
+            return [
+                EntryErrorMessage(entry, "ID of requirement must start with 'req-'")
+            ]
+        return []
 
 
-def check_links(entry_to_check: en.Entry) -> list[EntryErrorMessage]:
-    """Check rule spec-valid-links"""
+class LinksRule(Rule):
+    """Rule spec-valid-links: links are checked once all ids are known"""
 
-    all_ids = op.gather_all_ids(entry_to_check, en.Entry)
+    def __init__(self) -> None:
+        self.links: list[tuple[en.Entry, str]] = []
 
-    messages: list[EntryErrorMessage] = []
-    for entry in op.extract_entries_of_type(entry_to_check, en.Entry):
-        links = entry.extract_links()
-        for link in links:
-            if link not in all_ids:
-                messages.append(
-                    EntryErrorMessage(entry, f"Linked id '{link}' does not exist.")
-                )
+    def check(self, entry: en.Entry) -> list[EntryErrorMessage]:
+        self.links += [(entry, link) for link in entry.extract_links()]
+        return []
 
-    return messages
+    def finish(self, all_ids: set[str]) -> list[EntryErrorMessage]:
+        return [
+            EntryErrorMessage(entry, f"Linked id '{link}' does not exist.")
+            for entry, link in self.links
+            if link not in all_ids
+        ]
 
 
-def check_child_statements(entry_to_check: en.Entry) -> list[EntryErrorMessage]:
-    """Check rule spec-child-statement"""
+class ChildStatementsRule(Rule):
+    """Rule spec-child-statement"""
 
-    messages: list[EntryErrorMessage] = []
-    for entry in op.extract_entries_of_type(entry_to_check, en.Statement):
-        for child in entry.get_children():
-            if not isinstance(child, en.Statement) and not isinstance(
-                child, ex.Expander
-            ):
-                messages.append(
-                    EntryErrorMessage(
-                        entry, "Statement can only have statements as children"
-                    )
-                )
+    entry_class = en.Statement
 
-    return messages
+    def check(self, entry: en.Entry) -> list[EntryErrorMessage]:
+        return [
+            EntryErrorMessage(entry, "Statement can only have statements as children")
+            for child in entry.get_children()
+            if not isinstance(child, (en.Statement, ex.Expander))
+        ]
 
 
-def check_child_definition(entry_to_check: en.Entry) -> list[EntryErrorMessage]:
-    """Check rule spec-child-definition"""
+class ChildDefinitionRule(Rule):
+    """Rule spec-child-definition"""
+
+    entry_class = en.Definition
+
+    def check(self, entry: en.Entry) -> list[EntryErrorMessage]:
+        return [
+            EntryErrorMessage(
+                entry,
+                "Definitions can only have definitions or expanders as children",
+            )
+            for child in entry.get_children()
+            if not isinstance(child, (en.Definition, ex.Expander))
+        ]
+
+
+class ChildTestListRule(Rule):
+    """Rule spec-child-test-list"""
+
+    entry_class = en.TestList
 
-    messages: list[EntryErrorMessage] = []
-    for entry in op.extract_entries_of_type(entry_to_check, en.Definition):
-        for child in entry.get_children():
-            if not isinstance(child, en.Definition) and not isinstance(
-                child, ex.Expander
-            ):
+    def check(self, entry: en.Entry) -> list[EntryErrorMessage]:
+        return [
+            EntryErrorMessage(entry, "TestList can only have tests as children")
+            for child in entry.get_children()
+            if not isinstance(child, (en.Test, ex.Expander))
+        ]
+
+
+class TestVerifyIdMandatoryRule(Rule):
+    """Rule spec-test-statement-id: verify ids are checked once all ids are known"""
+
+    entry_class = en.Test
+
+    def __init__(self) -> None:
+        self.tests: list[tuple[en.Entry, str]] = []
+
+    def check(self, entry: en.Entry) -> list[EntryErrorMessage]:
+        self.tests.append((entry, getattr(entry, "verify_id", None) or ""))
+        return []
+
+    def finish(self, all_ids: set[str]) -> list[EntryErrorMessage]:
+        messages: list[EntryErrorMessage] = []
+        for entry, verify_id in self.tests:
+            if not verify_id:
+                messages.append(
+                    EntryErrorMessage(entry, "Test must have attribute verify_id")
+                )
+            elif verify_id not in all_ids:
                 messages.append(
                     EntryErrorMessage(
-                        entry,
-                        "Definitions can only have definitions or expanders as children",
+                        entry, f"Test refers to an unvalid id: verify_id={verify_id}"
                     )
                 )
+        return messages
+
+
+def create_all_rules() -> list[Rule]:
+    """Create all existing rules, in the order of their messages"""
+    return [
+        EntryAttributesNonNullRule(),
+        DefinitionIdMandatoryRule(),
+        StatementIdMandatoryRule(),
+        IdUniqueRule(),
+        IdValidRule(),
+        IdSpecRule(),
+        IdReqRule(),
+        LinksRule(),
+        ChildStatementsRule(),
+        ChildDefinitionRule(),
+        ChildTestListRule(),
+        TestVerifyIdMandatoryRule(),
+    ]
+
+
+def check_all_rules(
+    entry: en.Entry, index: Optional[op.DesignIndex] = None
+) -> list[EntryErrorMessage]:
+    """Apply all existing rules to the entry and its children"""
+    return RuleEngine(create_all_rules()).check(entry, index)
 
-    return messages
 
+def check_entry_attributes_non_null(
+    entry_to_check: en.Entry, index: Optional[op.DesignIndex] = None
+) -> list[EntryErrorMessage]:
+    """Check rule spec-entry-attributes-non-null"""
+    return RuleEngine([EntryAttributesNonNullRule()]).check(entry_to_check, index)
 
-def check_child_test_list(entry_to_check: en.Entry) -> list[EntryErrorMessage]:
-    """Check rule spec-child-test-list"""
 
-    messages: list[EntryErrorMessage] = []
-    for entry in op.extract_entries_of_type(entry_to_check, en.TestList):
-        for child in entry.get_children():
-            if not isinstance(child, en.Test) and not isinstance(child, ex.Expander):
-                messages.append(
-                    EntryErrorMessage(entry, "TestList can only have tests as children")
-                )
+def check_definition_id_mandatory(
+    entry_to_check: en.Entry, index: Optional[op.DesignIndex] = None
+) -> list[EntryErrorMessage]:
+    """Check rule spec-definition-id-mandatory"""
+    return RuleEngine([DefinitionIdMandatoryRule()]).check(entry_to_check, index)
 
-    return messages
 
+def check_statement_id_mandatory(
+    entry_to_check: en.Entry, index: Optional[op.DesignIndex] = None
+) -> list[EntryErrorMessage]:
+    """Check rule spec-statement-id-mandatory"""
+    return RuleEngine([StatementIdMandatoryRule()]).check(entry_to_check, index)
 
-def check_test_verify_id_mandatory(design: en.Entry) -> list[EntryErrorMessage]:
-    """Check rule spec-test-statement-id"""
 
-    all_ids = op.gather_all_ids(design, en.Entry)
-    messages: list[EntryErrorMessage] = []
-    for entry in op.extract_entries_of_type(design, en.Test):
-        if not hasattr(entry, "verify_id") or not entry.verify_id:
-            messages.append(
-                EntryErrorMessage(
-                    entry,
-                    "Test must have attribute verify_id",
-                )
-            )
-        elif entry.verify_id not in all_ids:
-            messages.append(
-                EntryErrorMessage(
-                    entry,
-                    f"Test refers to an unvalid id: verify_id={entry.verify_id}",
-                )
-            )
+def check_id_unique(
+    entry_to_check: en.Entry, index: Optional[op.DesignIndex] = None
+) -> list[EntryErrorMessage]:
+    """Check rule spec-statement-id-unique"""
+    return RuleEngine([IdUniqueRule()]).check(entry_to_check, index)
+
+
+def check_id_valid(
+    entry_to_check: en.Entry, index: Optional[op.DesignIndex] = None
+) -> list[EntryErrorMessage]:
+    """Check rule spec-statement-id-valid"""
+    return RuleEngine([IdValidRule()]).check(entry_to_check, index)
+
+
+def check_id_spec(
+    entry_to_check: en.Entry, index: Optional[op.DesignIndex] = None
+) -> list[EntryErrorMessage]:
+    """Check rule spec-statement-id-spec"""
+    return RuleEngine([IdSpecRule()]).check(entry_to_check, index)
+
+
+def check_id_req(
+    entry_to_check: en.Entry, index: Optional[op.DesignIndex] = None
+) -> list[EntryErrorMessage]:
+    """Check rule spec-statement-id-req"""
+    return RuleEngine([IdReqRule()]).check(entry_to_check, index)
+
+
+def check_links(
+    entry_to_check: en.Entry, index: Optional[op.DesignIndex] = None
+) -> list[EntryErrorMessage]:
+    """Check rule spec-valid-links"""
+    return RuleEngine([LinksRule()]).check(entry_to_check, index)
+
 
-    return messages
+def check_child_statements(
+    entry_to_check: en.Entry, index: Optional[op.DesignIndex] = None
+) -> list[EntryErrorMessage]:
+    """Check rule spec-child-statement"""
+    return RuleEngine([ChildStatementsRule()]).check(entry_to_check, index)
+
+
+def check_child_definition(
+    entry_to_check: en.Entry, index: Optional[op.DesignIndex] = None
+) -> list[EntryErrorMessage]:
+    """Check rule spec-child-definition"""
+    return RuleEngine([ChildDefinitionRule()]).check(entry_to_check, index)
+
+
+def check_child_test_list(
+    entry_to_check: en.Entry, index: Optional[op.DesignIndex] = None
+) -> list[EntryErrorMessage]:
+    """Check rule spec-child-test-list"""
+    return RuleEngine([ChildTestListRule()]).check(entry_to_check, index)
+
+
+def check_test_verify_id_mandatory(
+    design: en.Entry, index: Optional[op.DesignIndex] = None
+) -> list[EntryErrorMessage]:
+    """Check rule spec-test-statement-id"""
+    return RuleEngine([TestVerifyIdMandatoryRule()]).check(design, index)
@@ -0,0 +1,271 @@
+"""Run python unittest tests in one interpreter and write the result of each test as a
+JSON line. Started by TestEnginePythonUnitTest: the ids of the tests and their
+timeouts are read from stdin (JSON). The outputs of a test are written in chunks as
+they are produced, then its result. This script must not import the other modules
+of requisite"""
+
+import argparse
+import io
+import json
+import os
+import signal
+import sys
+import time
+import unittest
+from typing import Any, Optional, TextIO
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None  # type: ignore
+
+# the timeouts rely on SIGALRM, not available on Windows
+HAS_TIMER = hasattr(signal, "setitimer")
+# number of characters of an output after which they are written as a JSON line
+OUTPUT_CHUNK_SIZE = 65536
+
+
+class TestTimeout(Exception):
+    """Raised in a test that runs for too long"""
+
+
+def raise_timeout(signum: int, frame: Any) -> None:
+    """Signal handler: stop the current test"""
+    raise TestTimeout(f"Test stopped by signal {signum} after its timeout")
+
+
+def to_kib(max_rss: int) -> int:
+    """Convert the peak memory given by getrusage to KiB"""
+    # in bytes on macOS, in KiB elsewhere
+    return max_rss // 1024 if sys.platform == "darwin" else max_rss
+
+
+def get_max_rss() -> int:
+    """Return the peak memory of this process so far, in KiB"""
+    if resource is None:
+        return 0
+    return to_kib(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+class StreamedOutput(io.StringIO):
+    """The stdout or stderr of a test: each chunk of OUTPUT_CHUNK_SIZE characters is
+    written as a JSON line {"id", "output", "data"}, only the rest is kept in memory"""
+
+    def __init__(self, result: "JsonTestResult", test_id: str, name: str):
+        super().__init__()
+        self.result = result
+        self.test_id = test_id
+        self.name = name
+
+    def write(self, text: str) -> int:
+        size = super().write(text)
+        if self.tell() >= OUTPUT_CHUNK_SIZE:
+            self.result.write(
+                {"id": self.test_id, "output": self.name, "data": self.getvalue()}
+            )
+            self.seek(0)
+            self.truncate()
+        return size
+
+
+class JsonTestResult(unittest.TestResult):  # pylint: disable=R0902
+    """Capture the output of each test and write its result once it is done"""
+
+    def __init__(
+        self,
+        output: TextIO,
+        test_ids: set[str],
+        timeouts: Optional[dict[str, float]] = None,
+    ):
+        super().__init__()
+        self.output = output
+        self.test_ids = test_ids
+        self.timeouts = timeouts or {}
+        self.status = ""
+        self.details = ""
+        self.date = 0.0
+        self.start = (0.0, 0.0)
+        self.stdout_buffer = io.StringIO()
+        self.stderr_buffer = io.StringIO()
+        # errors that do not belong to a requested test, e.g. in setUpClass
+        self.other_errors = ""
+
+    def startTest(self, test: unittest.TestCase) -> None:
+        super().startTest(test)
+        self.status = "success"
+        self.details = ""
+        self.stdout_buffer = StreamedOutput(self, test.id(), "stdout")
+        self.stderr_buffer = StreamedOutput(self, test.id(), "stderr")
+        sys.stdout = self.stdout_buffer
+        sys.stderr = self.stderr_buffer
+        self.date = time.time()
+        self.start = time.perf_counter(), time.process_time()
+        if HAS_TIMER and self.timeouts.get(test.id()):
+            signal.setitimer(signal.ITIMER_REAL, self.timeouts[test.id()])
+
+    def stopTest(self, test: unittest.TestCase) -> None:
+        if HAS_TIMER:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        duration = time.perf_counter() - self.start[0]
+        cpu_time = time.process_time() - self.start[1]
+        sys.stdout = sys.__stdout__
+        sys.stderr = sys.__stderr__
+        self.write(
+            {
+                "id": test.id(),
+                "result": self.status,
+                "date": self.date,
+                "duration": duration,
+                "cpu_time": cpu_time,
+                # of the interpreter so far, the previous tests included
+                "max_rss": get_max_rss(),
+                "stdout": self.stdout_buffer.getvalue(),
+                "stderr": self.stderr_buffer.getvalue() + self.details,
+            }
+        )
+        super().stopTest(test)
+
+    def write(self, data: dict[str, Any]) -> None:
+        """Write one JSON line, immediately"""
+        self.output.write(json.dumps(data) + "\n")
+        self.output.flush()
+
+    def set_status(self, test: Any, status: str, details: str) -> None:
+        """Record the status of a test, or an error outside of the requested tests"""
+        if test.id() in self.test_ids:
+            self.status = status
+            self.details += details
+        else:
+            self.other_errors += f"{test.id()}:\n{details}"
+
+    def addError(self, test: Any, err: Any) -> None:
+        super().addError(test, err)
+        status = "timeout" if issubclass(err[0], TestTimeout) else "failed"
+        self.set_status(test, status, self.errors[-1][1])
+
+    def addFailure(self, test: Any, err: Any) -> None:
+        super().addFailure(test, err)
+        self.set_status(test, "failed", self.failures[-1][1])
+
+    def addSkip(self, test: Any, reason: str) -> None:
+        super().addSkip(test, reason)
+        self.set_status(test, "skipped", f"skipped: {reason}\n")
+
+    def addUnexpectedSuccess(self, test: Any) -> None:
+        super().addUnexpectedSuccess(test)
+        self.set_status(test, "failed", "unexpected success\n")
+
+
+def run_suite(
+    suite: unittest.TestSuite,
+    output: TextIO,
+    test_ids: set[str],
+    timeouts: dict[str, float],
+) -> None:
+    """Run tests and write their results"""
+    result = JsonTestResult(output, test_ids, timeouts)
+    suite.run(result)
+    if result.other_errors:
+        result.write({"id": None, "stderr": result.other_errors})
+
+
+def wait_child(pid: int) -> tuple[int, float, int]:
+    """Wait for a child process, return its status, CPU time and peak memory"""
+    # the resources used by the child only
+    _, status, rusage = os.wait4(pid, 0)
+    return status, rusage.ru_utime + rusage.ru_stime, to_kib(rusage.ru_maxrss)
+
+
+def run_forked(  # pylint: disable=R0914
+    suite: unittest.TestSuite, output: TextIO, test_id: str, timeout: float
+) -> None:
+    """Run a test in a forked process: the modules are already imported, and the
+    test cannot modify the state of this process. The child is killed on timeout"""
+    read_fd, write_fd = os.pipe()
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read_fd)
+            if HAS_TIMER:
+                # the default action of SIGALRM terminates the child
+                signal.signal(signal.SIGALRM, signal.SIG_DFL)
+            with os.fdopen(write_fd, "w", encoding="utf-8") as child_output:
+                run_suite(suite, child_output, {test_id}, {test_id: timeout})
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    writer = JsonTestResult(output, set())
+    # the chunks of the outputs are passed on as they come, the result of the test
+    # waits for the resources used by the child
+    result = None
+    with os.fdopen(read_fd, encoding="utf-8") as child_output:
+        for line in child_output:
+            data = json.loads(line)
+            if data["id"] == test_id and "result" in data:
+                result = data
+            else:
+                writer.write(data)
+    status, cpu_time, max_rss = wait_child(pid)
+
+    if result is not None:
+        result["cpu_time"] = cpu_time
+        result["max_rss"] = max_rss
+        writer.write(result)
+    elif status != 0:
+        timed_out = os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGALRM
+        writer.write(
+            {
+                "id": test_id,
+                "result": "timeout" if timed_out else "failed",
+                "date": time.time(),
+                "duration": time.perf_counter() - start,
+                "cpu_time": cpu_time,
+                "max_rss": max_rss,
+                "stdout": "",
+                "stderr": f"The test process ended with status {status}\n",
+            }
+        )
+
+
+def main() -> None:
+    """Run the tests given on stdin"""
+    parser = argparse.ArgumentParser(description="Run python unittest tests")
+    parser.add_argument(
+        "--fork",
+        action="store_true",
+        help="Import all tests first, then run each test in a forked process",
+    )
+    args = parser.parse_args()
+
+    # the results have their own copy of stdout: anything written to the file
+    # descriptor of stdout (e.g. by a sub-process of a test) goes to stderr
+    sys.stdout.flush()
+    output = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+
+    tests = json.load(sys.stdin)
+    test_ids = [test["id"] for test in tests]
+    timeouts = {test["id"]: test["timeout"] for test in tests if test["timeout"]}
+    loader = unittest.defaultTestLoader
+    if args.fork and hasattr(os, "fork"):
+        # all test modules (and their dependencies) are imported once
+        suites = [loader.loadTestsFromName(test_id) for test_id in test_ids]
+        for test_id, suite in zip(test_ids, suites):
+            run_forked(suite, output, test_id, timeouts.get(test_id, 0.0))
+    else:
+        if HAS_TIMER:
+            signal.signal(signal.SIGALRM, raise_timeout)
+        suite = unittest.TestSuite()
+        for test_id in test_ids:
+            suite.addTest(loader.loadTestsFromName(test_id))
+        run_suite(suite, output, set(test_ids), timeouts)
+    output.close()
+
+
+if __name__ == "__main__":
+    # same as "python -m unittest": the tests are imported from the current
+    # directory, not from the directory of this script
+    sys.path[0] = os.getcwd()
+    main()
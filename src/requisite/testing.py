@@ -1,13 +1,23 @@
 """Code related to test execution"""
 
+import contextlib
+import copy
+import hashlib
+import heapq
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
-from typing import Tuple
+from typing import Callable, Iterable, Iterator, Optional, Sequence, TextIO, Tuple
 
 import entries as en
 import misc_util as mu
 import operations as op
+import yaml_util as yu
 
 
 class TestResult(Enum):
@@ -16,16 +26,32 @@ class TestResult(Enum):
     SUCCESS = "success"
     SKIPPED = "skipped"
     FAILED = "failed"
+    TIMEOUT = "timeout"
 
 
-class TestExecution(en.Entry):
+class TestExecution(en.Entry):  # pylint: disable=R0902
     """The execution of a test"""
 
     short_type = "ex"
     yaml_tag = "!TestExecution"
+    # hash of the inputs of the test, to decide if the next release can reuse it
+    input_hash = ""
+    # True if the result was carried forward from a previous release
+    reused = False
+    # files of the full outputs, relative to the release, if only excerpts are kept
+    stdout_file = ""
+    stderr_file = ""
 
-    def __init__(
-        self, test_id: str, date: str, result: TestResult, stdout: str, stderr: str
+    def __init__(  # pylint: disable=R0913
+        self,
+        test_id: str,
+        date: str,
+        result: TestResult,
+        stdout: str,
+        stderr: str,
+        wall_time: float = 0.0,
+        cpu_time: float = 0.0,
+        max_rss: int = 0,
     ):
         super().__init__("", "", [])
         self.test_id = test_id
@@ -33,6 +59,26 @@ class TestExecution(en.Entry):
         self.result = result.value
         self.stdout = stdout
         self.stderr = stderr
+        # times in seconds, peak memory in KiB (0 if unknown)
+        self.wall_time = round(wall_time, 3)
+        self.cpu_time = round(cpu_time, 3)
+        self.max_rss = max_rss
+
+    def get_wall_time(self) -> float:
+        """Return the duration of the test, 0 if unknown"""
+        return getattr(self, "wall_time", 0.0)
+
+    def set_outputs(self, captures: Sequence[mu.OutputCapture]) -> None:
+        """Set stdout and stderr from their captures, with the references to their
+        files if they were written, relative to the parent of their directory"""
+        self.stdout, self.stderr = (capture.get_text() for capture in captures)
+        for name, capture in zip(["stdout_file", "stderr_file"], captures):
+            if capture.is_spilled() and capture.path is not None:
+                setattr(
+                    self,
+                    name,
+                    capture.path.relative_to(capture.path.parent.parent).as_posix(),
+                )
 
 
 class TestListExecution(en.Entry):
@@ -40,6 +86,8 @@ class TestListExecution(en.Entry):
 
     short_type = "lex"
     yaml_tag = "!TestListExecution"
+    # "i/N" if only the shard i of N of the tests ran
+    shard = ""
 
     def __init__(
         self,
@@ -54,44 +102,642 @@ class TestListExecution(en.Entry):
         self.result = result.value
 
 
+OUTPUT_EXTENSIONS = {"gzip": ".gz", "lzma": ".xz"}
+
+
+@dataclass
+class RunContext:
+    """What the tests of a run share: the budget of tests running at the same time
+    (None for no limit) and the directory of the files of the long outputs (None to
+    keep the full outputs in the executions)"""
+
+    budget: Optional[threading.Semaphore] = None
+    output_directory: Optional[Path] = None
+
+
 class TestEngine(en.Entry):
     """The test engine parent: subclass it to define how to run a test list"""
 
     short_type = "ten"
     yaml_tag = "!TestEngine"
+    # engines that cannot run several tests at the same time must set it to False
+    supports_parallel = True
+    # default timeout of the tests in seconds (0 for none), the engines that can
+    # stop a test kill it after the timeout
+    timeout: float = 0
+    # number of bytes kept at the head and at the tail of the outputs longer than
+    # twice this size, the full outputs being written to compressed files of the
+    # release (0 to keep the full outputs in the executions)
+    output_excerpt = 0
+    # compression of these files: "gzip" or "lzma"
+    output_compression = "gzip"
 
     def __init__(self, id1: str, text: str) -> None:
         super().__init__(id1, text, [])
 
     def run_test_list(
-        self, test_list: en.TestList, design_path: Path
+        self, test_list: en.TestList, design_path: Path, max_workers: int = 1
     ) -> list[TestExecution]:
         """Run the tests of a test list"""
-        results: list[TestExecution] = []
-        for test in op.extract_entries_of_type(test_list, en.Test):
-            timestamp = mu.datetime_to_string(datetime.now())
-            result, stdout, stderr = self.run_test(test, design_path)
-            results.append(
-                TestExecution(test.get_id(), timestamp, result, stdout, stderr)
+        return self.run_tests(
+            list(op.iter_entries(test_list, en.Test)), design_path, max_workers
+        )
+
+    def run_tests(
+        self,
+        tests: Sequence[en.Test],
+        design_path: Path,
+        max_workers: int = 1,
+        context: Optional[RunContext] = None,
+    ) -> list[TestExecution]:
+        """Run tests, concurrently if possible. The executions are in the order of
+        the tests, whatever the order of completion"""
+        return list(self.iter_tests(tests, design_path, max_workers, context))
+
+    def iter_tests(
+        self,
+        tests: Sequence[en.Test],
+        design_path: Path,
+        max_workers: int = 1,
+        context: Optional[RunContext] = None,
+    ) -> Iterator[TestExecution]:
+        """Run tests, concurrently if possible, and yield each execution as soon as
+        it and the previous ones are done. Each test takes a slot of the budget of
+        the run, shared with other test lists, while it runs"""
+        budget = context.budget if context is not None else None
+
+        def run_one_test(test: en.Test) -> TestExecution:
+            with budget or contextlib.nullcontext():
+                return self.execute_test(test, design_path, context)
+
+        # the tests run in sub-processes or wait for them: threads are enough
+        return mu.imap_ordered(
+            run_one_test, tests, max_workers if self.supports_parallel else 1
+        )
+
+    def execute_test(
+        self, test: en.Test, design_path: Path, context: Optional[RunContext] = None
+    ) -> TestExecution:
+        """Run one test and measure its duration. Engines that can measure more
+        (CPU time, memory), enforce the timeout or stream the outputs override it"""
+        timestamp = mu.datetime_to_string(datetime.now())
+        start = time.perf_counter()
+        result, stdout, stderr = self.run_test(test, design_path)
+        execution = TestExecution(
+            test.get_id(), timestamp, result, "", "", time.perf_counter() - start
+        )
+        execution.set_outputs(
+            self.capture_outputs(test.get_id(), [stdout, stderr], context)
+        )
+        return execution
+
+    def create_captures(
+        self, test_id: str, context: Optional[RunContext] = None
+    ) -> list[mu.OutputCapture]:
+        """Create the captures of stdout and stderr of a test, following the
+        capture policy of the engine"""
+        if (
+            not self.output_excerpt
+            or context is None
+            or context.output_directory is None
+        ):
+            return [mu.OutputCapture(), mu.OutputCapture()]
+        if self.output_compression not in OUTPUT_EXTENSIONS:
+            raise Exception(f"Unknown output compression {self.output_compression}")
+        extension = OUTPUT_EXTENSIONS[self.output_compression]
+        return [
+            mu.OutputCapture(
+                context.output_directory / f"{test_id}.{name}{extension}",
+                self.output_excerpt,
             )
-        return results
+            for name in ["stdout", "stderr"]
+        ]
+
+    def capture_outputs(
+        self,
+        test_id: str,
+        outputs: Sequence[str],
+        context: Optional[RunContext] = None,
+    ) -> list[mu.OutputCapture]:
+        """Capture stdout and stderr already in memory"""
+        captures = self.create_captures(test_id, context)
+        for capture, output in zip(captures, outputs):
+            capture.write(output.encode("utf-8"))
+            capture.close()
+        return captures
+
+    def get_common_inputs(  # pylint: disable=W0613
+        self, design_path: Path
+    ) -> list[str]:
+        """Describe the inputs shared by all tests of the engine: its configuration.
+        Engines that know the code under test add it"""
+        return [
+            type(self).__name__,
+            json.dumps(vars(self), sort_keys=True, default=repr),
+        ]
+
+    def get_test_inputs(  # pylint: disable=W0613
+        self, test: en.Test, design_path: Path
+    ) -> list[str]:
+        """Describe the inputs of one test. Engines that know the source of the test
+        add it"""
+        return [json.dumps(vars(test), sort_keys=True, default=repr)]
+
+    def get_timeout(self, test: en.Test) -> Optional[float]:
+        """Return the timeout of a test in seconds: its own or the one of the engine"""
+        return float(test.timeout or self.timeout) or None
 
     def run_test(self, test: en.Test, design_path: Path) -> Tuple[TestResult, str, str]:
         """Run one test"""
         raise NotImplementedError()
 
 
-def run_all_test_lists(design: en.Design) -> list[TestListExecution]:
-    """Run all the test lists"""
+def hash_inputs(inputs: Sequence[str]) -> str:
+    """Return the hash of the descriptions of the inputs of a test"""
+    digest = hashlib.sha256()
+    for description in inputs:
+        digest.update(description.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def get_input_hashes(
+    test_list: en.TestList, tests: Sequence[en.Test], index: op.DesignIndex
+) -> list[str]:
+    """Return the hash of the inputs of each test: the configuration of the engine,
+    the test, its source and the text of the statement it verifies"""
+    design_path = index.design.get_file_path()
+    engine = test_list.engine
+    common_inputs = engine.get_common_inputs(design_path)
+    input_hashes = []
+    for test in tests:
+        statement = index.get_entry(test.verify_id) if test.verify_id else None
+        input_hashes.append(
+            hash_inputs(
+                common_inputs
+                + engine.get_test_inputs(test, design_path)
+                + [statement.text if statement is not None else ""]
+            )
+        )
+    return input_hashes
+
+
+def select_shard(
+    tests: Sequence[en.Test],
+    shard: tuple[int, int],
+    durations: Optional[dict[str, float]] = None,
+) -> list[en.Test]:
+    """Return the tests of the shard i of N (from 1 to N), in their order. The
+    partition is deterministic: if durations are known (by test id), the longest
+    tests are assigned first, each to the least loaded shard, else the tests are
+    dealt one after the other"""
+    shard_index, shard_count = shard
+    known = {
+        test_id: duration
+        for test_id, duration in (durations or {}).items()
+        if duration > 0
+    }
+    if not known:
+        return [
+            test
+            for position, test in enumerate(tests)
+            if position % shard_count == shard_index - 1
+        ]
+
+    # the new tests are expected to take the mean duration
+    default_duration = sum(known.values()) / len(known)
+    test_durations = [known.get(test.get_id(), default_duration) for test in tests]
+    loads = [0.0] * shard_count
+    selected = set()
+    for position in sorted(
+        range(len(tests)), key=lambda position: (-test_durations[position], position)
+    ):
+        least_loaded = min(range(shard_count), key=lambda i: (loads[i], i))
+        loads[least_loaded] += test_durations[position]
+        if least_loaded == shard_index - 1:
+            selected.add(position)
+    return [test for position, test in enumerate(tests) if position in selected]
+
+
+def iter_changed_tests(  # pylint: disable=R0913
+    test_list: en.TestList,
+    index: op.DesignIndex,
+    max_workers: int = 1,
+    previous_executions: Optional[dict[str, TestExecution]] = None,
+    context: Optional[RunContext] = None,
+    shard: Optional[tuple[int, int]] = None,
+) -> Iterator[TestExecution]:
+    """Run the tests of a test list (or of one of its shards), except the ones
+    whose inputs did not change since their previous successful (or skipped)
+    execution: these executions are reused. The executions are yielded in the
+    order of the tests, as soon as they are done"""
+    tests = list(op.iter_entries(test_list, en.Test))
+    previous_executions = previous_executions or {}
+    if shard is not None:
+        tests = select_shard(
+            tests,
+            shard,
+            {
+                test_id: execution.get_wall_time()
+                for test_id, execution in previous_executions.items()
+            },
+        )
+    input_hashes = get_input_hashes(test_list, tests, index)
+
+    reused: list[Optional[TestExecution]] = []
+    for test, input_hash in zip(tests, input_hashes):
+        execution = previous_executions.get(test.get_id())
+        if (
+            execution is not None
+            and execution.input_hash == input_hash
+            and execution.result in (TestResult.SUCCESS.value, TestResult.SKIPPED.value)
+        ):
+            execution.reused = True
+            reused.append(execution)
+        else:
+            reused.append(None)
+    nb_reused = len(tests) - reused.count(None)
+    if nb_reused:
+        print(f"Reuse {nb_reused} unchanged test results of {test_list.get_id()}")
+
+    new_executions = test_list.engine.iter_tests(
+        [test for test, execution in zip(tests, reused) if execution is None],
+        index.design.get_file_path(),
+        max_workers,
+        context,
+    )
+    for execution, input_hash in zip(reused, input_hashes):
+        if execution is None:
+            execution = next(new_executions, None)
+            if execution is None:
+                raise Exception(f"Missing test executions in {test_list.get_id()}")
+            execution.input_hash = input_hash
+        yield execution
+
+
+class ExecutionListener:
+    """Receive the test executions as soon as they are done. The test list
+    executions keep their test executions unless keep_executions is False. The
+    methods are called from the threads of the test lists"""
+
+    keep_executions = True
+
+    def start_test_list(self, test_list_execution: TestListExecution) -> None:
+        """Called before the first test of a test list"""
+
+    def add_execution(
+        self, test_list_execution: TestListExecution, execution: TestExecution
+    ) -> None:
+        """Called after each test, in the order of the tests of the test list"""
+
+    def finish_test_list(self, test_list_execution: TestListExecution) -> None:
+        """Called after the last test of a test list"""
+
+
+def run_all_test_lists(  # pylint: disable=R0913
+    design: en.Design,
+    max_workers: int = 1,
+    previous_executions: Optional[dict[str, dict[str, TestExecution]]] = None,
+    total_workers: int = 0,
+    listener: Optional[ExecutionListener] = None,
+    shard: Optional[tuple[int, int]] = None,
+    output_directory: Optional[Path] = None,
+) -> list[TestListExecution]:
+    """Run all the test lists, or the shard i of N of each of them. The number of
+    concurrent tests is set by the test list, else by max_workers. The unchanged
+    tests of the previous executions (by test list id and test id) are not run
+    again, and their durations balance the shards.
+    If total_workers is set, the test lists run at the same time (except the ones
+    of the same exclusive group) and total_workers limits the number of tests run
+    by all of them together. The listener receives each execution as soon as it
+    is done. The long outputs are written to the output directory if the engine
+    keeps excerpts only. The executions are in the order of the test lists"""
+    index = op.DesignIndex(design)
+    test_lists = index.get_entries_of_type(en.TestList)
+    previous_executions = previous_executions or {}
+    listener = listener or ExecutionListener()
+    budget = threading.Semaphore(total_workers) if total_workers > 0 else None
+    context = RunContext(budget, output_directory)
+    group_locks = {
+        test_list.exclusive_group: threading.Lock()
+        for test_list in test_lists
+        if test_list.exclusive_group
+    }
+
+    def run_test_list(test_list: en.TestList) -> TestListExecution:
+        assert listener is not None
+        with group_locks.get(test_list.exclusive_group, contextlib.nullcontext()):
+            # the result is set once the tests are done
+            test_list_execution = TestListExecution(
+                test_list.get_id(),
+                mu.datetime_to_string(datetime.now()),
+                [],
+                TestResult.SKIPPED,
+            )
+            if shard is not None:
+                test_list_execution.shard = f"{shard[0]}/{shard[1]}"
+            listener.start_test_list(test_list_execution)
+            # the results only: the listener may not keep the executions
+            results: set[str] = set()
+            for execution in iter_changed_tests(
+                test_list,
+                index,
+                test_list.max_workers or max_workers,
+                previous_executions.get(test_list.get_id()),
+                context,
+                shard,
+            ):
+                if listener.keep_executions:
+                    test_list_execution.children.append(execution)
+                listener.add_execution(test_list_execution, execution)
+                results.add(execution.result)
+            test_list_execution.result = get_aggregate_result(results).value
+        listener.finish_test_list(test_list_execution)
+        return test_list_execution
+
+    if budget is None or len(test_lists) <= 1:
+        return [run_test_list(test_list) for test_list in test_lists]
+    # the threads of the test lists only wait for their tests
+    with ThreadPoolExecutor(min(len(test_lists), total_workers)) as executor:
+        return list(executor.map(run_test_list, test_lists))
+
+
+@dataclass
+class TestListProgress:
+    """The number of executions of a test list by result"""
+
+    test_list_id: str
+    done: bool = False
+    counts: dict[str, int] = field(default_factory=dict)
+
+
+class ReleaseWriter(ExecutionListener):  # pylint: disable=R0902
+    """Append each execution to the file of its test list as soon as it is done, so
+    that a crash loses nothing. Only the progress and the slowest executions are
+    kept in memory, whatever the number of tests. on_progress is called at most
+    every progress_interval seconds while the tests run"""
+
+    keep_executions = False
+
+    def __init__(
+        self,
+        release_directory: Path,
+        on_progress: Optional[Callable[["ReleaseWriter"], None]] = None,
+        progress_interval: float = 10.0,
+        slowest_count: int = 10,
+    ):
+        self.release_directory = release_directory
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.slowest_count = slowest_count
+        self.lock = threading.Lock()
+        self.files: dict[str, TextIO] = {}
+        self.progress: dict[str, TestListProgress] = {}
+        # heap of (wall time, number, execution): the fastest is the first
+        self.slowest: list[tuple[float, int, TestExecution]] = []
+        self.nb_executions = 0
+        self.last_progress = time.monotonic()
+
+    def get_path(self, test_list_id: str) -> Path:
+        """Return the path of the file of a test list execution"""
+        return self.release_directory / (test_list_id + ".yaml")
+
+    def start_test_list(self, test_list_execution: TestListExecution) -> None:
+        fout = open(  # pylint: disable=R1732
+            self.get_path(test_list_execution.test_list_id), "w", encoding="utf-8"
+        )
+        # the children, written one by one, are the last field but the result, known
+        # once the tests are done
+        header = copy.copy(test_list_execution)
+        header.result = ""
+        yu.write_entry_to_stream(fout, header)
+        fout.write("children:\n")
+        fout.flush()
+        with self.lock:
+            self.files[test_list_execution.test_list_id] = fout
+            self.progress[test_list_execution.test_list_id] = TestListProgress(
+                test_list_execution.test_list_id
+            )
+
+    def add_execution(
+        self, test_list_execution: TestListExecution, execution: TestExecution
+    ) -> None:
+        fout = self.files[test_list_execution.test_list_id]
+        yu.write_entry_to_stream(fout, execution, as_item=True)
+        fout.flush()
+        with self.lock:
+            counts = self.progress[test_list_execution.test_list_id].counts
+            counts[execution.result] = counts.get(execution.result, 0) + 1
+            self.nb_executions += 1
+            item = (execution.get_wall_time(), self.nb_executions, execution)
+            if len(self.slowest) < self.slowest_count:
+                heapq.heappush(self.slowest, item)
+            elif item[:2] > self.slowest[0][:2]:
+                heapq.heapreplace(self.slowest, item)
+            report_progress = (
+                time.monotonic() - self.last_progress >= self.progress_interval
+            )
+            if report_progress:
+                self.last_progress = time.monotonic()
+        if report_progress and self.on_progress is not None:
+            self.on_progress(self)
+
+    def finish_test_list(self, test_list_execution: TestListExecution) -> None:
+        with self.lock:
+            fout = self.files.pop(test_list_execution.test_list_id)
+            self.progress[test_list_execution.test_list_id].done = True
+        # the key at column 0 ends the block sequence of the children
+        fout.write(f"result: {test_list_execution.result}\n")
+        fout.close()
+
+    def get_progress(self) -> list[TestListProgress]:
+        """Return the progress of the test lists started so far"""
+        with self.lock:
+            return [
+                TestListProgress(
+                    progress.test_list_id, progress.done, dict(progress.counts)
+                )
+                for progress in self.progress.values()
+            ]
+
+    def get_slowest_executions(self) -> list[TestExecution]:
+        """Return the slowest executions so far, slowest first"""
+        with self.lock:
+            return [item[2] for item in sorted(self.slowest, reverse=True)]
+
+
+def read_test_list_executions(release_directory: Path) -> list[TestListExecution]:
+    """Read the test list executions of a release"""
     test_list_executions = []
-    for entry in op.extract_entries_of_type(design, en.TestList):
-        test_executions = entry.engine.run_test_list(entry, design.get_file_path())
+    for path in sorted(release_directory.glob("*.yaml")):
+        if path.name == "expanded_design.yaml":
+            continue
+        entry = yu.read_object(en.Entry, path)
+        if isinstance(entry, TestListExecution):
+            test_list_executions.append(entry)
+    return test_list_executions
+
+
+def read_release_executions(
+    release_directory: Path,
+) -> dict[str, dict[str, TestExecution]]:
+    """Read the test executions of a release, by test list id and test id. The
+    files of their outputs are referred to by their absolute paths, to be reused
+    in other releases"""
+    previous_executions: dict[str, dict[str, TestExecution]] = {}
+    for test_list_execution in read_test_list_executions(release_directory):
+        executions = previous_executions[test_list_execution.test_list_id] = {}
+        for execution in op.iter_entries(test_list_execution, TestExecution):
+            for name in ["stdout_file", "stderr_file"]:
+                if getattr(execution, name):
+                    setattr(
+                        execution,
+                        name,
+                        (release_directory / getattr(execution, name))
+                        .resolve()
+                        .as_posix(),
+                    )
+            executions[execution.test_id] = execution
+    return previous_executions
+
+
+def get_aggregate_result(results: Iterable[str]) -> TestResult:
+    """Return the result of a test list from the results of its test executions:
+    failed if any test failed or timed out, success otherwise"""
+    if any(
+        result in (TestResult.FAILED.value, TestResult.TIMEOUT.value)
+        for result in results
+    ):
+        return TestResult.FAILED
+    return TestResult.SUCCESS
+
+
+def get_results(executions: Iterable[en.Entry]) -> Iterator[str]:
+    """Return the results of the test executions among the entries"""
+    return (
+        execution.result
+        for execution in executions
+        if isinstance(execution, TestExecution)
+    )
+
+
+def merge_test_list_executions(
+    design: en.Design, shard_executions: Sequence[Sequence[TestListExecution]]
+) -> list[TestListExecution]:
+    """Merge the test list executions of the shards of a release, in the order of
+    the test lists and of their tests in the design"""
+    executions_by_id: dict[str, dict[str, TestExecution]] = {}
+    for test_list_executions in shard_executions:
+        for test_list_execution in test_list_executions:
+            executions = executions_by_id.setdefault(
+                test_list_execution.test_list_id, {}
+            )
+            for execution in op.iter_entries(test_list_execution, TestExecution):
+                if execution.test_id in executions:
+                    raise Exception(
+                        f"Test {execution.test_id} of test list "
+                        f"{test_list_execution.test_list_id} is in several shards"
+                    )
+                executions[execution.test_id] = execution
+
+    test_list_executions = []
+    for test_list in op.iter_entries(design, en.TestList):
+        if test_list.get_id() not in executions_by_id:
+            continue
+        executions = executions_by_id.pop(test_list.get_id())
+        merged: list[en.Entry] = [
+            executions.pop(test.get_id())
+            for test in op.iter_entries(test_list, en.Test)
+            if test.get_id() in executions
+        ]
+        # the tests removed from the design since then are kept at the end
+        merged += executions.values()
         test_list_executions.append(
             TestListExecution(
-                entry.get_id(),
+                test_list.get_id(),
                 mu.datetime_to_string(datetime.now()),
-                test_executions,
-                TestResult.SKIPPED,  # TODO
+                merged,
+                get_aggregate_result(get_results(merged)),
+            )
+        )
+    for test_list_id, executions in executions_by_id.items():
+        print(f"WARNING: test list {test_list_id} not in design")
+        test_list_executions.append(
+            TestListExecution(
+                test_list_id,
+                mu.datetime_to_string(datetime.now()),
+                list(executions.values()),
+                get_aggregate_result(get_results(executions.values())),
             )
         )
     return test_list_executions
+
+
+def rerun_failed_tests(
+    test_list_execution: TestListExecution,
+    index: op.DesignIndex,
+    max_workers: int = 1,
+    output_directory: Optional[Path] = None,
+) -> int:
+    """Run again the failed (or timed out) tests of a test list execution and replace
+    their executions in place, then its result. Return the number of tests run"""
+    failed_positions = {
+        execution.test_id: position
+        for position, execution in enumerate(test_list_execution.get_children())
+        if isinstance(execution, TestExecution)
+        and execution.result in (TestResult.FAILED.value, TestResult.TIMEOUT.value)
+    }
+    if not failed_positions:
+        return 0
+    test_list = index.get_entry(test_list_execution.test_list_id)
+    if not isinstance(test_list, en.TestList):
+        print(f"WARNING: test list {test_list_execution.test_list_id} not in design")
+        return 0
+
+    tests = [
+        test
+        for test in op.iter_entries(test_list, en.Test)
+        if test.get_id() in failed_positions
+    ]
+    missing = set(failed_positions) - {test.get_id() for test in tests}
+    for test_id in sorted(missing):
+        print(f"WARNING: test {test_id} not in test list {test_list.get_id()}")
+    print(f"Run again {len(tests)} failed tests of {test_list.get_id()}")
+
+    executions = test_list.engine.run_tests(
+        tests,
+        index.design.get_file_path(),
+        test_list.max_workers or max_workers,
+        RunContext(output_directory=output_directory),
+    )
+    input_hashes = get_input_hashes(test_list, tests, index)
+    for execution, input_hash in zip(executions, input_hashes):
+        execution.input_hash = input_hash
+        test_list_execution.children[failed_positions[execution.test_id]] = execution
+    test_list_execution.result = get_aggregate_result(
+        get_results(test_list_execution.get_children())
+    ).value
+    return len(executions)
+
+
+def get_slowest_executions(
+    test_list_executions: Sequence[TestListExecution], count: int = 10
+) -> list[TestExecution]:
+    """Return the test executions that took the most time, slowest first"""
+    executions = [
+        execution
+        for test_list_execution in test_list_executions
+        for execution in op.iter_entries(test_list_execution, TestExecution)
+    ]
+    executions.sort(key=lambda execution: execution.get_wall_time(), reverse=True)
+    return executions[:count]
+
+
+def print_slowest_executions(executions: Sequence[TestExecution]) -> None:
+    """Print a summary of the slowest tests, given slowest first"""
+    print(f"Slowest {len(executions)} tests:")
+    for execution in executions:
+        print(
+            f"  {execution.get_wall_time():8.3f} s  {execution.result:8}"
+            f"  {execution.test_id}"
+        )
@@ -1,7 +1,7 @@
 """Verification of design"""
 
 from enum import Enum
-from typing import Sequence
+from typing import Optional, Sequence
 import entries as en
 import operations as op
 
@@ -16,10 +16,12 @@ class VerificationType(Enum):
 class Verifier:
     """Object that contains the verification information of the design"""
 
-    def __init__(self, design: en.Design):
-        self.verified_ids = [
-            test.verify_id for test in op.extract_entries_of_type(design, en.Test)
-        ]
+    def __init__(self, design: en.Design, index: Optional[op.DesignIndex] = None):
+        self.index = index if index is not None else op.DesignIndex(design)
+        self.verified_ids = {
+            test.verify_id
+            for test in op.extract_entries_of_type(design, en.Test, self.index)
+        }
 
     def verify(self, statement: en.Statement) -> Sequence[VerificationType]:
         """Verify a statement"""
@@ -32,10 +34,10 @@ class Verifier:
 
     def list_verified(self, design: en.Entry) -> Sequence[en.Statement]:
         """List all verified statements"""
-        all_statements = op.extract_entries_of_type(design, en.Statement)
+        all_statements = op.extract_entries_of_type(design, en.Statement, self.index)
         return [statement for statement in all_statements if self.verify(statement)]
 
     def list_unverified(self, design: en.Entry) -> Sequence[en.Statement]:
         """List all verified statements"""
-        all_statements = op.extract_entries_of_type(design, en.Statement)
+        all_statements = op.extract_entries_of_type(design, en.Statement, self.index)
         return [statement for statement in all_statements if not self.verify(statement)]
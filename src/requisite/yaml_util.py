@@ -1,7 +1,8 @@
 """Utilities for YAML file format"""
 
+import os
 from pathlib import Path
-from typing import cast, TypeVar
+from typing import Any, cast, Optional, TextIO, TypeVar, Union
 
 import yaml
 import entries as en
@@ -9,10 +10,47 @@ import entries as en
 T = TypeVar("T")
 
 
+def represent_entry(dumper: Any, entry: en.Entry) -> yaml.Node:
+    """Represent any entry with its own tag"""
+    return cast(yaml.Node, type(entry).to_yaml(dumper, entry))
+
+
+# pure Python implementation: the entries register themselves in yaml.Dumper
+PureLoader: Any = yaml.SafeLoader
+PureDumper: Any = yaml.Dumper
+
+if yaml.__with_libyaml__:
+
+    class CEntryDumper(yaml.CDumper):  # pylint: disable=R0901
+        """Dumper based on libyaml that can write entries"""
+
+    CEntryDumper.add_multi_representer(en.Entry, represent_entry)
+
+    # libyaml is much faster: use it when available
+    EntryLoader: Any = yaml.CSafeLoader
+    EntryDumper: Any = CEntryDumper
+else:
+    EntryLoader = PureLoader
+    EntryDumper = PureDumper
+
+
+def load_yaml(stream: Any, loader: Any = None) -> Any:
+    """Load a YAML document from a string or a stream"""
+    return yaml.load(stream, Loader=loader or EntryLoader)
+
+
+def dump_yaml(data: Any, stream: Optional[TextIO] = None, dumper: Any = None) -> Any:
+    """Dump data to a stream, or to a string if no stream is given"""
+    # so far we set a very high line width
+    return yaml.dump(
+        data, stream, Dumper=dumper or EntryDumper, width=1000, sort_keys=False
+    )  # , default_style="|"))
+
+
 def read_object(_: type[T], path: Path) -> T:
     """Read a full design document in YAML format"""
     with open(path, encoding="utf-8") as fin:
-        obj = yaml.safe_load(fin.read())
+        obj = load_yaml(fin)
         # note: always keep the path for later
         obj.file_path = path.as_posix()
         return cast(T, obj)
@@ -20,32 +58,137 @@ def read_object(_: type[T], path: Path) -> T:
 
 def read_object_from_string(_: type[T], str1: str) -> T:
     """Read a full design document in YAML format"""
-    return cast(T, yaml.safe_load(str1))
+    return cast(T, load_yaml(str1))
 
 
 def load_object(_: type[T], str_value: str) -> T:
     """Read a full design document in YAML format"""
-    return cast(T, yaml.safe_load(str_value))
+    return cast(T, load_yaml(str_value))
 
 
 def read_objects(_: type[T], path: Path) -> list[T]:
     """Read a list of entries in YAML format"""
     with open(path, encoding="utf-8") as fin:
-        return cast(list[T], yaml.safe_load(fin.read()))
+        return cast(list[T], load_yaml(fin))
 
 
 def dump_entry(entry: en.Entry) -> str:
     """Dump and entry to a string"""
-    # so far we set a very high line width
-    return cast(
-        str, yaml.dump(entry, width=1000, sort_keys=False)
-    )  # , default_style="|"))
-
-
-def write_entry(path: Path, design: en.Entry) -> None:
-    """Write a full full design or entry in YAML format"""
-
-    design.simplify()
+    return cast(str, dump_yaml(entry))
+
+
+def emit_node(dumper: Any, root_node: yaml.Node) -> None:
+    """Emit the events of a node, as the serializer would do (but without aliases)"""
+    stack: list[Union[yaml.Node, yaml.Event]] = [root_node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, yaml.Event):
+            dumper.emit(node)
+        elif isinstance(node, yaml.ScalarNode):
+            detected_tag = dumper.resolve(yaml.ScalarNode, node.value, (True, False))
+            default_tag = dumper.resolve(yaml.ScalarNode, node.value, (False, True))
+            implicit = (node.tag == detected_tag), (node.tag == default_tag)
+            dumper.emit(
+                yaml.ScalarEvent(None, node.tag, implicit, node.value, style=node.style)
+            )
+        elif isinstance(node, yaml.SequenceNode):
+            implicit = node.tag == dumper.resolve(yaml.SequenceNode, node.value, True)
+            dumper.emit(
+                yaml.SequenceStartEvent(
+                    None, node.tag, implicit, flow_style=node.flow_style
+                )
+            )
+            stack.append(yaml.SequenceEndEvent())
+            stack += reversed(node.value)
+        else:
+            assert isinstance(node, yaml.MappingNode)
+            implicit = node.tag == dumper.resolve(yaml.MappingNode, node.value, True)
+            dumper.emit(
+                yaml.MappingStartEvent(
+                    None, node.tag, implicit, flow_style=node.flow_style
+                )
+            )
+            stack.append(yaml.MappingEndEvent())
+            for key, value in reversed(node.value):
+                stack += [value, key]
+
+
+def emit_data(dumper: Any, data: Any) -> None:
+    """Represent any data and emit its events"""
+    emit_node(dumper, dumper.represent_data(data))
+    # do not keep the represented objects in memory
+    dumper.represented_objects = {}
+    dumper.object_keeper = []
+    dumper.alias_key = None
+
+
+def emit_entry(dumper: Any, root_entry: en.Entry) -> None:
+    """Emit the events of an entry and its children, skipping the empty fields.
+    This gives the same output as simplify() followed by a dump"""
+    # the stack contains entries, events and fields (name, value)
+    stack: list[Union[en.Entry, yaml.Event, tuple[str, Any]]] = [root_entry]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, yaml.Event):
+            dumper.emit(item)
+        elif isinstance(item, tuple):
+            name, value = item
+            emit_data(dumper, name)
+            if name == "children":
+                dumper.emit(yaml.SequenceStartEvent(None, None, True, flow_style=False))
+                stack.append(yaml.SequenceEndEvent())
+                stack += reversed(value)
+            else:
+                emit_data(dumper, value)
+        else:
+            dumper.emit(
+                yaml.MappingStartEvent(None, item.yaml_tag, False, flow_style=False)
+            )
+            stack.append(yaml.MappingEndEvent())
+            stack += reversed(
+                [(name, value) for name, value in item.__dict__.items() if value]
+            )
+
+
+def write_entry_to_stream(
+    fout: TextIO, entry: en.Entry, dumper_class: Any = None, as_item: bool = False
+) -> None:
+    """Write an entry in YAML format to an open file, skipping the empty fields. As
+    an item, the entry is written as an item of a block sequence: the items written
+    one after the other after a key form a list"""
+    dumper = (dumper_class or EntryDumper)(
+        fout, default_flow_style=False, width=1000, sort_keys=False
+    )
+    try:
+        dumper.open()
+        dumper.emit(yaml.DocumentStartEvent(explicit=False))
+        if as_item:
+            dumper.emit(yaml.SequenceStartEvent(None, None, True, flow_style=False))
+        emit_entry(dumper, entry)
+        if as_item:
+            dumper.emit(yaml.SequenceEndEvent())
+        dumper.emit(yaml.DocumentEndEvent(explicit=False))
+        dumper.close()
+    finally:
+        dumper.dispose()
+
+
+def write_entry(path: Path, design: en.Entry, dumper_class: Any = None) -> None:
+    """Write a full full design or entry in YAML format. The YAML events are streamed
+    to the file and the empty fields are skipped: the entry is not modified"""
 
     with open(path, "w", encoding="utf-8") as fout:
-        fout.write(dump_entry(design))
+        write_entry_to_stream(fout, design, dumper_class)
+
+
+def write_entry_atomically(path: Path, entry: en.Entry) -> None:
+    """Write an entry in YAML format through a temporary file in the same directory:
+    the readers see the previous or the new file, never a partial one"""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        write_entry(tmp_path, entry)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if tmp_path.exists():
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,100 @@
+"""Unit test for the cache of the expanded design"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import cache as ca
+import entries as en
+import expanders as ex
+import yaml_util as yu
+
+
+class TestCache(unittest.TestCase):
+    """Test"""
+
+    def test_design_cache(self) -> None:
+        """Test"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data_dir = Path(tmp_dir) / "include"
+            shutil.copytree("data/include", data_dir)
+            setup_path = Path(tmp_dir) / "setup.py"
+            setup_path.write_text("import expanders\n", encoding="utf-8")
+            design_path = data_dir / "input.yaml"
+
+            def expand_and_store(design_cache: ca.DesignCache) -> en.Design:
+                design = yu.read_object(en.Design, design_path)
+                context = ex.ExpansionContext()
+                design.expand(design, None, context)
+                self.assertEqual(context.inputs, [(data_dir / "input1a.yaml", [])])
+                self.assertTrue(design_cache.store(design, context.inputs))
+                return design
+
+            design_cache = ca.DesignCache(
+                Path(tmp_dir) / "cache", design_path, setup_path
+            )
+            self.assertIsNone(design_cache.load())
+            design = expand_and_store(design_cache)
+
+            cached_design = design_cache.load()
+            assert cached_design is not None
+            self.assertEqual(yu.dump_entry(cached_design), yu.dump_entry(design))
+
+            # any change in an included file invalidates the cache
+            with open(data_dir / "input1a.yaml", "a", encoding="utf-8") as fout:
+                fout.write("\n- !Entry\n  id: id-new\n")
+            self.assertIsNone(design_cache.load())
+            design = expand_and_store(design_cache)
+            cached_design = design_cache.load()
+            assert cached_design is not None
+            self.assertIn("id-new", yu.dump_entry(cached_design))
+
+            # as well as a change in the setup file
+            setup_path.write_text("import entries\n", encoding="utf-8")
+            self.assertIsNone(design_cache.load())
+
+    def test_hash_path(self) -> None:
+        """Test"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir)
+            (path / "a.py").write_text("a = 1\n", encoding="utf-8")
+            (path / "b.txt").write_text("b\n", encoding="utf-8")
+            hash_py = ca.hash_path(path, ["py"])
+            hash_all = ca.hash_path(path, [])
+
+            (path / "b.txt").write_text("c\n", encoding="utf-8")
+            self.assertEqual(ca.hash_path(path, ["py"]), hash_py)
+            self.assertNotEqual(ca.hash_path(path, []), hash_all)
+            self.assertEqual(ca.hash_path(path / "missing", []), "missing")
+
+    def test_tree_cache(self) -> None:
+        """Test"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "src"
+            path.mkdir()
+            (path / "a.cpp").write_text("void a();\n", encoding="utf-8")
+            cache_dir = Path(tmp_dir) / "cache"
+            tree_cache = ca.TreeCache(cache_dir, "name", path, "parameters")
+            self.assertIsNone(tree_cache.load())
+            tree_cache.store(["value"])
+            self.assertEqual(tree_cache.load(), ["value"])
+
+            # touched but unchanged files keep the value
+            os.utime(path / "a.cpp", ns=(0, 0))
+            hash_stats = ca.hash_path_stats(path, [])
+            self.assertEqual(tree_cache.load(), ["value"])
+            with open(tree_cache.manifest_path, encoding="utf-8") as fin:
+                self.assertEqual(json.load(fin)["stats_hash"], hash_stats)
+
+            # other parameters, or a change in a file, invalidate the value
+            other_cache = ca.TreeCache(cache_dir, "name", path, "other parameters")
+            self.assertIsNone(other_cache.load())
+            (path / "b.cpp").write_text("void b();\n", encoding="utf-8")
+            self.assertIsNone(tree_cache.load())
+
+
+if __name__ == "__main__":
+    unittest.main()
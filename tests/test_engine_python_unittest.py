@@ -0,0 +1,301 @@
+"""Unit test for the python unittest engine"""
+
+import io
+import json
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import entries as en
+import engine_python_unittest as epu
+import misc_util as mu
+import runner_python_unittest as rpu
+import testing as te
+
+SAMPLE_TESTS = """import sys
+import unittest
+
+
+class TestSample(unittest.TestCase):
+    def test_success(self):
+        print("some output")
+        print("some error", file=sys.stderr)
+
+    def test_failure(self):
+        self.fail("boom")
+
+    def test_skip(self):
+        self.skipTest("not now")
+
+    def test_error(self):
+        raise ValueError("error")
+"""
+
+CRASH_TESTS = """import os
+import unittest
+
+
+class TestCrash(unittest.TestCase):
+    def test_crash(self):
+        os._exit(3)
+
+    def test_success(self):
+        pass
+"""
+
+SLOW_TESTS = """import time
+import unittest
+
+
+class TestSlow(unittest.TestCase):
+    def test_slow(self):
+        time.sleep(10)
+
+    def test_fast(self):
+        pass
+"""
+
+STREAMED_TESTS = """import time
+import unittest
+
+
+class TestStreamed(unittest.TestCase):
+    def test_fast(self):
+        pass
+
+    def test_slow(self):
+        time.sleep(2)
+"""
+
+VERBOSE_TESTS = """import unittest
+
+
+class TestVerbose(unittest.TestCase):
+    def test_verbose(self):
+        for i in range(10000):
+            print(f"line {i}")
+"""
+
+TEST_IDS = [
+    "sample_tests.TestSample.test_success",
+    "sample_tests.TestSample.test_failure",
+    "sample_tests.TestSample.test_skip",
+    "sample_tests.TestSample.test_error",
+    "missing_tests.TestMissing.test_missing",
+]
+
+
+class TestEnginePythonUnitTest(unittest.TestCase):
+    """Test"""
+
+    def run_sample_tests(
+        self, engine: epu.TestEnginePythonUnitTest, max_workers: int
+    ) -> list[te.TestExecution]:
+        """Run the sample tests with the engine"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(Path(tmp_dir) / "sample_tests.py", "w", encoding="utf-8") as fout:
+                fout.write(SAMPLE_TESTS)
+            tests = [
+                en.Test(test_id, "", en.TestType.AUTOMATIC, "spec-1")
+                for test_id in TEST_IDS
+            ]
+            return engine.run_tests(tests, Path(tmp_dir) / "design.yaml", max_workers)
+
+    def check_executions(self, executions: list[te.TestExecution]) -> None:
+        """Check the executions of the sample tests in batch or fork mode"""
+        self.assertEqual([execution.test_id for execution in executions], TEST_IDS)
+        self.assertEqual(
+            [execution.result for execution in executions],
+            [
+                te.TestResult.SUCCESS.value,
+                te.TestResult.FAILED.value,
+                te.TestResult.SUCCESS.value,
+                te.TestResult.FAILED.value,
+                te.TestResult.FAILED.value,
+            ],
+        )
+        self.assertEqual(executions[0].stdout, "some output\n")
+        self.assertEqual(executions[0].stderr, "some error\n")
+        self.assertIn("AssertionError: boom", executions[1].stderr)
+        # a skipped test succeeds, as in process mode
+        self.assertIn("skipped: not now", executions[2].stderr)
+        self.assertIn("ValueError: error", executions[3].stderr)
+        self.assertIn("missing_tests", executions[4].stderr)
+
+    def test_batch_mode(self) -> None:
+        """Test"""
+        engine = epu.TestEnginePythonUnitTest("engine", "", Path("."), [])
+        engine.mode = "batch"
+        for max_workers in [1, 2]:
+            self.check_executions(self.run_sample_tests(engine, max_workers))
+
+    def test_batch_mode_streaming(self) -> None:
+        """Test that the executions are yielded as soon as each test is done"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(
+                Path(tmp_dir) / "streamed_tests.py", "w", encoding="utf-8"
+            ) as fout:
+                fout.write(STREAMED_TESTS)
+            engine = epu.TestEnginePythonUnitTest("engine", "", Path("."), [])
+            engine.mode = "batch"
+            tests = [
+                en.Test(
+                    f"streamed_tests.TestStreamed.{name}", "", en.TestType.AUTOMATIC, ""
+                )
+                for name in ["test_fast", "test_slow"]
+            ]
+            executions = engine.iter_tests(tests, Path(tmp_dir) / "design.yaml")
+            first_execution = next(executions)
+            start = time.perf_counter()
+            self.assertEqual(first_execution.test_id, tests[0].get_id())
+            self.assertEqual(
+                [execution.test_id for execution in executions], [tests[1].get_id()]
+            )
+            # the fast test was given while the slow test was running
+            self.assertGreater(time.perf_counter() - start, 1)
+
+    def test_fork_mode(self) -> None:
+        """Test"""
+        engine = epu.TestEnginePythonUnitTest("engine", "", Path("."), [])
+        engine.mode = "fork"
+        engine.workers = 2
+        engine.recycle_after = 2
+        with mock.patch.object(
+            engine, "run_batch", wraps=engine.run_batch
+        ) as run_batch:
+            self.check_executions(self.run_sample_tests(engine, 1))
+        # 5 tests, at most 2 per interpreter
+        self.assertEqual(run_batch.call_count, 3)
+
+    def test_fork_mode_crash(self) -> None:
+        """Test"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(Path(tmp_dir) / "crash_tests.py", "w", encoding="utf-8") as fout:
+                fout.write(CRASH_TESTS)
+            engine = epu.TestEnginePythonUnitTest("engine", "", Path("."), [])
+            engine.mode = "fork"
+            tests = [
+                en.Test(f"crash_tests.TestCrash.{name}", "", en.TestType.AUTOMATIC, "")
+                for name in ["test_crash", "test_success"]
+            ]
+            executions = engine.run_tests(tests, Path(tmp_dir) / "design.yaml")
+        self.assertEqual(
+            [execution.result for execution in executions],
+            [te.TestResult.FAILED.value, te.TestResult.SUCCESS.value],
+        )
+        self.assertIn("ended with status", executions[0].stderr)
+
+    def test_process_mode(self) -> None:
+        """Test"""
+        engine = epu.TestEnginePythonUnitTest("engine", "", Path("."), [])
+        executions = self.run_sample_tests(engine, 2)
+        self.assertEqual([execution.test_id for execution in executions], TEST_IDS)
+        self.assertEqual(
+            [execution.result for execution in executions],
+            [
+                te.TestResult.SUCCESS.value,
+                te.TestResult.FAILED.value,
+                te.TestResult.SUCCESS.value,
+                te.TestResult.FAILED.value,
+                te.TestResult.FAILED.value,
+            ],
+        )
+        self.assertEqual(executions[0].stdout, "some output\n")
+
+    def test_timeout(self) -> None:
+        """Test"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(Path(tmp_dir) / "slow_tests.py", "w", encoding="utf-8") as fout:
+                fout.write(SLOW_TESTS)
+            tests = [
+                en.Test(f"slow_tests.TestSlow.{name}", "", en.TestType.AUTOMATIC, "")
+                for name in ["test_slow", "test_fast"]
+            ]
+            # the timeout of the test has priority over the one of the engine
+            tests[0].timeout = 0.5
+            for mode in ["process", "batch", "fork"]:
+                engine = epu.TestEnginePythonUnitTest("engine", "", Path("."), [])
+                engine.mode = mode
+                engine.timeout = 20
+                executions = engine.run_tests(tests, Path(tmp_dir) / "design.yaml")
+                self.assertEqual(
+                    [execution.result for execution in executions],
+                    [te.TestResult.TIMEOUT.value, te.TestResult.SUCCESS.value],
+                    mode,
+                )
+                self.assertGreaterEqual(executions[0].wall_time, 0.5)
+                self.assertLess(executions[0].wall_time, 5)
+                self.assertGreater(executions[1].max_rss, 0)
+
+    def test_output_excerpt(self) -> None:
+        """Test"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(
+                Path(tmp_dir) / "verbose_tests.py", "w", encoding="utf-8"
+            ) as fout:
+                fout.write(VERBOSE_TESTS)
+            tests = [
+                en.Test(
+                    "verbose_tests.TestVerbose.test_verbose",
+                    "",
+                    en.TestType.AUTOMATIC,
+                    "",
+                )
+            ]
+            output_directory = Path(tmp_dir) / "release" / "outputs"
+            # the output is longer than a chunk of the runner
+            for mode, compression in [
+                ("process", "gzip"),
+                ("batch", "lzma"),
+                ("fork", "gzip"),
+            ]:
+                engine = epu.TestEnginePythonUnitTest("engine", "", Path("."), [])
+                engine.mode = mode
+                engine.output_excerpt = 100
+                engine.output_compression = compression
+                execution = engine.run_tests(
+                    tests,
+                    Path(tmp_dir) / "design.yaml",
+                    context=te.RunContext(output_directory=output_directory),
+                )[0]
+                self.assertTrue(execution.stdout.startswith("line 0\nline 1\n"))
+                self.assertTrue(execution.stdout.endswith("line 9999\n"))
+                self.assertLess(len(execution.stdout), 300)
+
+                extension = te.OUTPUT_EXTENSIONS[compression]
+                self.assertEqual(
+                    execution.stdout_file,
+                    f"outputs/verbose_tests.TestVerbose.test_verbose.stdout{extension}",
+                )
+                self.assertEqual(execution.stderr_file, "")
+                with mu.OUTPUT_OPENERS[extension](
+                    output_directory.parent / execution.stdout_file, "rt"
+                ) as fin:
+                    self.assertEqual(
+                        fin.read(), "".join(f"line {i}\n" for i in range(10000))
+                    )
+
+    def test_streamed_output(self) -> None:
+        """Test that the runner writes the long outputs in chunks"""
+        output = io.StringIO()
+        result = rpu.JsonTestResult(output, set())
+        stdout = rpu.StreamedOutput(result, "test_id", "stdout")
+        line = "x" * 1000 + "\n"
+        for _ in range(100):
+            stdout.write(line)
+        chunks = [json.loads(chunk) for chunk in output.getvalue().splitlines()]
+        self.assertEqual(len(chunks), 100 * len(line) // rpu.OUTPUT_CHUNK_SIZE)
+        self.assertEqual(
+            {(chunk["id"], chunk["output"]) for chunk in chunks},
+            {("test_id", "stdout")},
+        )
+        self.assertLess(len(stdout.getvalue()), rpu.OUTPUT_CHUNK_SIZE)
+        self.assertEqual(
+            "".join(chunk["data"] for chunk in chunks) + stdout.getvalue(), line * 100
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
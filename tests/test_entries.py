@@ -1,5 +1,7 @@
 """Unit test for doxygen test extraction"""
 
+import io
+import sys
 import unittest
 
 import entries as en
@@ -61,3 +63,41 @@ class TestDesignUtil(unittest.TestCase):
             ).extract_links(),
             ["many", "links", "totally-correct"],
         )
+
+    def test_deep_design(self) -> None:
+        """Test that deep designs do not reach the recursion limit"""
+        depth = 3 * sys.getrecursionlimit()
+        design = en.Design("design", "", [])
+        entry: en.Entry = design
+        for i in range(depth):
+            entry.children = [en.Statement(f"spec-{i}", "", [])]
+            entry = entry.children[0]
+
+        design.expand(design, None)
+        output = io.StringIO()
+        design.print(output)
+        self.assertEqual(len(output.getvalue().splitlines()), depth + 1)
+        design.simplify()
+        self.assertFalse(hasattr(entry, "children"))
+
+    def test_clone(self) -> None:
+        """Test"""
+        leaf = en.Statement("spec-leaf", "Leaf", [])
+        statement = en.Requirement("req-1", "Some text", [leaf])
+        clone = statement.clone()
+
+        self.assertIsInstance(clone, en.Requirement)
+        self.assertIsNot(clone, statement)
+        self.assertIsNot(clone.children, statement.children)
+        self.assertIsNot(clone.children[0], leaf)
+        self.assertIsNot(clone.children[0].children, leaf.children)
+        self.assertEqual(clone.children[0].__dict__, leaf.__dict__)
+
+        clone.id += "-copy"
+        clone.children[0].children.append(en.Statement("spec-new", "", []))
+        self.assertEqual(statement.id, "req-1")
+        self.assertEqual(leaf.children, [])
+
+        clone = statement.clone(with_children=False)
+        self.assertEqual(clone.children, [])
+        self.assertEqual(statement.children, [leaf])
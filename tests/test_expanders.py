@@ -1,14 +1,25 @@
 """Unit test for expander classes"""
 
+import tempfile
 from pathlib import Path
+from unittest import mock
 
+import entries as en
 import expanders
+import operations as op
+import yaml_util as yu
 import common_test as ct
 
 _ = expanders.Expander
 del _
 
 
+def write_file(path: Path, text: str) -> None:
+    """Write a text file"""
+    with open(path, "w", encoding="utf-8") as fout:
+        fout.write(text)
+
+
 class TestExpanders(ct.TestCommon):
     """Test"""
 
@@ -19,3 +30,110 @@ class TestExpanders(ct.TestCommon):
     def test_multiply_by_definition(self) -> None:
         """Test"""
         self.parse_and_compare(Path("data/multiply_by_definition"))
+
+    def test_preload_includes(self) -> None:
+        """Test"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir)
+            nb_files = expanders.MIN_FILES_FOR_PROCESS_POOL + 1
+            write_file(
+                path / "input.yaml",
+                "!Design\nid: design\nchildren:\n"
+                + "".join(
+                    f"- !Include\n  path: input{i}.yaml\n" for i in range(nb_files)
+                ),
+            )
+            for i in range(nb_files):
+                # nested includes are relative to the design, as all paths
+                write_file(
+                    path / f"input{i}.yaml",
+                    f"- !Entry\n  id: id{i}\n  children:\n"
+                    f"  - !Include\n    path: nested{i}.yaml\n",
+                )
+                write_file(path / f"nested{i}.yaml", f"- !Entry\n  id: nested{i}\n")
+
+            design = yu.read_object(en.Design, path / "input.yaml")
+            context = expanders.ExpansionContext()
+            context.preload_includes(design)
+            self.assertEqual(len(context.parsed_includes), 2 * nb_files)
+
+            design.expand(design, None, context)
+            self.assertEqual(context.parsed_includes, {})
+            self.assertEqual(
+                [entry.get_id() for entry in op.iter_entries(design, en.Entry)],
+                ["design"]
+                + [id1 for i in range(nb_files) for id1 in (f"id{i}", f"nested{i}")],
+            )
+
+    def test_include_cycle(self) -> None:
+        """Test"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir)
+            write_file(
+                path / "input.yaml",
+                "!Design\nid: design\nchildren:\n- !Include\n  path: input1.yaml\n",
+            )
+            write_file(path / "input1.yaml", "- !Include\n  path: input2.yaml\n")
+            write_file(path / "input2.yaml", "- !Include\n  path: input1.yaml\n")
+
+            design = yu.read_object(en.Design, path / "input.yaml")
+            with self.assertRaisesRegex(Exception, "Cycle in included files"):
+                design.expand(design, None)
+
+    def test_repeated_include(self) -> None:
+        """Test"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir)
+            write_file(
+                path / "input.yaml",
+                "!Design\nid: design\nchildren:\n"
+                + "- !Include\n  path: input1.yaml\n" * 2,
+            )
+            write_file(
+                path / "input1.yaml",
+                "- !Entry\n  id: id1\n  children:\n"
+                + "  - !Include\n    path: input2.yaml\n" * 2,
+            )
+            write_file(path / "input2.yaml", "- !Entry\n  id: id2\n")
+
+            design = yu.read_object(en.Design, path / "input.yaml")
+            context = expanders.ExpansionContext()
+            with mock.patch.object(
+                expanders, "read_include_file", wraps=expanders.read_include_file
+            ) as read_include_file:
+                design.expand(design, None, context)
+            # each file is parsed once, whatever the number of uses
+            self.assertEqual(read_include_file.call_count, 2)
+            self.assertEqual(
+                [entry.get_id() for entry in op.iter_entries(design, en.Entry)],
+                ["design"] + ["id1", "id2", "id2"] * 2,
+            )
+            entries = list(op.iter_entries(design, en.Entry))
+            self.assertEqual(len({id(entry) for entry in entries}), len(entries))
+            self.assertEqual(context.parsed_includes, {})
+
+    def test_expansion_context_index(self) -> None:
+        """Test"""
+        design = en.Design("design", "", [en.Statement("id1", "", [])])
+        context = expanders.ExpansionContext()
+        all_ids = context.get_all_ids(design, en.Statement)
+        self.assertEqual(all_ids, ["id1"])
+
+        # the ids are computed again only if statements are added
+        definition = en.Definition("def1", "", [en.Definition("def2", "", [])])
+        design.children.append(definition)
+        context.add_entries([definition], design)
+        self.assertIs(context.get_all_ids(design, en.Statement), all_ids)
+        self.assertIs(
+            context.find_entry_by_type_and_id(design, en.Definition, "def2"),
+            definition.children[0],
+        )
+
+        statement = en.Statement("id2", "", [])
+        design.children.append(statement)
+        context.add_entries([statement], design)
+        self.assertEqual(context.get_all_ids(design, en.Statement), ["id1", "id2"])
+
+        # entries added elsewhere than the design invalidate the index
+        context.add_entries([en.Statement("id3", "", [])], statement)
+        self.assertIsNone(context.index)
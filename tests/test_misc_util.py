@@ -1,7 +1,9 @@
 """Test for misc util"""
 
+import tempfile
 import unittest
 import subprocess
+import time
 from datetime import datetime
 from pathlib import Path
 from typing import Sequence
@@ -107,6 +109,128 @@ class TestMiscUtil(unittest.TestCase):
         # only fails on Windows
         # self.assertRaises(Exception, failing1)
 
+    def test_imap_ordered(self) -> None:
+        """Test"""
+
+        def wait(duration: float) -> float:
+            time.sleep(duration)
+            return duration
+
+        durations = [0.05, 0.01, 0.03, 0.0, 0.02]
+        for max_workers in [1, 2, 8]:
+            self.assertEqual(
+                list(mu.imap_ordered(wait, durations, max_workers)), durations
+            )
+        # the items are consumed as the results are needed
+        items = iter(range(100))
+        results = mu.imap_ordered(lambda item: item, items, 2)
+        self.assertEqual(next(results), 0)
+        self.assertEqual(len(list(items)), 96)
+
+    def test_output_capture(self) -> None:
+        """Test"""
+        data = b"".join(b"%d\n" % i for i in range(1000))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # short outputs are kept
+            capture = mu.OutputCapture(Path(tmp_dir) / "short.gz", 10)
+            capture.write(b"short\n")
+            capture.close()
+            self.assertFalse(capture.is_spilled())
+            self.assertEqual(capture.get_text(), "short\n")
+
+            for extension in [".gz", ".xz"]:
+                path = Path(tmp_dir) / f"output{extension}"
+                capture = mu.OutputCapture(path, 10)
+                for i in range(0, len(data), 7):
+                    capture.write(data[i : i + 7])
+                capture.close()
+                self.assertTrue(capture.is_spilled())
+                excerpt = capture.get_excerpt()
+                self.assertTrue(excerpt.startswith(data[:10] + b"\n[... "))
+                self.assertTrue(excerpt.endswith(b" ...]\n" + data[-10:]))
+                self.assertIn(b"%d bytes omitted" % (len(data) - 20), excerpt)
+                with mu.OUTPUT_OPENERS[extension](path, "rb") as fin:
+                    self.assertEqual(fin.read(), data)
+
+            # without excerpt size, the full output is kept
+            capture = mu.OutputCapture(Path(tmp_dir) / "full.gz")
+            capture.write(data)
+            self.assertEqual(capture.get_excerpt(), data)
+            self.assertFalse((Path(tmp_dir) / "full.gz").exists())
+
+    def test_line_capture(self) -> None:
+        """Test"""
+        lines: list[bytes] = []
+
+        def on_line(line: bytes) -> None:
+            if line == b"error":
+                raise ValueError(line)
+            lines.append(line)
+
+        capture = mu.LineCapture(on_line)
+        for data in [b"a", b"b\nc", b"\n\nd\ne", b"nd"]:
+            capture.write(data)
+        self.assertEqual(lines, [b"ab", b"c", b"", b"d"])
+        capture.close()
+        self.assertEqual(lines, [b"ab", b"c", b"", b"d", b"end"])
+        self.assertEqual(capture.get_excerpt(), b"")
+
+        # the lines after an error are ignored
+        capture = mu.LineCapture(on_line)
+        capture.write(b"error\nnext\n")
+        self.assertIsInstance(capture.error, ValueError)
+        self.assertEqual(len(lines), 5)
+
+    def test_run_measured_with_captures(self) -> None:
+        """Test"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            captures = [
+                mu.OutputCapture(Path(tmp_dir) / "stdout.gz", 100),
+                mu.OutputCapture(Path(tmp_dir) / "stderr.gz", 100),
+            ]
+            process = mu.run_measured(
+                [
+                    mu.get_python_executable().as_posix(),
+                    "-c",
+                    "import sys; print('x' * 100000); print('error', file=sys.stderr)",
+                ],
+                Path(tmp_dir),
+                captures=captures,
+            )
+            self.assertEqual(process.returncode, 0)
+            self.assertLess(len(process.stdout), 300)
+            self.assertEqual(process.stderr, b"error\n")
+            self.assertEqual(
+                [capture.is_spilled() for capture in captures], [True, False]
+            )
+
+    def test_run_measured_timeout(self) -> None:
+        """Test"""
+        # a sub-process that keeps the outputs open is killed with the command
+        start = time.perf_counter()
+        process = mu.run_measured(
+            [
+                mu.get_python_executable().as_posix(),
+                "-c",
+                "import subprocess, sys, time\n"
+                "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\n"
+                "time.sleep(30)",
+            ],
+            Path("."),
+            timeout=1,
+        )
+        self.assertTrue(process.timed_out)
+        self.assertLess(time.perf_counter() - start, 10)
+
+        # the timeout only applies to the processes that are still running
+        process = mu.run_measured(
+            [mu.get_python_executable().as_posix(), "-c", "print('done')"],
+            Path("."),
+            timeout=10,
+        )
+        self.assertFalse(process.timed_out)
+        self.assertEqual((process.returncode, process.stdout), (0, b"done\n"))
+
     def test_run_on_all_files(self) -> None:
         """Execute a command on all files using git and xargs"""
 
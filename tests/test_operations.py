@@ -84,3 +84,100 @@ class TestOperations(unittest.TestCase):
             op.find_entry_by_type_and_id(design, en.Statement, "test-design-review")
 
         self.assertRaises(Exception, failing)
+
+    def test_design_index(self) -> None:
+        """Test function"""
+        design = yu.load_object(en.Entry, DESIGN_STR1)
+        index = op.DesignIndex(design)
+
+        for entry_class in [en.Entry, en.Design, en.Statement, en.Test, en.TestList]:
+            self.assertEqual(
+                index.get_entries_of_type(entry_class),
+                op.extract_entries_of_type(design, entry_class),
+            )
+            self.assertEqual(
+                op.extract_entries_of_type(design, entry_class, index),
+                op.extract_entries_of_type(design, entry_class),
+            )
+        self.assertEqual(
+            index.get_all_ids(en.Statement), op.gather_all_ids(design, en.Statement)
+        )
+
+        test = op.find_entry_by_type_and_id(
+            design, en.Test, "test-design-review", index
+        )
+        self.assertEqual(test.verify_id, "req-design-review")
+        self.assertIs(index.get_entry("test-design-review"), test)
+        self.assertIsNone(index.get_entry("unexisting-id"))
+        self.assertRaises(
+            Exception,
+            index.find_entry_by_type_and_id,
+            en.Statement,
+            "test-design-review",
+        )
+
+        test_list = index.get_parent(test)
+        assert test_list is not None
+        self.assertEqual(test_list.get_id(), "tests-system")
+        self.assertEqual(index.get_depth(test), 3)
+        self.assertIsNone(index.get_parent(design))
+        self.assertEqual(index.get_depth(design), 0)
+
+    def test_design_index_add_entries(self) -> None:
+        """Test function"""
+        design = yu.load_object(en.Entry, DESIGN_STR1)
+        index = op.DesignIndex(design)
+
+        new_statement = en.Requirement(
+            "req-new", "", [en.Specification("spec-new", "", [])]
+        )
+        design.children.append(new_statement)
+        index.add_entries([new_statement], design)
+
+        self.assertEqual(
+            index.get_entries_of_type(en.Statement),
+            op.extract_entries_of_type(design, en.Statement),
+        )
+        self.assertIs(index.get_entry("spec-new"), new_statement.children[0])
+        self.assertEqual(index.get_depth(new_statement.children[0]), 2)
+
+        # the lists by type would not be in the order of the design
+        self.assertTrue(index.is_last_subtree(new_statement))
+        self.assertFalse(index.is_last_subtree(design.children[0]))
+        new_spec = en.Specification("spec-other", "", [])
+        design.children[0].children.append(new_spec)
+        with self.assertRaises(AssertionError):
+            index.add_entries([new_spec], design.children[0])
+        with self.assertRaises(AssertionError):
+            index.add_entries([design.children[0]], design)
+
+    def test_iter_entries(self) -> None:
+        """Test function"""
+        design = yu.load_object(en.Entry, DESIGN_STR1)
+
+        self.assertEqual(
+            list(op.iter_entries(design, en.Statement)),
+            op.extract_entries_of_type(design, en.Statement),
+        )
+        self.assertEqual(
+            [
+                entry.get_id()
+                for entry in op.iter_entries(design, en.Entry, op.TraversalOrder.POST)
+            ],
+            [
+                "spec-input-design",
+                "spec-design-split",
+                "req-design-review",
+                "spec-design-output-yaml",
+                "spec-design-output-markdown",
+                "req-design-output",
+                "test-design-review",
+                "tests-system",
+                "",
+                "design-requisite",
+            ],
+        )
+
+        iterator = op.iter_entries(design, en.Statement)
+        self.assertEqual(next(iterator).id, "req-design-review")
+        self.assertEqual(next(iterator).id, "spec-input-design")
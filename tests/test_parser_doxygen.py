@@ -1,9 +1,26 @@
 """Unit test for doxygen test extraction"""
 
+import tempfile
 from pathlib import Path
+from typing import cast
 
 from parser_doxygen import extract_tests_from_functions
+import cache as ca
 import common_test as ct
+import entries as en
+import expanders as ex
+import parser_doxygen as pd
+
+EXPECTED_TESTS = [
+    ("test1-simplest-cpp-test1a", "req-1a"),
+    ("test1-simplest-cpp-test1b", "req-1b"),
+    ("test1-simplest-cpp-test2a", "req-2a"),
+    ("test1-simplest-cpp-test2b", "req-2b"),
+    ("subdir-test2-simplest-cpp-test3a", "req-3a"),
+    ("subdir-test2-simplest-cpp-test3b", "req-3b"),
+    ("subdir-test2-simplest-cpp-test4a", "req-4a"),
+    ("subdir-test2-simplest-cpp-test4b", "req-4b"),
+]
 
 
 class TestTestListFromDoxygen(ct.TestCommon):
@@ -55,3 +72,185 @@ class TestTestListFromDoxygen(ct.TestCommon):
         """Test"""
 
         self.parse_and_compare(Path("data/doxygen_tests"))
+
+    def test_extract_functions(self) -> None:
+        """Test the parsing of XML files generated by doxygen"""
+
+        functions = pd.extract_all_functions(
+            Path("data/doxygen_xml/test1-simplest_8cpp.xml")
+        )
+        self.assertEqual(
+            functions[0],
+            pd.Function(
+                "test1a", "req-1a", Path("/src/doxygen_tests/test1-simplest.cpp"), 7
+            ),
+        )
+        # the functions without statement are ignored
+        self.assertEqual(
+            [funct.name for funct in functions],
+            ["test1a", "test1b", "test2a", "test2b"],
+        )
+
+        self.assertTrue(
+            pd.has_verify_statement(Path("data/doxygen_xml/test2-simplest_8cpp.xml"))
+        )
+        # the list of statements does not count
+        self.assertFalse(pd.has_verify_statement(Path("data/doxygen_xml/verify.xml")))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            empty_path = Path(tmp_dir) / "empty.xml"
+            empty_path.touch()
+            self.assertFalse(pd.has_verify_statement(empty_path))
+            self.assertEqual(pd.extract_all_functions(empty_path), [])
+
+        # with one worker, the files are handled in this process: the function does
+        # not even need to be picklable
+        all_files = pd.get_all_xml_files(Path("data/doxygen_xml"))
+        self.assertGreaterEqual(len(all_files), ex.MIN_FILES_FOR_PROCESS_POOL)
+        self.assertEqual(
+            pd.map_files(lambda path: [], all_files, 1), [[]] * len(all_files)
+        )
+
+        # the results do not depend on the number of processes
+        for max_workers in [1, 2]:
+            all_tests = pd.functions_to_tests(
+                pd.extract_functions(Path("data/doxygen_xml"), max_workers),
+                Path("/src/doxygen_tests"),
+            )
+            self.assertEqual(
+                [(test.id, cast(en.Test, test).verify_id) for test in all_tests],
+                EXPECTED_TESTS,
+            )
+
+    def test_doxygen_cache(self) -> None:
+        """Test that doxygen does not run again for unchanged sources"""
+
+        path = Path("data/doxygen_tests")
+        # results of a previous run of doxygen on the sources
+        functions = [
+            pd.Function(
+                funct.name,
+                funct.verify_id,
+                path.resolve() / funct.file.relative_to("/src/doxygen_tests"),
+                funct.line,
+            )
+            for funct in pd.extract_functions(Path("data/doxygen_xml"))
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            ca.TreeCache(Path(tmp_dir), "doxygen", path, pd.get_doxyfile([path])).store(
+                functions
+            )
+            all_tests = pd.extract_tests_from_functions(path, 1, Path(tmp_dir))
+            self.assertEqual(
+                [(test.id, cast(en.Test, test).verify_id) for test in all_tests],
+                EXPECTED_TESTS,
+            )
+
+    def test_scan_source_file(self) -> None:
+        """Test the native backend"""
+
+        for max_workers in [1, 2]:
+            path = Path("data/doxygen_tests")
+            all_tests = pd.functions_to_tests(
+                pd.scan_sources(path, max_workers), path.resolve()
+            )
+            self.assertEqual(
+                [(test.id, cast(en.Test, test).verify_id) for test in all_tests],
+                EXPECTED_TESTS,
+            )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "test.hpp"
+            path.write_text(
+                """#include <string>
+#define CHECK(x) /* @verify req-macro */ x
+// @verify req-comment
+const char *text = "/// @verify req-string";
+
+class Test {
+  /** Checks all:
+   *  \\verify req-method
+   */
+  virtual void
+  check_all(int value = f(1)) const;
+
+  /// @verify req-attribute
+  int value;
+
+  //! @verify req-inline
+  int check_inline() { return 0; }
+};
+""",
+                encoding="utf-8",
+            )
+            self.assertEqual(
+                pd.scan_source_file(path),
+                [
+                    pd.Function("check_all", "req-method", path, 11),
+                    pd.Function("check_inline", "req-inline", path, 17),
+                ],
+            )
+
+    def test_native_backend(self) -> None:
+        """Test"""
+
+        design = en.Design("design", "", [])
+        design.file_path = "data/doxygen_tests/input.yaml"
+        expander = pd.ExtractTestsFromDoxygen("", "", [], Path("."))
+        expander.backend = "native"
+        all_tests = expander.create_entries(design, design, ex.ExpansionContext())
+        self.assertEqual(
+            [(test.id, cast(en.Test, test).verify_id) for test in all_tests],
+            EXPECTED_TESTS,
+        )
+
+        expander.backend = "other"
+        with self.assertRaises(Exception):
+            expander.create_entries(design, design, ex.ExpansionContext())
+
+    def test_split_sources(self) -> None:
+        """Test"""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir).resolve()
+            for name, size in [
+                ("a/a.hpp", 300),
+                ("a/a.cpp", 200),
+                ("a/sub/s.cpp", 100),
+                ("b/b1.cpp", 300),
+                ("c.cpp", 100),
+            ]:
+                (path / name).parent.mkdir(parents=True, exist_ok=True)
+                (path / name).write_text("x" * size, encoding="utf-8")
+            (path / "empty").mkdir()
+
+            self.assertEqual(pd.split_sources(path, 1), [[path]])
+            # the directories larger than a shard are split, but the files of a
+            # directory stay together
+            self.assertEqual(
+                pd.split_sources(path, 2),
+                [
+                    [path / "a/a.cpp", path / "a/a.hpp"],
+                    [path / "a/sub", path / "b", path / "c.cpp"],
+                ],
+            )
+            self.assertEqual(
+                pd.split_sources(path, 3),
+                [
+                    [path / "a/a.cpp", path / "a/a.hpp"],
+                    [path / "b"],
+                    [path / "a/sub", path / "c.cpp"],
+                ],
+            )
+            self.assertEqual(pd.split_sources(path / "empty", 2), [])
+
+    def test_sharded_doxygen(self) -> None:
+        """Test"""
+
+        path = Path("data/doxygen_tests")
+        self.assertEqual(
+            [
+                (test.id, cast(en.Test, test).verify_id)
+                for test in extract_tests_from_functions(path, 1, None, 2)
+            ],
+            EXPECTED_TESTS,
+        )
@@ -4,10 +4,10 @@ import unittest
 from typing import Any
 
 from entries import Entry
+import operations as op
 import rules as ru
 import yaml_util as yu
 
-
 TEST_ID_NON_NULL = """
 !Design
 id: design-requisite
@@ -455,3 +455,84 @@ class TestRules(unittest.TestCase):
                 )
             ],
         )
+
+    def test_check_all_rules_messages(self) -> None:
+        """Test the messages of several rules on the same design, in order"""
+        links_messages = [
+            ("44z", "Requirement", "ID contains invalid characters"),
+            ("asdf", "Specification", "ID of specification must start with 'spec-'"),
+            (
+                "req-format",
+                "Specification",
+                "ID of specification must start with 'spec-'",
+            ),
+            ("44z", "Requirement", "ID of requirement must start with 'req-'"),
+            ("one", "Requirement", "ID of requirement must start with 'req-'"),
+            ("req-format", "Specification", "Linked id 'Text' does not exist."),
+            ("req-abc-asdf", "Requirement", "Linked id 'another' does not exist."),
+        ]
+        children_messages = links_messages + [
+            ("asdf", "Specification", "Statement can only have statements as children"),
+            (
+                "req-format",
+                "Specification",
+                "Statement can only have statements as children",
+            ),
+            (
+                "bladbvda",
+                "Definition",
+                "Definitions can only have definitions or expanders as children",
+            ),
+            ("", "TestList", "TestList can only have tests as children"),
+            ("mytest", "Test", "Test must have attribute verify_id"),
+        ]
+        for design_str, expected_messages in [
+            (TEST_LINKS, links_messages),
+            (TEST_CHILDREN, children_messages),
+        ]:
+            design = yu.load_object(Entry, design_str)
+            for messages in [
+                ru.check_all_rules(design),
+                ru.check_all_rules(design, op.DesignIndex(design)),
+            ]:
+                self.assertListEqual(
+                    [
+                        (message.related_id, message.type_str, message.text)
+                        for message in messages
+                    ],
+                    expected_messages,
+                )
+
+    def test_check_all_rules(self) -> None:
+        """Test that the rule engine gives the same messages as each rule separately"""
+        all_checks = [
+            ru.check_entry_attributes_non_null,
+            ru.check_definition_id_mandatory,
+            ru.check_statement_id_mandatory,
+            ru.check_id_unique,
+            ru.check_id_valid,
+            ru.check_id_spec,
+            ru.check_id_req,
+            ru.check_links,
+            ru.check_child_statements,
+            ru.check_child_definition,
+            ru.check_child_test_list,
+            ru.check_test_verify_id_mandatory,
+        ]
+        for design_str in [
+            TEST_ID_NON_NULL,
+            TEST_ID_MANDATORY,
+            TEST_ID_UNIQUE,
+            TEST_ID_VALID,
+            TEST_ID_PREF,
+            TEST_LINKS,
+            TEST_CHILDREN,
+        ]:
+            design = yu.load_object(Entry, design_str)
+            expected_messages = [
+                message for check in all_checks for message in check(design)
+            ]
+            self.assertListEqual(ru.check_all_rules(design), expected_messages)
+            self.assertListEqual(
+                ru.check_all_rules(design, op.DesignIndex(design)), expected_messages
+            )
@@ -0,0 +1,436 @@
+"""Unit test for test execution"""
+
+import gzip
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from typing import cast, Tuple
+
+import entries as en
+import engine_wizard as ew
+import operations as op
+import testing as te
+import yaml_util as yu
+
+
+class SleepingTestEngine(te.TestEngine):
+    """Engine whose tests wait a bit, recording how many run at the same time"""
+
+    def __init__(self) -> None:
+        super().__init__("engine", "")
+        self.lock = threading.Lock()
+        self.nb_running = 0
+        self.max_running = 0
+
+    def run_test(
+        self, test: en.Test, design_path: Path
+    ) -> Tuple[te.TestResult, str, str]:
+        with self.lock:
+            self.nb_running += 1
+            self.max_running = max(self.max_running, self.nb_running)
+        # the last tests finish first
+        time.sleep(0.01 * (10 - int(test.id.split("-")[1])))
+        with self.lock:
+            self.nb_running -= 1
+        return te.TestResult.SUCCESS, test.id, ""
+
+
+class RecordingTestEngine(te.TestEngine):
+    """Engine that records the tests it runs, the test "test-2" fails by default"""
+
+    def __init__(self) -> None:
+        super().__init__("engine", "")
+        self.test_ids: list[str] = []
+        self.failing = {"test-2"}
+        self.stdout = ""
+
+    def run_test(
+        self, test: en.Test, design_path: Path
+    ) -> Tuple[te.TestResult, str, str]:
+        self.test_ids.append(test.id)
+        if test.id in self.failing:
+            return te.TestResult.FAILED, self.stdout, "error"
+        return te.TestResult.SUCCESS, self.stdout, ""
+
+
+class RecordingListener(te.ExecutionListener):
+    """Listener that records the executions"""
+
+    def __init__(self) -> None:
+        self.test_ids: dict[str, list[str]] = {}
+        self.finished: list[tuple[str, int]] = []
+
+    def start_test_list(self, test_list_execution: te.TestListExecution) -> None:
+        self.test_ids[test_list_execution.test_list_id] = []
+
+    def add_execution(
+        self, test_list_execution: te.TestListExecution, execution: te.TestExecution
+    ) -> None:
+        self.test_ids[test_list_execution.test_list_id].append(execution.test_id)
+
+    def finish_test_list(self, test_list_execution: te.TestListExecution) -> None:
+        self.finished.append(
+            (test_list_execution.test_list_id, len(test_list_execution.children))
+        )
+
+
+def create_tests(nb_tests: int) -> list[en.Test]:
+    """Create a list of tests"""
+    return [
+        en.Test(f"test-{i}", "", en.TestType.AUTOMATIC, "spec-1")
+        for i in range(nb_tests)
+    ]
+
+
+class TestTesting(unittest.TestCase):
+    """Test"""
+
+    def test_run_tests_in_parallel(self) -> None:
+        """Test"""
+        engine = SleepingTestEngine()
+        test_list = en.TestList("test-list", "", list(create_tests(6)), engine)
+        executions = engine.run_test_list(test_list, Path("design.yaml"), 3)
+        self.assertEqual(
+            [execution.test_id for execution in executions],
+            [f"test-{i}" for i in range(6)],
+        )
+        self.assertEqual(
+            [execution.stdout for execution in executions],
+            [f"test-{i}" for i in range(6)],
+        )
+        self.assertEqual(engine.max_running, 3)
+
+    def test_run_all_test_lists(self) -> None:
+        """Test"""
+        engine = SleepingTestEngine()
+        test_list = en.TestList("test-list", "", list(create_tests(4)), engine)
+        design = en.Design("design", "", [test_list])
+        design.file_path = "design.yaml"
+
+        te.run_all_test_lists(design, 2)
+        self.assertEqual(engine.max_running, 2)
+
+        # the value of the test list has priority
+        engine.max_running = 0
+        test_list.max_workers = 4
+        executions = te.run_all_test_lists(design, 2)
+        self.assertEqual(engine.max_running, 4)
+        self.assertEqual(len(executions[0].children), 4)
+
+    def test_run_test_lists_concurrently(self) -> None:
+        """Test"""
+        engine = SleepingTestEngine()
+        test_lists = [
+            en.TestList(f"test-list-{i}", "", list(create_tests(4)), engine)
+            for i in range(2)
+        ]
+        for test_list in test_lists:
+            test_list.max_workers = 3
+        design = en.Design("design", "", list(test_lists))
+        design.file_path = "design.yaml"
+        listener = RecordingListener()
+
+        # the budget is shared by the test lists
+        executions = te.run_all_test_lists(design, 1, None, 4, listener)
+        self.assertEqual(engine.max_running, 4)
+        self.assertEqual(
+            [execution.test_list_id for execution in executions],
+            ["test-list-0", "test-list-1"],
+        )
+        self.assertEqual(
+            sorted(listener.finished), [("test-list-0", 4), ("test-list-1", 4)]
+        )
+
+        # the test lists of the same group do not overlap
+        engine.max_running = 0
+        for test_list in test_lists:
+            test_list.exclusive_group = "resource"
+        te.run_all_test_lists(design, 1, None, 6)
+        self.assertEqual(engine.max_running, 3)
+
+    def test_engine_without_parallel_support(self) -> None:
+        """Test"""
+        engine = ew.TestEngineWizard("wizard", "")
+        self.assertFalse(engine.supports_parallel)
+        executions = engine.run_tests(create_tests(3), Path("design.yaml"), 3)
+        self.assertEqual(
+            [execution.result for execution in executions],
+            [te.TestResult.SKIPPED.value] * 3,
+        )
+
+    def test_slowest_executions(self) -> None:
+        """Test"""
+        engine = SleepingTestEngine()
+        test_list = en.TestList("test-list", "", list(create_tests(4)), engine)
+        design = en.Design("design", "", [test_list])
+        design.file_path = "design.yaml"
+        executions = te.run_all_test_lists(design, 4)
+        self.assertEqual(
+            [
+                execution.test_id
+                for execution in te.get_slowest_executions(executions, 2)
+            ],
+            ["test-0", "test-1"],
+        )
+
+    def test_reuse_unchanged_tests(self) -> None:
+        """Test"""
+        engine = RecordingTestEngine()
+        statement = en.Statement("spec-1", "The text", [])
+        test_list = en.TestList("test-list", "", list(create_tests(4)), engine)
+        design = en.Design("design", "", [statement, test_list])
+        design.file_path = "design.yaml"
+
+        def run_again() -> list[te.TestExecution]:
+            previous_executions = {
+                execution.test_list_id: {
+                    test_execution.test_id: test_execution
+                    for test_execution in execution.children
+                    if isinstance(test_execution, te.TestExecution)
+                }
+                for execution in executions
+            }
+            engine.test_ids = []
+            return cast(
+                list[te.TestExecution],
+                te.run_all_test_lists(design, 1, previous_executions)[0].children,
+            )
+
+        executions = te.run_all_test_lists(design)
+        self.assertEqual(engine.test_ids, [f"test-{i}" for i in range(4)])
+
+        # only the failed test runs again
+        test_executions = run_again()
+        self.assertEqual(engine.test_ids, ["test-2"])
+        self.assertEqual(
+            [execution.test_id for execution in test_executions],
+            [f"test-{i}" for i in range(4)],
+        )
+        self.assertEqual(
+            [execution.reused for execution in test_executions],
+            [True, True, False, True],
+        )
+
+        # a modified test or verified statement runs again
+        cast(en.Test, test_list.children[0]).text = "modified"
+        statement.text = "The new text"
+        run_again()
+        self.assertEqual(engine.test_ids, [f"test-{i}" for i in range(4)])
+
+    def test_read_release_executions(self) -> None:
+        """Test"""
+        engine = RecordingTestEngine()
+        test_list = en.TestList("test-list", "", list(create_tests(2)), engine)
+        design = en.Design("design", "", [test_list])
+        design.file_path = "design.yaml"
+        executions = te.run_all_test_lists(design)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            yu.write_entry(Path(tmp_dir) / "test-list.yaml", executions[0])
+            previous_executions = te.read_release_executions(Path(tmp_dir))
+        self.assertEqual(list(previous_executions), ["test-list"])
+        self.assertEqual(
+            previous_executions["test-list"]["test-1"].input_hash,
+            cast(te.TestExecution, executions[0].children[1]).input_hash,
+        )
+
+    def test_rerun_failed_tests(self) -> None:
+        """Test"""
+        engine = RecordingTestEngine()
+        test_list = en.TestList("test-list", "", list(create_tests(4)), engine)
+        design = en.Design("design", "", [test_list])
+        design.file_path = "design.yaml"
+        index = op.DesignIndex(design)
+        test_list_execution = te.run_all_test_lists(design)[0]
+        first_executions = list(test_list_execution.children)
+
+        engine.test_ids = []
+        self.assertEqual(te.rerun_failed_tests(test_list_execution, index), 1)
+        self.assertEqual(engine.test_ids, ["test-2"])
+        self.assertEqual(
+            [
+                execution is first_execution
+                for execution, first_execution in zip(
+                    test_list_execution.children, first_executions
+                )
+            ],
+            [True, True, False, True],
+        )
+        self.assertEqual(
+            cast(te.TestExecution, test_list_execution.children[2]).test_id, "test-2"
+        )
+        self.assertEqual(test_list_execution.result, "failed")
+
+        # nothing to run again once the tests pass
+        engine.failing = set()
+        self.assertEqual(te.rerun_failed_tests(test_list_execution, index), 1)
+        self.assertEqual(test_list_execution.result, "success")
+        self.assertEqual(te.rerun_failed_tests(test_list_execution, index), 0)
+
+    def test_select_shard(self) -> None:
+        """Test"""
+        tests = create_tests(7)
+
+        # without durations, the tests are dealt one after the other
+        shards = [te.select_shard(tests, (i, 3), {}) for i in range(1, 4)]
+        self.assertEqual(
+            [[test.id for test in shard] for shard in shards],
+            [
+                ["test-0", "test-3", "test-6"],
+                ["test-1", "test-4"],
+                ["test-2", "test-5"],
+            ],
+        )
+
+        # with durations (the mean for test-6), the longest tests go first to the
+        # least loaded shard
+        durations = {
+            f"test-{i}": float(duration)
+            for i, duration in enumerate([1, 5, 3, 2, 3, 4])
+        }
+        shards = [te.select_shard(tests, (i, 2), durations) for i in range(1, 3)]
+        self.assertEqual(
+            [[test.id for test in shard] for shard in shards],
+            [["test-0", "test-1", "test-3", "test-4"], ["test-2", "test-5", "test-6"]],
+        )
+        self.assertEqual(
+            sorted(test.id for shard in shards for test in shard),
+            sorted(test.id for test in tests),
+        )
+
+    def test_merge_shards(self) -> None:
+        """Test"""
+        engine = RecordingTestEngine()
+        test_list = en.TestList("test-list", "", list(create_tests(5)), engine)
+        design = en.Design("design", "", [test_list])
+        design.file_path = "design.yaml"
+
+        shard_executions = [
+            te.run_all_test_lists(design, shard=(i, 2)) for i in range(2, 0, -1)
+        ]
+        self.assertEqual(shard_executions[0][0].shard, "2/2")
+        self.assertEqual(len(shard_executions[0][0].children), 2)
+        executions = te.merge_test_list_executions(design, shard_executions)
+        self.assertEqual(len(executions), 1)
+        self.assertEqual(executions[0].shard, "")
+        self.assertEqual(
+            [
+                cast(te.TestExecution, execution).test_id
+                for execution in executions[0].children
+            ],
+            [f"test-{i}" for i in range(5)],
+        )
+        # "test-2" failed in one of the shards, as in a single run
+        self.assertEqual(executions[0].result, te.TestResult.FAILED.value)
+        self.assertEqual(te.run_all_test_lists(design)[0].result, executions[0].result)
+
+        with self.assertRaises(Exception):
+            te.merge_test_list_executions(design, [executions[0:1], executions[0:1]])
+
+        engine.failing = set()
+        shard_executions = [
+            te.run_all_test_lists(design, shard=(i, 2)) for i in range(1, 3)
+        ]
+        executions = te.merge_test_list_executions(design, shard_executions)
+        self.assertEqual(executions[0].result, te.TestResult.SUCCESS.value)
+        self.assertEqual(te.run_all_test_lists(design)[0].result, executions[0].result)
+
+    def test_iter_tests(self) -> None:
+        """Test"""
+        engine = SleepingTestEngine()
+        executions = engine.iter_tests(create_tests(8), Path("design.yaml"), 2)
+        # the first execution is available before the other tests are done
+        self.assertEqual(next(executions).test_id, "test-0")
+        self.assertEqual(
+            [execution.test_id for execution in executions],
+            [f"test-{i}" for i in range(1, 8)],
+        )
+        self.assertEqual(engine.max_running, 2)
+
+    def test_release_writer(self) -> None:
+        """Test"""
+        engine = RecordingTestEngine()
+        test_lists = [
+            en.TestList(f"test-list-{i}", "", list(create_tests(4)), engine)
+            for i in range(2)
+        ]
+        design = en.Design("design", "", list(test_lists))
+        design.file_path = "design.yaml"
+        progress: list[list[te.TestListProgress]] = []
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            writer = te.ReleaseWriter(
+                Path(tmp_dir),
+                lambda writer: progress.append(writer.get_progress()),
+                progress_interval=0.0,
+                slowest_count=3,
+            )
+            executions = te.run_all_test_lists(design, listener=writer)
+            # the executions are in the files only
+            self.assertEqual(
+                [len(execution.children) for execution in executions], [0, 0]
+            )
+            test_list_executions = te.read_test_list_executions(Path(tmp_dir))
+
+        self.assertEqual(
+            [execution.test_list_id for execution in test_list_executions],
+            ["test-list-0", "test-list-1"],
+        )
+        for test_list_execution in test_list_executions:
+            self.assertEqual(
+                [
+                    (execution.test_id, execution.result)
+                    for execution in op.iter_entries(
+                        test_list_execution, te.TestExecution
+                    )
+                ],
+                [(f"test-{i}", "failed" if i == 2 else "success") for i in range(4)],
+            )
+            # as in the executions kept in memory
+            self.assertEqual(test_list_execution.result, "failed")
+        self.assertEqual(len(progress), 8)
+        self.assertEqual(
+            progress[-1],
+            [
+                te.TestListProgress("test-list-0", True, {"success": 3, "failed": 1}),
+                te.TestListProgress("test-list-1", False, {"success": 3, "failed": 1}),
+            ],
+        )
+        self.assertEqual(len(writer.get_slowest_executions()), 3)
+
+    def test_output_excerpt(self) -> None:
+        """Test"""
+        engine = RecordingTestEngine()
+        engine.stdout = "output\n" * 1000
+        engine.output_excerpt = 20
+        test_list = en.TestList("test-list", "", list(create_tests(2)), engine)
+        design = en.Design("design", "", [test_list])
+        design.file_path = "design.yaml"
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_directory = Path(tmp_dir) / "outputs"
+            executions = cast(
+                list[te.TestExecution],
+                te.run_all_test_lists(design, output_directory=output_directory)[
+                    0
+                ].children,
+            )
+            self.assertEqual(
+                [execution.stdout_file for execution in executions],
+                ["outputs/test-0.stdout.gz", "outputs/test-1.stdout.gz"],
+            )
+            self.assertEqual(executions[0].stderr_file, "")
+            self.assertLess(len(executions[0].stdout), 100)
+            with gzip.open(Path(tmp_dir) / executions[0].stdout_file, "rt") as fin:
+                self.assertEqual(fin.read(), engine.stdout)
+
+        # without output directory, the outputs are kept
+        executions = cast(
+            list[te.TestExecution], te.run_all_test_lists(design)[0].children
+        )
+        self.assertEqual(executions[0].stdout, engine.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,11 @@
 """Unit test for YAML serialization"""
 
+import copy
+import os
+import tempfile
 import unittest
 from pathlib import Path
+from typing import cast
 
 import yaml
 import entries as en
@@ -249,3 +253,60 @@ children:
 """,
             en.TestList,
         )
+
+    @unittest.skipIf(not yaml.__with_libyaml__, "libyaml is not available")
+    def test_libyaml_backend(self) -> None:
+        """Test that libyaml gives the same results as the pure Python implementation"""
+        mu.import_source(Path("../specs/setup.py"))
+        design = yu.read_object(en.Design, Path("../specs/requisite.yaml"))
+        design.expand(design, None)
+
+        pure_str = yu.dump_yaml(design, dumper=yu.PureDumper)
+        self.assertEqual(yu.dump_yaml(design, dumper=yu.EntryDumper), pure_str)
+
+        for loader in [yu.PureLoader, yu.EntryLoader]:
+            loaded_design = yu.load_yaml(pure_str, loader)
+            self.assertEqual(type(loaded_design), en.Design)
+            self.assertEqual(yu.dump_yaml(loaded_design), pure_str)
+
+    def test_write_entry(self) -> None:
+        """Test that writing skips empty fields without modifying the entries"""
+        mu.import_source(Path("../specs/setup.py"))
+        design = yu.read_object(en.Design, Path("../specs/requisite.yaml"))
+        design.expand(design, None)
+        design.children.append(
+            en.Statement("stat-multiline", "Some text\\n  on 'two' lines: 1\\n", [])
+        )
+        statement = design.children[0]
+        self.assertEqual(statement.get_id(), "")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for dumper in [yu.PureDumper, yu.EntryDumper]:
+                path = Path(tmp_dir) / "output.yaml"
+                yu.write_entry(path, design, dumper)
+                with open(path, encoding="utf-8") as fin:
+                    output = fin.read()
+                self.assertTrue(hasattr(statement, "text"))
+
+                simplified_design = copy.deepcopy(design)
+                simplified_design.simplify()
+                self.assertFalse(hasattr(simplified_design.children[-2], "text"))
+                self.assertEqual(output, yu.dump_entry(simplified_design))
+
+    def test_write_entry_atomically(self) -> None:
+        """Test"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "output.yaml"
+            path.write_text("previous content\n", encoding="utf-8")
+            yu.write_entry_atomically(path, en.Statement("id2", "Some text", []))
+            self.assertEqual(
+                path.read_text(encoding="utf-8"),
+                "!Statement\nid: id2\ntext: Some text\n",
+            )
+            self.assertEqual(os.listdir(tmp_dir), [path.name])
+
+            # a failed write keeps the previous file
+            with self.assertRaises(Exception):
+                yu.write_entry_atomically(path, cast(en.Entry, object()))
+            self.assertIn("id2", path.read_text(encoding="utf-8"))
+            self.assertEqual(os.listdir(tmp_dir), [path.name])